@@ -2,7 +2,12 @@ import dash
 import dash_bootstrap_components as dbc
 from flask_cors import CORS
 
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+import metrics
+
+# compress gzips responses through Flask-Compress, callback JSON (tables, figures) shrinks several times over
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True, compress=True)
 app.title = '@ethana1234 BB App'
 CORS(app.server, resources={r'/*': {'origins': '*'}})
 server = app.server
+# Times every callback registered from here on and serves /metrics (metrics.py)
+metrics.instrument(app)
@@ -0,0 +1,280 @@
+import os,sys,json,time,random,argparse,platform,sqlite3,statistics,subprocess,tempfile,threading
+from datetime import datetime
+
+# Latency benchmark for the Dash callbacks, run from the main repo directory with
+#   python -m benchmarks.bench_callbacks [--db synthetic.db] [--seasons 9] [--mode direct|http|both] [--out run.json]
+# Runs against a db_scripts/synthetic_db.py database (generated first if --db is missing or doesn't exist yet).
+# direct: calls the callback functions in this process, timing the call plus the JSON encoding Dash does.
+# http: concurrent simulated users post the same callbacks to /_dash-update-component of --url, or of a dev server
+# or gunicorn started here with --serve.
+# Each session picks a random tab (tables, scatter, time series, batting or pitching) and selection and runs that tab's
+# callbacks in order, later ones getting the key the first returned. Reports p50/p95/p99 latency, response bytes and
+# calls per second per callback; --out saves the run as JSON and --baseline compares against an earlier one.
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Stands in for the stored result key in a step's inputs until the first callback of the session returns it
+KEY = object()
+
+def table_session(p, rng, team_ids, years):
+    module = 'batting_table' if p == 'b' else 'pitching_table'
+    table_type = rng.choice(['pbs', 'tbs', 'tbg'] if p == 'b' else ['pps', 'tps', 'tpg'])
+    sort_by = [{'column_id': 'R' if p == 'b' else 'ERA', 'direction': rng.choice(['asc', 'desc'])}]
+    filter_query = rng.choice(['', '', '{season} = %d' % years[0]])
+    return [
+        dict(module=module, function='update_dataframe', key=(f'{p}-table-save', 'children'),
+            outputs=[(f'{p}-table-save', 'children'), (f'{p}-table-placeholder', 'children'), (f'{p}-table-result', 'style'),
+                (f'{p}-table', 'columns'), (f'{p}-table', 'page_current'), (f'{p}-table', 'sort_by'), (f'{p}-table', 'filter_query')],
+            inputs=[(f'{p}-table-type', 'value', table_type), (f'{p}-table-team-name', 'value', team_ids), (f'{p}-table-season-year', 'value', years)]),
+        dict(module=module, function='update_table_page',
+            outputs=[(f'{p}-table', 'data'), (f'{p}-table', 'page_count')],
+            inputs=[(f'{p}-table-save', 'children', KEY), (f'{p}-table', 'page_current', rng.randint(0, 2)), (f'{p}-table', 'page_size', 50),
+                (f'{p}-table', 'sort_by', sort_by), (f'{p}-table', 'filter_query', filter_query)],
+            state=[(f'{p}-table-type', 'value', table_type), (f'{p}-table-team-name', 'value', team_ids), (f'{p}-table-season-year', 'value', years)]),
+    ]
+
+def scatter_session(p, rng, team_ids, years):
+    module = 'batting_scatter' if p == 'b' else 'pitching_scatter'
+    qualified = rng.choice([[], [], [1]])
+    return [
+        dict(module=module, function='update_dataframe', key=(f'{p}-scatter-save', 'children'),
+            outputs=[(f'{p}-scatter-save', 'children')],
+            inputs=[(f'{p}-scatter-team-name', 'value', team_ids), (f'{p}-scatter-season-year', 'value', years)]),
+        dict(module=module, function='update_scatter_data',
+            outputs=[(f'{p}-scatter-result', 'children'), (f'{p}-scatter-x', 'options'), (f'{p}-scatter-y', 'options'), (f'{p}-scatter-label', 'children')],
+            inputs=[(f'{p}-scatter-save', 'children', KEY), (f'{p}-scatter-x', 'value', None), (f'{p}-scatter-y', 'value', None),
+                (f'{p}-scatter-season-year', 'value', years), (f'{p}-scatter-qualified', 'value', qualified), (f'{p}-scatter-trend', 'value', 'linear')],
+            state=[(f'{p}-scatter-team-name', 'value', team_ids)]),
+        dict(module=module, function='update_correlations',
+            outputs=[(f'{p}-corr-graph', 'figure'), (f'{p}-corr-label', 'children')],
+            inputs=[(f'{p}-scatter-save', 'children', KEY), (f'{p}-corr-method', 'value', 'pearson'),
+                (f'{p}-scatter-season-year', 'value', years), (f'{p}-scatter-qualified', 'value', qualified)],
+            state=[(f'{p}-scatter-team-name', 'value', team_ids)]),
+    ]
+
+def ts_session(p, rng, team_ids, years):
+    module = 'batting_time_series' if p == 'b' else 'pitching_time_series'
+    year = years[0]
+    return [
+        dict(module=module, function='update_dataframe', key=(f'{p}-ts-save', 'children'),
+            outputs=[(f'{p}-ts-save', 'children')],
+            inputs=[(f'{p}-ts-team-name', 'value', team_ids), (f'{p}-ts-season', 'value', year)]),
+        dict(module=module, function='update_ts_data',
+            outputs=[(f'{p}-ts-result', 'children'), (f'{p}-ts-y', 'options'), (f'{p}-ts-label', 'children')],
+            inputs=[(f'{p}-ts-save', 'children', KEY), (f'{p}-ts-y', 'value', None), (f'{p}-ts-team-name', 'value', team_ids),
+                (f'{p}-ts-mode', 'value', rng.choice(['game', 'cumulative', 'rolling'])), (f'{p}-ts-window', 'value', 10)],
+            state=[(f'{p}-ts-season', 'value', year)]),
+    ]
+
+sessions = [table_session, scatter_session, ts_session]
+
+def random_session(rng, team_pool, season_pool):
+    team_ids = rng.sample(team_pool, min(rng.randint(1, 3), len(team_pool)))
+    years = rng.sample(season_pool, min(rng.randint(1, 2), len(season_pool)))
+    return rng.choice(sessions)(rng.choice('bp'), rng, team_ids, years)
+
+def step_name(step):
+    return f'{step["module"]}.{step["function"]}'
+
+def fill_key(entries, key):
+    return [(id, prop, key if value is KEY else value) for id, prop, value in entries]
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, size):
+        with self.lock:
+            self.samples.setdefault(name, []).append((seconds, size))
+
+    def error(self, name, message):
+        with self.lock:
+            self.errors.setdefault(name, []).append(message)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summary(recorder, elapsed=None):
+    # elapsed: wall time of a concurrent run, calls/s per callback is then over the whole run instead of its own time
+    results = {}
+    for name, samples in sorted(recorder.samples.items()):
+        latencies = [seconds for seconds, _ in samples]
+        sizes = [size for _, size in samples]
+        results[name] = {
+            'n': len(samples),
+            'errors': len(recorder.errors.get(name, [])),
+            'p50_ms': 1000 * statistics.median(latencies),
+            'p95_ms': 1000 * percentile(latencies, .95),
+            'p99_ms': 1000 * percentile(latencies, .99),
+            'mean_ms': 1000 * statistics.mean(latencies),
+            'mean_bytes': statistics.mean(sizes),
+            'per_s': len(samples) / (elapsed if elapsed else sum(latencies)),
+        }
+    for name, messages in recorder.errors.items():
+        if name not in results:
+            results[name] = {'n': 0, 'errors': len(messages)}
+    return results
+
+def run_direct(sessions_count, seed, team_pool, season_pool):
+    # App modules are imported here, after BB_DB_PATH is set
+    import importlib
+    import plotly.utils
+    import index
+    rng = random.Random(seed)
+    recorder = Recorder()
+    for _ in range(sessions_count):
+        key = None
+        for step in random_session(rng, team_pool, season_pool):
+            name = step_name(step)
+            function = getattr(importlib.import_module(f'pages.tabs.{step["module"]}'), step['function']).__wrapped__
+            values = [value for _, _, value in fill_key(step['inputs'], key) + fill_key(step.get('state', []), key)]
+            start = time.perf_counter()
+            try:
+                output = function(*values)
+                body = json.dumps(output, cls=plotly.utils.PlotlyJSONEncoder)
+            except Exception as e:
+                recorder.error(name, repr(e))
+                break
+            recorder.add(name, time.perf_counter() - start, len(body))
+            if 'key' in step:
+                key = output[step['outputs'].index(step['key'])] if len(step['outputs']) > 1 else output
+    return summary(recorder)
+
+def http_user(url, deadline, recorder, seed, team_pool, season_pool):
+    import requests
+    from benchmarks.load_test import callback_payload
+    rng = random.Random(seed)
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip'
+    while time.perf_counter() < deadline:
+        key = None
+        for step in random_session(rng, team_pool, season_pool):
+            name = step_name(step)
+            payload = callback_payload(step['outputs'], fill_key(step['inputs'], key), fill_key(step.get('state', []), key))
+            start = time.perf_counter()
+            try:
+                r = session.post(f'{url}/_dash-update-component', json=payload, timeout=120)
+                seconds = time.perf_counter() - start
+                r.raise_for_status()
+            except requests.RequestException as e:
+                recorder.error(name, repr(e))
+                break
+            # Bytes on the wire (compressed when the server gzips)
+            recorder.add(name, seconds, int(r.headers.get('Content-Length', len(r.content))))
+            if 'key' in step:
+                response = r.json()['response']
+                id, prop = step['key']
+                key = response['props'][prop] if 'props' in response else response[id][prop]
+
+def run_http(url, users, duration, seed, team_pool, season_pool):
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=http_user, args=(url, deadline, recorder, seed + i, team_pool, season_pool)) for i in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summary(recorder, time.perf_counter() - start)
+
+def db_info(path):
+    conn = sqlite3.connect(path)
+    seasons = [row[0] for row in conn.execute('SELECT DISTINCT season FROM TeamSeason ORDER BY season')]
+    teams = [row[0] for row in conn.execute('SELECT id FROM Teams ORDER BY id')]
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        for table in ['TeamBattingGame', 'PlayerBattingSeason', 'PlayerPitchingSeason']}
+    conn.close()
+    return {'path': path, 'bytes': os.path.getsize(path), 'seasons': seasons, 'teams': len(teams), 'rows': counts}, teams, seasons
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def print_results(label, results, baseline=None):
+    print(label)
+    print(f'  {"callback":<38}{"n":>6}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"KB":>9}{"/s":>8}{"err":>5}{"p50 vs base":>13}')
+    for name, stats in results.items():
+        if not stats['n']:
+            print(f'  {name:<38}{0:>6}{"":>52}{stats["errors"]:>5}')
+            continue
+        versus = ''
+        if baseline and baseline.get(name, {}).get('n'):
+            versus = f'{stats["p50_ms"] / baseline[name]["p50_ms"]:.2f}x'
+        print(f'  {name:<38}{stats["n"]:>6}{stats["p50_ms"]:>9.1f}{stats["p95_ms"]:>9.1f}{stats["p99_ms"]:>9.1f}'
+            f'{stats["mean_bytes"] / 1024:>9.1f}{stats["per_s"]:>8.1f}{stats["errors"]:>5}{versus:>13}')
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Dash callbacks against a synthetic database')
+    parser.add_argument('--db', help='synthetic database to use, generated if it does not exist (default: a temporary one)')
+    parser.add_argument('--teams', type=int, default=30, help='size of a generated database, see db_scripts/synthetic_db.py')
+    parser.add_argument('--seasons', type=int, default=9)
+    parser.add_argument('--games', type=int, default=162)
+    parser.add_argument('--batters', type=int, default=15)
+    parser.add_argument('--pitchers', type=int, default=12)
+    parser.add_argument('--mode', choices=['direct', 'http', 'both'], default='direct')
+    parser.add_argument('--sessions', type=int, default=100, help='tab sessions run in direct mode')
+    parser.add_argument('--url', help='server for http mode, otherwise one is started with --serve')
+    parser.add_argument('--serve', choices=['dev', 'gunicorn'], default='gunicorn')
+    parser.add_argument('--port', type=int, default=8053)
+    parser.add_argument('--users', type=int, default=8, help='concurrent users in http mode')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of http load')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the results here as JSON')
+    parser.add_argument('--baseline', help='JSON from an earlier run to compare p50 latencies with')
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix='bb_bench_'), 'synthetic.db')
+    if not os.path.exists(path):
+        from db_scripts.synthetic_db import generate
+        generate(path, args.seasons, args.games, args.batters, args.pitchers, args.seed, args.teams)
+    path = os.path.abspath(path)
+    os.environ['BB_DB_PATH'] = path
+    info, team_pool, season_pool = db_info(path)
+    # The app's team list only has the 30 real teams, any others only add rows the queries have to get past
+    team_pool = [team for team in team_pool if team < 30]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    if args.mode in ['direct', 'both']:
+        results['direct'] = run_direct(args.sessions, args.seed, team_pool, season_pool)
+        print_results(f'direct calls, {args.sessions} sessions', results['direct'], baseline and baseline.get('direct'))
+    if args.mode in ['http', 'both']:
+        url = args.url
+        server = None
+        if url is None:
+            from benchmarks.load_test import start_server,wait_ready,stop_server
+            url = f'http://127.0.0.1:{args.port}'
+            if args.serve == 'dev':
+                server = start_server([sys.executable, 'index.py'], {'PORT': str(args.port), 'BB_DB_PATH': path, 'BB_DEBUG': '0'})
+            else:
+                server = start_server(['gunicorn', '-c', 'gunicorn.conf.py', 'index:server'], {'BB_BIND': f'127.0.0.1:{args.port}', 'BB_DB_PATH': path,
+                    'BB_RESULT_STORE_DIR': tempfile.mkdtemp(prefix='bb_bench_store_')})
+        try:
+            if server is not None:
+                wait_ready(url, server)
+            results['http'] = run_http(url, args.users, args.duration, args.seed, team_pool, season_pool)
+        finally:
+            if server is not None:
+                stop_server(server)
+        print_results(f'http, {args.users} users for {args.duration:.0f}s against {args.url or args.serve}', results['http'], baseline and baseline.get('http'))
+
+    if args.out:
+        run = {
+            'commit': git_commit(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'db': info,
+            'args': vars(args),
+            'results': results,
+        }
+        with open(args.out, 'w') as f:
+            json.dump(run, f, indent=2)
+        print(f'Saved results to {args.out}')
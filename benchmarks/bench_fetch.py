@@ -0,0 +1,116 @@
+import os,sys,time,sqlite3,argparse,tempfile,subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_site import StubSite,serve,fault_kinds
+from fetch_client import FetchClient,FetchError
+from teams import team_codes
+
+# The scraping client against the offline stub site (benchmarks/stub_site.py), run from the main repo directory with
+#   python -m benchmarks.bench_fetch [--db synthetic.db] [--teams 6] [--rpm 600] [--fault-rate 0.2] [--load]
+# Fetches every gamelog and season page of the first --teams teams for all seasons of the database with --workers threads
+# sharing one FetchClient, while the stub injects faults into --fault-rate of the requests. Checks that every page
+# arrives intact, and reports the retries, the rate the server actually saw against --rpm and the connections it took.
+# --load also runs data_insert.py --no-cache against the stub into a temporary database and compares what it loaded.
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def page_paths(teams, seasons):
+    paths = []
+    for team in teams:
+        for year in seasons:
+            paths += [f'/teams/tgl.cgi?team={team}&t={t}&year={year}' for t in 'bp']
+            paths += [f'/teams/{team}/{year}-{page}.shtml' for page in ['batting', 'pitching']]
+    return paths
+
+def fetch_pages(base_url, paths, client, workers):
+    def fetch(path):
+        try:
+            return path, client.fetch(base_url + path)
+        except FetchError as e:
+            return path, e
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return dict(pool.map(fetch, paths))
+
+def observed_rate(times):
+    # Requests per minute over the run and the shortest gap between two requests
+    if len(times) < 2:
+        return 0.0, 0.0
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    return 60 * (len(times) - 1) / (times[-1] - times[0]), min(gaps)
+
+def run_load(args, base_url, seasons):
+    # data_insert.py --no-cache in its own process, pointed at the stub and a temporary database
+    db_path = os.path.join(tempfile.mkdtemp(prefix='bb_load_'), 'baseball.db')
+    env = {**os.environ, 'BB_BASE_URL': base_url, 'BB_DB_PATH': db_path}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, 'data_insert.py', '--no-cache', '--rpm', str(args.rpm), '--workers', str(args.workers)],
+        cwd=directory, env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    # Just the summary lines, not one per page
+    print('\n'.join(line for line in result.stdout.splitlines() if line.strip() and '\t' not in line))
+    if result.returncode != 0:
+        print(result.stderr[-3000:])
+        return False
+    source, loaded = sqlite3.connect(args.db), sqlite3.connect(db_path)
+    ok = True
+    print(f'data_insert.py loaded in {seconds:.1f}s')
+    for table, where in [('TeamSeason', ''), ('TeamBattingGame', ''), ('TeamPitchingGame', ''), ('TeamBattingSeason', ''),
+            ('TeamPitchingSeason', ''), ('PlayerBattingSeason', ' AND AB > 0'), ('PlayerPitchingSeason', '')]:
+        query = f'SELECT COUNT(*) FROM {table} WHERE team_id < {len(team_codes)} AND season IN ({",".join(map(str, seasons))}){where}'
+        expected, got = source.execute(query).fetchone()[0], loaded.execute(query.replace(where, '')).fetchone()[0]
+        ok &= expected == got
+        print(f'  {table:<22}{got:>8} rows, {expected:>8} expected')
+    records = lambda conn: sorted(conn.execute(f'SELECT team_id, season, wins, losses FROM TeamSeason WHERE team_id < {len(team_codes)}'))
+    if records(source) != records(loaded):
+        print('  TeamSeason records differ')
+        ok = False
+    return ok
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Fetch the stub site through the scraping client with injected faults')
+    parser.add_argument('--db', help='synthetic database, generated if it does not exist (default: a temporary one)')
+    parser.add_argument('--teams', type=int, default=6, help='teams to fetch (the first n)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rpm', type=float, default=600, help='client requests per minute')
+    parser.add_argument('--fault-rate', type=float, default=0.2)
+    parser.add_argument('--faults', default=','.join(fault_kinds))
+    parser.add_argument('--timeout', type=float, default=2.0, help='client timeout, stalled responses are held back twice as long')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load', action='store_true', help='also run data_insert.py against the stub and check the database it builds')
+    args = parser.parse_args()
+
+    args.db = args.db or os.path.join(tempfile.mkdtemp(prefix='bb_bench_'), 'synthetic.db')
+    if not os.path.exists(args.db):
+        from db_scripts.synthetic_db import generate
+        generate(args.db)
+    site = StubSite(args.db, args.fault_rate, args.faults.split(','), retry_after=1, stall=2 * args.timeout, seed=args.seed)
+    seasons = [row['season'] for row in site.rows('SELECT DISTINCT season FROM TeamSeason ORDER BY season')]
+    server = serve(site)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    paths = page_paths(team_codes[:args.teams], seasons)
+    client = FetchClient(requests_per_minute=args.rpm, burst=1, connections=args.workers, timeout=args.timeout,
+        max_attempts=8, backoff=0.5, max_backoff=4, seed=args.seed)
+    start = time.perf_counter()
+    pages = fetch_pages(base_url, paths, client, args.workers)
+    seconds = time.perf_counter() - start
+    client.close()
+
+    failed = [path for path, content in pages.items() if isinstance(content, Exception)]
+    wrong = [path for path, content in pages.items() if not isinstance(content, Exception) and content != site.content(path)]
+    faults = {}
+    for _, _, outcome in site.requests:
+        faults[outcome] = faults.get(outcome, 0) + 1
+    rate, min_gap = observed_rate(sorted(t for t, _, _ in site.requests))
+    print(f'{len(paths)} pages in {seconds:.1f}s with {args.workers} workers, {len(failed)} failed, {len(wrong)} with wrong content')
+    print(f'  server saw {len(site.requests)} requests on {len(site.connections)} connections: ' + ', '.join(f'{outcome} {n}' for outcome, n in sorted(faults.items())))
+    print(f'  client: {client.requests} requests, {client.retries} retries, {client.throttled} throttled (429), {client.failures} failed')
+    print(f'  rate: {rate:.0f} requests/min (limit {args.rpm:.0f}), shortest gap {1000 * min_gap:.0f} ms (token every {60000 / args.rpm:.0f} ms)')
+    ok = not failed and not wrong
+    if args.load:
+        site.requests.clear()
+        site.connections.clear()
+        ok &= run_load(args, base_url, seasons)
+    server.shutdown()
+    if not ok:
+        sys.exit(1)
@@ -0,0 +1,148 @@
+import os,sys,time,hashlib,argparse,warnings
+from datetime import datetime
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import data_insert
+from page_cache import PageCache
+
+# Micro-benchmark for the gamelog transforms in data_insert (the DataFrame work after the html table is read), run from the main repo directory with
+#   python -m benchmarks.bench_gamelog_parse [--cache --teams PHI NYM --seasons 2019 2020] [--html page.html --table-type b]
+# Pages come from benchmarks/fixtures (a short season of stub_site.py gamelogs, the default), the page cache (--cache,
+# offline, so run data_insert.py once first) or saved html files. The legacy table reader is pd.read_html, which falls
+# back to html5lib (in requirements.txt) when lxml can't read a page.
+# The legacy functions below are the row-wise versions the loaders used before; the benchmark fails if the
+# vectorized parse produces different game ids or rows.
+
+fixture_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# (file, team, season, gamelog type) of the saved pages
+fixtures = [('PHI-2020-b.html', 'PHI', 2020, 'b'), ('PHI-2020-p.html', 'PHI', 2020, 'p')]
+
+def legacy_batting_game_data(data, team_code, year):
+    team_id = data_insert.team_id_dict[team_code]
+    data.rename(columns={'Unnamed: 3':'HomeAway', 'Thr':'OppStarterThr', 'Opp':'opp_id', 'Date': 'game_date'}, inplace=True)
+    data.drop(data[data.OBP == 'OBP'].index, inplace=True)
+    data.replace({'HomeAway': {'@':'A'}}, inplace=True)
+    data.HomeAway.fillna('H', inplace=True)
+    data[['Result', 'RunsAgainst']] = data.Rslt.str.split(',', expand=True)
+    data.RunsAgainst = data.RunsAgainst.str.split('-').str[1]
+    data.game_date = data.game_date.str.encode('ascii', 'ignore').str.decode('ascii').str.strip()
+    data.game_date = data.game_date.str.replace('susp', '')
+    data.game_date = data.game_date.str.split('(').str[0] + str(year)
+    data.game_date = data.game_date.str.replace(' ', '')
+    data.game_date = data.game_date.apply(lambda x: datetime.strptime(x, '%b%d%Y').strftime('%Y-%m-%d'))
+    data['season'] = year
+    game_ids = [data.game_date.iloc[i] + ((data.opp_id.iloc[i] + data.RunsAgainst.iloc[i] + team_code + data.R.iloc[i]) if data.HomeAway.iloc[i] == 'H' else (team_code + data.R.iloc[i] + data.opp_id.iloc[i] + data.RunsAgainst.iloc[i])) for i in range(len(data.index))]
+    game_ids = [int(hashlib.sha256(s.encode('utf-8')).hexdigest(), 16) % data_insert.sql_max_int for s in game_ids]
+    data['game_id'] = game_ids
+    data['team_id'] = team_id
+    data.opp_id = data.opp_id.apply(lambda x: data_insert.team_id_dict[x])
+    data.drop(columns=['Rslt', 'Rk', 'Gtm', '#', 'Opp. Starter (GmeSc)'], inplace=True)
+    data = data[['game_id', 'team_id', 'opp_id', 'game_date', 'season', 'HomeAway', 'OppStarterThr', 'Result', 'RunsAgainst', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'BB',
+                'IBB', 'SO', 'HBP', 'SH', 'SF', 'ROE', 'GDP', 'SB', 'CS', 'LOB', 'BA', 'OBP', 'SLG', 'OPS']]
+    data = data.copy()
+    data.loc[:, 'RunsAgainst':] = data.loc[:, 'RunsAgainst':].apply(pd.to_numeric)
+    data.set_index(['game_id','team_id'], inplace=True)
+    return data
+
+def legacy_pitching_game_data(data, team_code, year):
+    team_id = data_insert.team_id_dict[team_code]
+    data.rename(columns={'Unnamed: 3':'HomeAway', '#': 'PitchersUsed', 'Pit': 'Pitches', 'Opp': 'opp_id', 'Str': 'Strikes', 'Date': 'game_date'}, inplace=True)
+    data.drop(data[data.ERA == 'ERA'].index, inplace=True)
+    data.replace({'HomeAway': {'@':'A'}}, inplace=True)
+    data.HomeAway.fillna('H', inplace=True)
+    data[['Result', 'RunsFor']] = data.Rslt.str.split(',', expand=True)
+    data.RunsFor = data.RunsFor.str.split('-').str[0]
+    data.game_date = data.game_date.str.encode('ascii', 'ignore').str.decode('ascii').str.strip()
+    data.game_date = data.game_date.str.replace('susp', '')
+    data.game_date = data.game_date.str.split('(').str[0] + str(year)
+    data.game_date = data.game_date.str.replace(' ', '')
+    data.game_date = data.game_date.apply(lambda x: datetime.strptime(x, '%b%d%Y').strftime('%Y-%m-%d'))
+    data['season'] = year
+    game_ids = [data.game_date.iloc[i] + ((data.opp_id.iloc[i] + data.R.iloc[i] + team_code + data.RunsFor.iloc[i]) if data.HomeAway.iloc[i] == 'H' else (team_code + data.RunsFor.iloc[i] + data.opp_id.iloc[i] + data.R.iloc[i])) for i in range(len(data.index))]
+    game_ids = [int(hashlib.sha256(s.encode('utf-8')).hexdigest(), 16) % data_insert.sql_max_int for s in game_ids]
+    data['game_id'] = game_ids
+    data['team_id'] = team_id
+    data.opp_id = data.opp_id.apply(lambda x: data_insert.team_id_dict[x])
+    data.drop(columns=['Rslt', 'Rk', 'Gtm', 'Umpire', 'Pitchers Used (Rest-GameScore-Dec)'], inplace=True)
+    data = data[['game_id', 'team_id', 'opp_id', 'game_date', 'season', 'HomeAway', 'Result', 'RunsFor', 'H', 'R', 'ER', 'UER', 'BB', 'SO', 'HR', 'HBP', 'BF', 'Pitches', 'Strikes', 'IR',
+            'IS', 'SB', 'CS', 'AB', '2B', '3B', 'IBB', 'SH', 'SF', 'ROE', 'GDP', 'PitchersUsed', 'IP', 'ERA']]
+    data.loc[:, 'RunsFor':] = data.loc[:, 'RunsFor':].apply(pd.to_numeric)
+    data.set_index(['game_id','team_id'], inplace=True)
+    return data
+
+def legacy_read_table(table_id):
+    # The legacy transforms expect the pd.read_html table, text columns and repeated header rows included
+    def read_table(content):
+        soup = BeautifulSoup(content, 'lxml')
+        return pd.read_html(str(soup.find('table', attrs=dict(id=table_id))))[0]
+    return read_table
+
+# (legacy table reader, legacy transform, current table reader, current transform) per gamelog type
+parsers = {
+    'b': (legacy_read_table('team_batting_gamelogs'), legacy_batting_game_data, data_insert.read_batting_game_table, data_insert.transform_batting_game_data),
+    'p': (legacy_read_table('team_pitching_gamelogs'), legacy_pitching_game_data, data_insert.read_pitching_game_table, data_insert.transform_pitching_game_data),
+}
+
+def best_time(fn, repeat, table, *args):
+    # Both transforms modify their input, so each run gets a fresh copy (not timed)
+    best = float('inf')
+    for _ in range(repeat):
+        data = table.copy()
+        start = time.perf_counter()
+        result = fn(data, *args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_page(content, team_code, year, table_type, repeat):
+    # Only the transforms are timed, benchmarks.bench_html_parse covers reading the html table
+    legacy_read, legacy, current_read, current = parsers[table_type]
+    legacy_time, expected = best_time(legacy, repeat, legacy_read(content), team_code, year)
+    current_time, actual = best_time(current, repeat, current_read(content), team_code, year)
+
+    # Same ids (the primary key already in baseball.db) and the same rows
+    if list(expected.index) != list(actual.index):
+        raise AssertionError(f'{team_code} {year} {table_type}: game ids differ from the legacy scheme')
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+    return legacy_time, current_time, len(actual.index)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy and vectorized gamelog parsers')
+    parser.add_argument('--cache', action='store_true', help='use the --teams/--seasons pages from the page cache instead of the fixtures')
+    parser.add_argument('--teams', nargs='+', default=['PHI', 'NYY'])
+    parser.add_argument('--seasons', nargs='+', type=int, default=[2019])
+    parser.add_argument('--html', nargs='+', help='saved gamelog pages to use instead of the page cache')
+    parser.add_argument('--table-type', choices=['b', 'p'], default='b', help='gamelog type of the --html pages')
+    parser.add_argument('--team', default='PHI', help='team code of the --html pages')
+    parser.add_argument('--year', type=int, default=2019, help='season of the --html pages')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    pages = []
+    if args.html:
+        for path in args.html:
+            with open(path, 'rb') as f:
+                pages.append((f.read(), args.team, args.year, args.table_type))
+    elif not args.cache:
+        for name, team, year, table_type in fixtures:
+            with open(os.path.join(fixture_dir, name), 'rb') as f:
+                pages.append((f.read(), team, year, table_type))
+    else:
+        cache = PageCache(offline=True)
+        for team in args.teams:
+            for year in args.seasons:
+                for table_type in ['b', 'p']:
+                    pages.append((cache.fetch(data_insert.gamelog_url(team, year, table_type)), team, year, table_type))
+
+    # pandas warns about the legacy chained fillna/replace calls, they're kept as-is on purpose
+    warnings.simplefilter('ignore')
+    total_legacy = total_current = 0.0
+    for content, team, year, table_type in pages:
+        legacy_time, current_time, rows = bench_page(content, team, year, table_type, args.repeat)
+        total_legacy += legacy_time
+        total_current += current_time
+        print(f'{team} {year} {table_type}: {rows} games, legacy {1000 * legacy_time:.1f} ms, vectorized {1000 * current_time:.1f} ms ({legacy_time / current_time:.2f}x)')
+    print(f'Total: legacy {1000 * total_legacy:.1f} ms, vectorized {1000 * total_current:.1f} ms ({total_legacy / total_current:.2f}x), ids identical')
+
+if __name__=='__main__':
+    sys.exit(main())
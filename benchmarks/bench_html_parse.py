@@ -0,0 +1,85 @@
+import sys,time,argparse,tracemalloc,warnings
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import data_insert
+from html_tables import extract_table
+from page_cache import PageCache
+
+# Benchmark for reading the stat tables out of the Baseball Reference pages, run from the main repo directory with
+#   python -m benchmarks.bench_html_parse [--teams PHI NYM] [--seasons 2019 2020] [--html page.html --table-id team_batting]
+# Pages come from the page cache (offline, so run data_insert.py once first) or from saved html files.
+# Compares the old BeautifulSoup + pd.read_html(str(table)) path (plus the second findAll pass for player ids) with the
+# single pass lxml extractor: best time over --repeat runs and peak python memory (tracemalloc) of one run.
+
+# Table ids on each page, the season pages also carry player ids
+page_tables = {
+    ('tgl', 'b'): 'team_batting_gamelogs',
+    ('tgl', 'p'): 'team_pitching_gamelogs',
+    ('season', 'b'): 'team_batting',
+    ('season', 'p'): 'team_pitching',
+}
+
+def legacy_read(content, table_id):
+    soup = BeautifulSoup(content, 'lxml')
+    table = soup.find('table', attrs=dict(id=table_id))
+    data = pd.read_html(str(table))[0]
+    if table_id in ['team_batting', 'team_pitching']:
+        player_ids = {}
+        for row in table.findAll('td', attrs={'data-stat':'player'}):
+            if row.get('data-append-csv') is not None:
+                player_ids[row.get_text()] = row.get('data-append-csv')
+        data.insert(0, 'player_id', data.Name.map(player_ids))
+    return data
+
+def current_read(content, table_id):
+    return extract_table(content, table_id, include_footer=table_id in ['team_batting', 'team_pitching'])
+
+def measure(fn, repeat, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare BeautifulSoup + read_html with the lxml table extractor')
+    parser.add_argument('--teams', nargs='+', default=['PHI', 'NYY'])
+    parser.add_argument('--seasons', nargs='+', type=int, default=[2019])
+    parser.add_argument('--html', nargs='+', help='saved pages to use instead of the page cache')
+    parser.add_argument('--table-id', choices=list(page_tables.values()), default='team_batting_gamelogs', help='table to read from the --html pages')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pages = []
+    if args.html:
+        for path in args.html:
+            with open(path, 'rb') as f:
+                pages.append((path, f.read(), args.table_id))
+    else:
+        cache = PageCache(offline=True)
+        for team in args.teams:
+            for year in args.seasons:
+                for (page, table_type), table_id in page_tables.items():
+                    url = data_insert.gamelog_url(team, year, table_type) if page == 'tgl' else data_insert.season_url(team, year, table_type)
+                    pages.append((f'{team} {year} {table_id}', cache.fetch(url), table_id))
+
+    warnings.simplefilter('ignore')
+    total_legacy = total_current = 0.0
+    for name, content, table_id in pages:
+        legacy_time, legacy_peak, legacy_data = measure(legacy_read, args.repeat, content, table_id)
+        current_time, current_peak, current_data = measure(current_read, args.repeat, content, table_id)
+        total_legacy += legacy_time
+        total_current += current_time
+        print(f'{name}: {len(legacy_data.index)} -> {len(current_data.index)} rows (header rows dropped), '
+              f'read_html {1000 * legacy_time:.1f} ms / {legacy_peak / 2**20:.1f} MB peak, '
+              f'lxml {1000 * current_time:.1f} ms / {current_peak / 2**20:.1f} MB peak ({legacy_time / current_time:.2f}x)')
+    print(f'Total: read_html {1000 * total_legacy:.1f} ms, lxml {1000 * total_current:.1f} ms ({total_legacy / total_current:.2f}x)')
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import io,os,sys,time,sqlite3,argparse,tempfile,contextlib
+import pandas as pd
+
+import data_insert
+from db_scripts import db_write
+from db_scripts.db_write import RowStage
+from load_pipeline import run_pipeline
+
+# Write side of a full rebuild without scraping, run from the main repo directory with
+#   python -m benchmarks.bench_load_writes [--db synthetic.db] [--seasons 2019 2020] [--batch-rows 20000]
+# The parsed payloads every team season page turns into are rebuilt from a db_scripts/synthetic_db.py database (generated
+# if --db doesn't exist) and written into empty databases twice:
+#   legacy: the writers as they were, one INSERT per player with the duplicates caught as IntegrityError, frames converted
+#           with astype(object).where(...), one commit per page
+#   bulk:   the load pipeline with staged rows, one transaction per batch and synchronous=OFF (data_insert.bulk_load_conn)
+# Both databases must end up with the same rows.
+
+tables = ['TeamSeason', 'TeamBattingGame', 'TeamPitchingGame', 'Batters', 'Pitchers',
+    'PlayerBattingSeason', 'PlayerPitchingSeason', 'TeamBattingSeason', 'TeamPitchingSeason']
+team_batting_columns = ['Age', 'G', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'BA', 'OBP', 'SLG', 'OPS', 'TB', 'GDP', 'HBP', 'SH', 'SF', 'IBB']
+team_pitching_columns = ['Age', 'ERA', 'G', 'GS', 'GF', 'CG', 'SHO', 'SV', 'IP', 'H', 'R', 'ER', 'HR', 'BB', 'IBB', 'SO', 'HBP', 'BK', 'WP', 'BF', 'FIP', 'WHIP', 'H9', 'HR9', 'BB9', 'SO9']
+
+def legacy_upsert_frame(conn, table, df, key_columns):
+    df = df.reset_index()
+    values = df.astype(object).where(pd.notnull(df), None)
+    return db_write.upsert_rows(conn, table, list(df.columns), list(values.itertuples(index=False, name=None)), key_columns)
+
+def legacy_write_players(conn, table, columns, players):
+    query = f'INSERT INTO {table} (id, {", ".join(columns)}) VALUES ({",".join("?" for _ in range(len(columns) + 1))})'
+    for i,row in players.iterrows():
+        try:
+            conn.execute(query, (i, *row))
+        except sqlite3.IntegrityError:
+            print(f'\t\t\tPlayer already inserted: {row[0]}')
+
+def legacy_write_team_data(conn, team_season):
+    rows = db_write.upsert_rows(conn, 'TeamSeason', ['team_id', 'season', 'wins', 'losses'], [team_season], ['team_id', 'season'])
+    db_write.set_watermark(conn, team_season[0], team_season[1], 'TeamSeason')
+    return rows
+
+def legacy_write_game_data(table):
+    def write(conn, data):
+        rows = legacy_upsert_frame(conn, table, data, ['game_id', 'team_id'])
+        db_write.set_watermark(conn, int(data.index.get_level_values('team_id')[0]), int(data.season.iloc[0]), table, data.game_date.max())
+        return rows
+    return write
+
+def legacy_write_season_data(players_table, player_columns, table, team_table, team_columns):
+    def write(conn, season_data):
+        players, data, team_data = season_data
+        legacy_write_players(conn, players_table, player_columns, players)
+        rows = legacy_upsert_frame(conn, table, data, ['player_id', 'season', 'team_id'])
+        rows += db_write.upsert_rows(conn, team_table, ['team_id', 'season', *team_columns], [team_data], ['team_id', 'season'])
+        db_write.set_watermark(conn, team_data[0], team_data[1], table)
+        return rows
+    return write
+
+legacy_writers = {
+    data_insert.write_team_data: legacy_write_team_data,
+    data_insert.write_batting_game_data: legacy_write_game_data('TeamBattingGame'),
+    data_insert.write_pitching_game_data: legacy_write_game_data('TeamPitchingGame'),
+    data_insert.write_batting_season_data: legacy_write_season_data('Batters', ['Name', 'Pos', 'Handedness'], 'PlayerBattingSeason', 'TeamBattingSeason', team_batting_columns),
+    data_insert.write_pitching_season_data: legacy_write_season_data('Pitchers', ['Name', 'Handedness'], 'PlayerPitchingSeason', 'TeamPitchingSeason', team_pitching_columns),
+}
+
+def payloads(path, seasons):
+    # [(writer, payload)] in the order populate_db writes them, shaped like the parse_* functions' output
+    conn = sqlite3.connect(path)
+    read = lambda query, *params: pd.read_sql_query(query, conn, params=params)
+    batters = read('SELECT * FROM Batters').set_index('id')
+    pitchers = read('SELECT * FROM Pitchers').set_index('id')
+    if not seasons:
+        seasons = sorted(read('SELECT DISTINCT season FROM TeamSeason').season, reverse=True)
+    work = []
+    for season in seasons:
+        for team_id in sorted(read('SELECT team_id FROM TeamSeason WHERE season=?', int(season)).team_id):
+            key = (int(team_id), int(season))
+            record = read('SELECT team_id, season, wins, losses FROM TeamSeason WHERE team_id=? AND season=?', *key)
+            work.append((data_insert.write_team_data, tuple(int(v) for v in record.iloc[0])))
+            for table, writer in [('TeamBattingGame', data_insert.write_batting_game_data), ('TeamPitchingGame', data_insert.write_pitching_game_data)]:
+                games = read(f'SELECT * FROM {table} WHERE team_id=? AND season=? ORDER BY game_date', *key)
+                work.append((writer, games.set_index(['game_id', 'team_id'])))
+            for table, team_table, team_columns, people, writer in [
+                    ('PlayerBattingSeason', 'TeamBattingSeason', team_batting_columns, batters, data_insert.write_batting_season_data),
+                    ('PlayerPitchingSeason', 'TeamPitchingSeason', team_pitching_columns, pitchers, data_insert.write_pitching_season_data)]:
+                data = read(f'SELECT * FROM {table} WHERE team_id=? AND season=?', *key)
+                players = people.loc[data.player_id].rename_axis('player_id')
+                totals = read(f'SELECT * FROM {team_table} WHERE team_id=? AND season=?', *key)[team_columns]
+                work.append((writer, (players, data.set_index(['player_id', 'season', 'team_id']), [*key, *totals.iloc[0].tolist()])))
+    conn.close()
+    return work
+
+def empty_db(path):
+    for suffix in ['', '-wal', '-shm', '-journal']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    data_insert.new_db(conn)
+    return conn
+
+def legacy_load(path, work):
+    conn = empty_db(path)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for writer, payload in work:
+            legacy_writers[writer](conn, payload)
+            conn.commit()
+    seconds = time.perf_counter() - start
+    conn.close()
+    return seconds, len(work)
+
+def bulk_load(path, work, batch_rows):
+    empty_db(path).close()
+    def open_conn():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute('PRAGMA synchronous=OFF')
+        return conn
+    jobs = [(f'payload:{i}', lambda content, i: work[i][1], writer, (i,)) for i,(writer, _) in enumerate(work)]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = run_pipeline(jobs, lambda url: b'', open_conn, RowStage(), fetch_workers=1, parse_workers=1, batch_rows=batch_rows)
+    return time.perf_counter() - start, stats.batches
+
+def table_contents(path):
+    conn = sqlite3.connect(path)
+    contents = {table: sorted(conn.execute(f'SELECT * FROM {table}'), key=repr) for table in tables}
+    conn.close()
+    return contents
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Compare the legacy per-row player writes with the staged bulk writes')
+    parser.add_argument('--db', help='synthetic database to take the payloads from, generated if it does not exist (default: a temporary one)')
+    parser.add_argument('--seasons', nargs='+', type=int, help='seasons to write (default: all of them)')
+    parser.add_argument('--batch-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bb_bench_')
+    source = args.db or os.path.join(directory, 'synthetic.db')
+    if not os.path.exists(source):
+        from db_scripts.synthetic_db import generate
+        generate(source)
+    work = payloads(source, args.seasons)
+
+    legacy_path, bulk_path = os.path.join(directory, 'legacy.db'), os.path.join(directory, 'bulk.db')
+    results = {'legacy': legacy_load(legacy_path, work), 'bulk': bulk_load(bulk_path, work, args.batch_rows)}
+    contents = table_contents(legacy_path)
+    if contents != table_contents(bulk_path):
+        print('legacy and bulk databases differ')
+        sys.exit(1)
+
+    rows = sum(len(table_rows) for table_rows in contents.values())
+    print(f'{len(work)} payloads, {rows} rows')
+    print(f'  {"path":<8}{"seconds":>10}{"rows/sec":>11}{"commits":>9}')
+    for name, (seconds, commits) in results.items():
+        print(f'  {name:<8}{seconds:>10.2f}{rows / seconds:>11.0f}{commits:>9}')
+    print(f'  bulk is {results["legacy"][0] / results["bulk"][0]:.1f}x faster')
@@ -0,0 +1,157 @@
+import os,sys,json,time,random,sqlite3,argparse,statistics,subprocess,tempfile
+
+# SQLite against the Parquet export, run from the main repo directory with
+#   python -m benchmarks.bench_parquet [--db synthetic.db] [--queries 100] [--cold-runs 5]
+# Uses a db_scripts/synthetic_db.py database (generated if --db doesn't exist) and its Parquet export (written if it's
+# missing, or always with --export). Both sides answer the same random players/team_season/gamelogs selections:
+#   cold: a new process opens the backend and runs one query of every kind (imports not counted, the OS page cache stays warm)
+#   warm: one process repeats the selections after a first pass, the SQLite side skips the query cache (which would make
+#         it a dict lookup) so both sides actually read
+#   table: a whole table into pandas for offline analysis, pd.read_sql_query against the Parquet dataset
+# First checks that both return the same columns and row counts, for some of those selections and for empty ones.
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+kinds = [(kind, table_type) for kind in ['players', 'team_season', 'gamelogs'] for table_type in 'bp']
+tables = ['TeamBattingGame', 'PlayerBattingSeason', 'PlayerPitchingSeason']
+
+def db_teams_seasons(path):
+    # The app's team list only has the 30 real teams, a smaller database may not even have those
+    conn = sqlite3.connect(path)
+    teams = [row[0] for row in conn.execute('SELECT DISTINCT team_id FROM TeamSeason WHERE team_id < 30 ORDER BY team_id')]
+    seasons = [row[0] for row in conn.execute('SELECT DISTINCT season FROM TeamSeason ORDER BY season')]
+    conn.close()
+    return teams, seasons
+
+def selections(path, count, seed):
+    teams, seasons = db_teams_seasons(path)
+    rng = random.Random(seed)
+    return [(kind, table_type, rng.sample(teams, min(len(teams), rng.randint(1, 3))), rng.sample(seasons, min(len(seasons), rng.randint(1, 2))))
+        for _ in range(count) for kind, table_type in kinds]
+
+def empty_selections(path):
+    # A season before the first one and a team without rows, SQLite answers both with empty frames
+    teams, seasons = db_teams_seasons(path)
+    missing_team = max(teams) + 1 if teams else 0
+    return [(kind, table_type, team_ids, years) for kind, table_type in kinds
+        for team_ids, years in [(teams[:1], [min(seasons) - 1]), ([missing_team], seasons[-1:])]]
+
+def check(parquet_dir, work):
+    # Both backends return the same columns and rows, empty selections included; the differences, if any
+    sqlite, parquet = backend('sqlite', parquet_dir), backend('parquet', parquet_dir)
+    failures = []
+    for kind, table_type, team_ids, years in work:
+        expected, got = sqlite(kind, team_ids, years, table_type), parquet(kind, team_ids, years, table_type)
+        if list(expected.columns) != list(got.columns) or len(expected.index) != len(got.index):
+            failures.append(f'{kind} {table_type} {team_ids} {years}: {len(expected.index)} rows from sqlite, {len(got.index)} from parquet')
+    return failures
+
+def backend(name, parquet_dir):
+    # Function answering (kind, team_ids, years, table_type) with the given engine
+    if name == 'sqlite':
+        from db_scripts import graph_data_query as query_engine
+        queries = {
+            'players': query_engine.query_players.__wrapped__,
+            'team_season': query_engine.query_team_season.__wrapped__,
+            'gamelogs': query_engine.query_gamelogs.__wrapped__,
+        }
+        return lambda kind, team_ids, years, table_type: queries[kind](team_ids, years, table_type)
+    from db_scripts.parquet_engine import ParquetEngine
+    engine = ParquetEngine(parquet_dir)
+    return engine.lookup
+
+def run_cold(name, parquet_dir, work):
+    # Opening the backend is part of the first query, importing it isn't
+    import db_scripts.graph_data_query
+    import db_scripts.parquet_engine
+    start = time.perf_counter()
+    lookup = backend(name, parquet_dir)
+    timings = {}
+    for kind, table_type, team_ids, years in work:
+        lookup(kind, team_ids, years, table_type)
+        timings[f'{kind}_{table_type}'] = time.perf_counter() - start
+        start = time.perf_counter()
+    return timings
+
+def cold(name, args):
+    # Every run in its own process, the modules are imported before the clock starts
+    runs = []
+    for run in range(args.cold_runs):
+        result = subprocess.run([sys.executable, '-m', 'benchmarks.bench_parquet', '--child', name, '--db', args.db,
+            '--parquet', args.parquet, '--seed', str(args.seed + run)], cwd=directory, env={**os.environ, 'BB_DB_PATH': args.db},
+            capture_output=True, text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {case: statistics.median(run[case] for run in runs) for case in runs[0]}
+
+def warm(name, parquet_dir, work):
+    lookup = backend(name, parquet_dir)
+    for kind, table_type, team_ids, years in work:
+        lookup(kind, team_ids, years, table_type)
+    timings = {}
+    for kind, table_type, team_ids, years in work:
+        start = time.perf_counter()
+        lookup(kind, team_ids, years, table_type)
+        timings.setdefault(f'{kind}_{table_type}', []).append(time.perf_counter() - start)
+    return {case: statistics.median(values) for case, values in timings.items()}
+
+def table_reads(db, parquet_dir):
+    import pandas as pd
+    from db_scripts.parquet_engine import ParquetEngine
+    engine = ParquetEngine(parquet_dir)
+    conn = sqlite3.connect(db)
+    results = {}
+    for table in tables:
+        start = time.perf_counter()
+        df = pd.read_sql_query(f'SELECT * FROM {table}', conn)
+        sqlite_seconds = time.perf_counter() - start
+        sqlite_objects = int((df.dtypes == object).sum())
+        start = time.perf_counter()
+        df = engine.export.read(table)
+        parquet_seconds = time.perf_counter() - start
+        parquet_objects = int((df.dtypes == object).sum())
+        results[table] = (sqlite_seconds, parquet_seconds, len(df.index), sqlite_objects, parquet_objects)
+    conn.close()
+    return results
+
+def print_cases(label, sqlite, parquet):
+    print(label)
+    print(f'  {"case":<22}{"sqlite ms":>11}{"parquet ms":>12}{"parquet/sqlite":>16}')
+    for case in sqlite:
+        print(f'  {case:<22}{1000 * sqlite[case]:>11.2f}{1000 * parquet[case]:>12.2f}{parquet[case] / sqlite[case]:>15.2f}x')
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Compare SQLite and Parquet reads')
+    parser.add_argument('--db', help='synthetic database, generated if it does not exist (default: a temporary one)')
+    parser.add_argument('--parquet', help='export directory (default: next to the database)')
+    parser.add_argument('--export', action='store_true', help='export again even if the directory exists')
+    parser.add_argument('--queries', type=int, default=100, help='selections per kind in the warm run')
+    parser.add_argument('--cold-runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--child', choices=['sqlite', 'parquet'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    args.db = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix='bb_bench_'), 'synthetic.db'))
+    args.parquet = os.path.abspath(args.parquet or os.path.splitext(args.db)[0] + '.parquet')
+    if args.child:
+        print(json.dumps(run_cold(args.child, args.parquet, selections(args.db, 1, args.seed))))
+        sys.exit(0)
+
+    if not os.path.exists(args.db):
+        from db_scripts.synthetic_db import generate
+        generate(args.db)
+    if args.export or not os.path.exists(args.parquet):
+        from db_scripts.parquet_export import export
+        export(args.db, args.parquet)
+    os.environ['BB_DB_PATH'] = args.db
+
+    work = selections(args.db, args.queries, args.seed)
+    failures = check(args.parquet, work[:len(kinds) * 5] + empty_selections(args.db))
+    if failures:
+        print('parquet results differ from sqlite:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+    print_cases(f'cold, median of {args.cold_runs} processes', cold('sqlite', args), cold('parquet', args))
+    print_cases(f'warm, median of {args.queries} selections', warm('sqlite', args.parquet, work), warm('parquet', args.parquet, work))
+    print('whole table into pandas')
+    print(f'  {"table":<22}{"rows":>9}{"sqlite ms":>11}{"parquet ms":>12}{"parquet/sqlite":>16}{"object cols":>13}')
+    for table, (sqlite_seconds, parquet_seconds, rows, sqlite_objects, parquet_objects) in table_reads(args.db, args.parquet).items():
+        print(f'  {table:<22}{rows:>9}{1000 * sqlite_seconds:>11.1f}{1000 * parquet_seconds:>12.1f}'
+            f'{parquet_seconds / sqlite_seconds:>15.2f}x{f"{sqlite_objects} -> {parquet_objects}":>13}')
@@ -0,0 +1,70 @@
+import os,sys,argparse,subprocess,statistics
+from collections import defaultdict
+
+# Startup import benchmark, run from the main repo directory with
+#   python -m benchmarks.bench_startup [--module index] [--repeat 5] [--budget-ms 1500]
+# Imports the app in fresh interpreters with python -X importtime, reports the median total and the packages
+# that cost the most, and exits non-zero if the median is over --budget-ms or if anything that should only load
+# on first use (scraping code, statsmodels, plotly) is imported at startup.
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that must stay off the serving import path (dash itself imports the plotly package, but not the figure modules)
+lazy_packages = ['data_insert', 'fetch_client', 'aiohttp', 'requests', 'bs4', 'lxml', 'statsmodels', 'plotly.express', 'plotly.graph_objects', 'plotly.graph_objs']
+
+def import_times(module):
+    # [(self us, cumulative us, depth, name)] in import order
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=directory, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+def total_ms(rows):
+    # Top level imports don't nest, their cumulative times add up to the whole startup
+    return sum(cumulative for _, cumulative, depth, _ in rows if depth == 0) / 1000
+
+def by_package(rows):
+    # Self time summed per top level package
+    totals = defaultdict(int)
+    for self_us, _, _, name in rows:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Measure app startup imports with python -X importtime')
+    parser.add_argument('--module', default='index', help='module to import (default: index)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='how many packages to list')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('BB_STARTUP_BUDGET_MS', 1500)),
+        help='fail if the median import time is over this (default: 1500, or BB_STARTUP_BUDGET_MS)')
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    totals = [total_ms(rows) for rows in runs]
+    median = statistics.median(totals)
+    print(f'import {args.module}: median {median:.0f} ms, best {min(totals):.0f} ms over {args.repeat} runs')
+
+    print(f'{"package":<30}{"self ms":>10}')
+    for name, self_us in by_package(runs[totals.index(min(totals))])[:args.top]:
+        print(f'{name:<30}{self_us / 1000:>10.1f}')
+
+    failures = []
+    if median > args.budget_ms:
+        failures.append(f'median startup {median:.0f} ms is over the {args.budget_ms:.0f} ms budget')
+    imported = {name for _, _, _, name in runs[0]}
+    eager = [package for package in lazy_packages if any(name == package or name.startswith(package + '.') for name in imported)]
+    if eager:
+        failures.append(f'imported at startup, should load on first use: {eager}')
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
@@ -0,0 +1,184 @@
+import os,sys,time,random,argparse,signal,statistics,subprocess,threading
+import requests
+
+# Load test for the Dash server, run from the main repo directory with
+#   python -m benchmarks.load_test --url http://localhost:8050 [--clients 16] [--duration 20]
+#   python -m benchmarks.load_test --compare [--clients 16] [--duration 20]
+# Every client repeats what the scatter tab does: the store callback for a random team/season selection, then the
+# scatter and correlation callbacks with the key it returned (so with several workers the key is often loaded by
+# another worker than the one that stored it). Reports requests/sec, latency percentiles, errors and the share of
+# compressed responses. --compare starts the dev server (python index.py) and gunicorn (gunicorn.conf.py) on their own
+# ports, runs the same load against each and prints the throughput ratio. Needs a populated baseball.db.
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def callback_payload(outputs, inputs, state=()):
+    # Request body the Dash renderer sends to /_dash-update-component
+    outputs = [{'id': id, 'property': prop} for id, prop in outputs]
+    if len(outputs) == 1:
+        output = f'{outputs[0]["id"]}.{outputs[0]["property"]}'
+    else:
+        output = '..' + '...'.join(f'{o["id"]}.{o["property"]}' for o in outputs) + '..'
+    return {
+        'output': output,
+        'outputs': outputs[0] if len(outputs) == 1 else outputs,
+        'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+        'changedPropIds': [f'{inputs[0][0]}.{inputs[0][1]}'],
+        'state': [{'id': id, 'property': prop, 'value': value} for id, prop, value in state],
+    }
+
+def session_requests(p, rng, team_pool, season_pool):
+    # Callbacks of one scatter tab visit, the later ones need the key from the first
+    team_ids = rng.sample(team_pool, min(rng.randint(1, 3), len(team_pool)))
+    years = rng.sample(season_pool, min(rng.randint(1, 2), len(season_pool)))
+    yield 'store', callback_payload(
+        [(f'{p}-scatter-save', 'children')],
+        [(f'{p}-scatter-team-name', 'value', team_ids), (f'{p}-scatter-season-year', 'value', years)])
+    key = yield
+    yield 'scatter', callback_payload(
+        [(f'{p}-scatter-result', 'children'), (f'{p}-scatter-x', 'options'), (f'{p}-scatter-y', 'options'), (f'{p}-scatter-label', 'children')],
+        [(f'{p}-scatter-save', 'children', key), (f'{p}-scatter-x', 'value', None), (f'{p}-scatter-y', 'value', None),
+            (f'{p}-scatter-season-year', 'value', years), (f'{p}-scatter-qualified', 'value', []), (f'{p}-scatter-trend', 'value', 'linear')],
+        [(f'{p}-scatter-team-name', 'value', team_ids)])
+    yield 'correlations', callback_payload(
+        [(f'{p}-corr-graph', 'figure'), (f'{p}-corr-label', 'children')],
+        [(f'{p}-scatter-save', 'children', key), (f'{p}-corr-method', 'value', 'pearson'),
+            (f'{p}-scatter-season-year', 'value', years), (f'{p}-scatter-qualified', 'value', [])],
+        [(f'{p}-scatter-team-name', 'value', team_ids)])
+
+def stored_key(body):
+    response = body['response']
+    if 'props' in response:
+        return response['props']['children']
+    return next(iter(response.values()))['children']
+
+class Results:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = 0
+        self.compressed = 0
+        self.responses = 0
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds, ok, encoding):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            self.responses += 1
+            self.errors += not ok
+            self.compressed += encoding in ('gzip', 'br')
+
+def client(url, deadline, results, seed, team_pool, season_pool):
+    rng = random.Random(seed)
+    session = requests.Session()
+    session.headers['Accept-Encoding'] = 'gzip'
+    while time.perf_counter() < deadline:
+        steps = session_requests(rng.choice('bp'), rng, team_pool, season_pool)
+        name, payload = next(steps)
+        while True:
+            start = time.perf_counter()
+            try:
+                r = session.post(f'{url}/_dash-update-component', json=payload, timeout=60)
+                ok = r.status_code == 200
+                results.add(name, time.perf_counter() - start, ok, r.headers.get('Content-Encoding'))
+            except requests.RequestException:
+                ok = False
+                results.add(name, time.perf_counter() - start, ok, None)
+            if not ok:
+                break
+            try:
+                if name == 'store':
+                    next(steps)
+                    name, payload = steps.send(stored_key(r.json()))
+                else:
+                    name, payload = next(steps)
+            except StopIteration:
+                break
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def run_load(url, clients, duration, warmup, team_pool, season_pool):
+    if warmup:
+        # Fills the caches so both servers are measured warm
+        client(url, time.perf_counter() + warmup, Results(), -1, team_pool, season_pool)
+    results = Results()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(url, deadline, results, seed, team_pool, season_pool)) for seed in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return results, elapsed
+
+def report(label, results, elapsed):
+    rps = results.responses / elapsed
+    print(f'{label}: {results.responses} requests in {elapsed:.1f}s, {rps:.1f} req/s, {results.errors} errors, '
+        f'{results.compressed / max(results.responses, 1):.0%} compressed')
+    print(f'  {"callback":<14}{"n":>7}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+    for name, latencies in results.latencies.items():
+        print(f'  {name:<14}{len(latencies):>7}{1000 * statistics.median(latencies):>10.1f}'
+            f'{1000 * percentile(latencies, .95):>10.1f}{1000 * max(latencies):>10.1f}')
+    return rps
+
+def wait_ready(url, process, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            if requests.get(f'{url}/_dash-layout', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(.5)
+    raise RuntimeError(f'{url} did not come up in {timeout}s')
+
+def start_server(command, env):
+    # Own process group, the dev server's reloader runs the app in a child process
+    return subprocess.Popen(command, cwd=directory, env={**os.environ, **env}, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def stop_server(process):
+    if process.poll() is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Load test the Dash callbacks')
+    parser.add_argument('--url', default='http://localhost:8050')
+    parser.add_argument('--compare', action='store_true', help='start and compare the dev server and gunicorn')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--teams', type=int, nargs='+', default=list(range(30)), help='team ids the clients pick from')
+    parser.add_argument('--seasons', type=int, nargs='+', default=list(range(2012, 2021)), help='seasons the clients pick from')
+    parser.add_argument('--dev-port', type=int, default=8051)
+    parser.add_argument('--prod-port', type=int, default=8052)
+    args = parser.parse_args()
+
+    if not args.compare:
+        report(args.url, *run_load(args.url, args.clients, args.duration, args.warmup, args.teams, args.seasons))
+        sys.exit(0)
+
+    servers = [
+        ('dev server', [sys.executable, 'index.py'], {'PORT': str(args.dev_port)}, args.dev_port),
+        ('gunicorn', ['gunicorn', '-c', 'gunicorn.conf.py', 'index:server'],
+            {'BB_BIND': f'127.0.0.1:{args.prod_port}'}, args.prod_port),
+    ]
+    rates = {}
+    for label, command, env, port in servers:
+        url = f'http://127.0.0.1:{port}'
+        process = start_server(command, env)
+        try:
+            wait_ready(url, process)
+            rates[label] = report(label, *run_load(url, args.clients, args.duration, args.warmup, args.teams, args.seasons))
+        finally:
+            stop_server(process)
+    print(f'gunicorn / dev server throughput: {rates["gunicorn"] / rates["dev server"]:.1f}x')
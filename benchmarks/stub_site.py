@@ -0,0 +1,259 @@
+import re,sys,time,random,sqlite3,hashlib,argparse,threading
+from datetime import datetime
+from html import escape
+from http.server import ThreadingHTTPServer,BaseHTTPRequestHandler
+from urllib.parse import urlparse,parse_qs
+
+from teams import team_codes
+
+# Offline stand-in for Baseball Reference, run from the main repo directory with
+#   python -m benchmarks.stub_site --db synthetic.db [--port 8060] [--fault-rate 0.1] [--faults 429,503,reset,stall,truncate]
+# and point the loaders at it with BB_BASE_URL=http://127.0.0.1:8060 (plus --no-cache and a high --rpm).
+# Serves the gamelog and season pages data_insert requests, rendered from a db_scripts/synthetic_db.py database in the
+# markup the parsers read (summary record, stat tables with data-stat cells, repeated header rows, player ids, team totals).
+# Responses carry an ETag and answer If-None-Match with 304. With --fault-rate, that share of requests gets one of:
+#   429: Too Many Requests with Retry-After    503: Service Unavailable    reset: connection closed without a response
+#   stall: response held back for --stall seconds    truncate: connection closed halfway through the body
+
+fault_kinds = ['429', '503', 'reset', 'stall', 'truncate']
+last_modified = 'Mon, 02 Nov 2020 12:00:00 GMT'
+
+batting_game_columns = [
+    ('Rk', None), ('Gtm', None), ('Date', None), ('', None), ('Opp', None), ('Rslt', None),
+    ('PA', 'PA'), ('AB', 'AB'), ('R', 'R'), ('H', 'H'), ('2B', '2B'), ('3B', '3B'), ('HR', 'HR'), ('RBI', 'RBI'), ('BB', 'BB'),
+    ('IBB', 'IBB'), ('SO', 'SO'), ('HBP', 'HBP'), ('SH', 'SH'), ('SF', 'SF'), ('ROE', 'ROE'), ('GDP', 'GDP'), ('SB', 'SB'),
+    ('CS', 'CS'), ('BA', 'BA'), ('OBP', 'OBP'), ('SLG', 'SLG'), ('OPS', 'OPS'), ('LOB', 'LOB'), ('#', None), ('Thr', 'OppStarterThr'),
+    ('Opp. Starter (GmeSc)', None),
+]
+pitching_game_columns = [
+    ('Rk', None), ('Gtm', None), ('Date', None), ('', None), ('Opp', None), ('Rslt', None),
+    ('IP', 'IP'), ('H', 'H'), ('R', 'R'), ('ER', 'ER'), ('UER', 'UER'), ('BB', 'BB'), ('SO', 'SO'), ('HR', 'HR'), ('HBP', 'HBP'),
+    ('ERA', 'ERA'), ('BF', 'BF'), ('Pit', 'Pitches'), ('Str', 'Strikes'), ('IR', 'IR'), ('IS', 'IS'), ('SB', 'SB'), ('CS', 'CS'),
+    ('AB', 'AB'), ('2B', '2B'), ('3B', '3B'), ('IBB', 'IBB'), ('SH', 'SH'), ('SF', 'SF'), ('ROE', 'ROE'), ('GDP', 'GDP'),
+    ('#', 'PitchersUsed'), ('Umpire', None), ('Pitchers Used (Rest-GameScore-Dec)', None),
+]
+batting_season_columns = ['Rk', 'Pos', 'Name', 'Age', 'G', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO',
+    'BA', 'OBP', 'SLG', 'OPS', 'OPS+', 'TB', 'GDP', 'HBP', 'SH', 'SF', 'IBB']
+pitching_season_columns = ['Rk', 'Pos', 'Name', 'Age', 'W', 'L', 'W-L%', 'ERA', 'G', 'GS', 'GF', 'CG', 'SHO', 'SV', 'IP', 'H', 'R',
+    'ER', 'HR', 'BB', 'IBB', 'SO', 'HBP', 'BK', 'WP', 'BF', 'ERA+', 'FIP', 'WHIP', 'H9', 'HR9', 'BB9', 'SO9', 'SO/W']
+handedness_marks = {'L': '*', 'S': '#', 'R': ''}
+
+def data_stat(label, i):
+    # Unique per column ('ERA' and 'ERA+' would clash otherwise)
+    return re.sub(r'[^a-z0-9]+', '_', label.lower()).strip('_') + f'_{i}'
+
+def cell(label, i, value, player_id=None):
+    # Names are the player cells, with the player id on the player rows
+    text = '' if value is None else escape(str(value))
+    if label == 'Name':
+        player = f' data-append-csv="{escape(player_id)}"' if player_id is not None else ''
+        return f'<td data-stat="player"{player}>{text}</td>'
+    return f'<td data-stat="{data_stat(label, i)}">{text}</td>'
+
+def stat_table(table_id, labels, rows, footer=()):
+    # rows are [(values by label, player_id)], a repeated header row every 20 rows like the real pages
+    header = ''.join(f'<th data-stat="{"player" if label == "Name" else data_stat(label, i)}">{escape(label)}</th>' for i,label in enumerate(labels))
+    body = []
+    for n,(values, player_id) in enumerate(rows):
+        if n and n % 20 == 0:
+            body.append(f'<tr class="thead">{header}</tr>')
+        body.append('<tr>' + ''.join(cell(label, i, values.get(label), player_id if label == 'Name' else None) for i,label in enumerate(labels)) + '</tr>')
+    foot = ''.join('<tr>' + ''.join(cell(label, i, values.get(label)) for i,label in enumerate(labels)) + '</tr>'
+        for values, _ in footer)
+    return (f'<table id="{table_id}"><thead><tr>{header}</tr></thead><tbody>{"".join(body)}</tbody>'
+        f'<tfoot>{foot}</tfoot></table>')
+
+def page(title, *parts):
+    return f'<!DOCTYPE html><html><head><title>{escape(title)}</title></head><body><div id="wrap">{"".join(parts)}</div></body></html>'.encode('utf-8')
+
+class StubSite:
+    # Renders pages from the synthetic database on first request and keeps them
+    def __init__(self, db_path, fault_rate=0.0, faults=fault_kinds, retry_after=1, stall=40.0, seed=0):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.fault_rate = fault_rate
+        self.faults = list(faults)
+        self.retry_after = retry_after
+        self.stall = stall
+        self.requests = []
+        self.connections = set()
+        self._pages = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def rows(self, query, *params):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(query, params)]
+
+    def has_season(self, team_code, year):
+        return bool(self.rows('SELECT 1 FROM TeamSeason WHERE team_id=? AND season=?', team_codes.index(team_code), year))
+
+    def summary(self, team_id, year):
+        record = self.rows('SELECT wins, losses FROM TeamSeason WHERE team_id=? AND season=?', team_id, year)
+        if not record:
+            return ''
+        return ('<div><div><div><div data-template="Partials/Teams/Summary">'
+            f'<p><strong>Record:</strong> {record[0]["wins"]}-{record[0]["losses"]}, 1st in Division</p></div></div></div></div>')
+
+    def gamelog_page(self, team_code, year, table_type):
+        team_id = team_codes.index(team_code)
+        table = 'TeamBattingGame' if table_type == 'b' else 'TeamPitchingGame'
+        columns = batting_game_columns if table_type == 'b' else pitching_game_columns
+        rows = []
+        for n,game in enumerate(self.rows(f'SELECT * FROM {table} WHERE team_id=? AND season=? ORDER BY game_date, game_id', team_id, year)):
+            runs = (game['R'], game['RunsAgainst']) if table_type == 'b' else (game['RunsFor'], game['R'])
+            values = {label: game[column] for label, column in columns if column is not None}
+            values.update({
+                'Rk': n + 1, 'Gtm': n + 1, '#': values.get('#', 9), 'Opp. Starter (GmeSc)': 'A. Pitcher(50)',
+                'Umpire': 'A. Umpire', 'Pitchers Used (Rest-GameScore-Dec)': 'A. Pitcher (4-50-W)',
+                'Date': datetime.strptime(game['game_date'], '%Y-%m-%d').strftime('%b %d').replace(' 0', ' '),
+                '': '@' if game['HomeAway'] == 'A' else '',
+                'Opp': team_codes[game['opp_id']] if game['opp_id'] is not None and game['opp_id'] < len(team_codes) else 'XXX',
+                'Rslt': f'{game["Result"]},{runs[0]}-{runs[1]}',
+            })
+            rows.append((values, None))
+        table_id = 'team_batting_gamelogs' if table_type == 'b' else 'team_pitching_gamelogs'
+        return page(f'{year} {team_code} game log', self.summary(team_id, year), stat_table(table_id, [label for label, _ in columns], rows))
+
+    def season_page(self, team_code, year, table_type):
+        team_id = team_codes.index(team_code)
+        if table_type == 'b':
+            players = self.rows('SELECT s.*, p.Name, p.Pos, p.Handedness FROM PlayerBattingSeason s JOIN Batters p ON p.id = s.player_id '
+                'WHERE s.team_id=? AND s.season=? ORDER BY s.PA DESC, s.player_id', team_id, year)
+            totals = self.rows('SELECT * FROM TeamBattingSeason WHERE team_id=? AND season=?', team_id, year)
+            labels, table_id = batting_season_columns, 'team_batting'
+        else:
+            players = self.rows('SELECT s.*, p.Name, p.Handedness, s.wins AS W, s.losses AS L FROM PlayerPitchingSeason s JOIN Pitchers p ON p.id = s.player_id '
+                'WHERE s.team_id=? AND s.season=? ORDER BY s.IP DESC, s.player_id', team_id, year)
+            totals = self.rows('SELECT t.*, r.wins AS W, r.losses AS L FROM TeamPitchingSeason t LEFT JOIN TeamSeason r USING (team_id, season) '
+                'WHERE t.team_id=? AND t.season=?', team_id, year)
+            labels, table_id = pitching_season_columns, 'team_pitching'
+        rows = []
+        for n,player in enumerate(players):
+            values = dict(player, **{'Rk': n + 1, 'OPS+': 100, 'ERA+': 100, 'Name': player['Name'] + handedness_marks.get(player['Handedness'], '')})
+            if table_type == 'p':
+                values['Pos'] = 'SP' if player['GS'] else 'RP'
+                values['W-L%'] = round(player['W'] / (player['W'] + player['L']), 3) if player['W'] + player['L'] else None
+                values['SO/W'] = round(player['SO'] / player['BB'], 2) if player['BB'] else None
+            rows.append((values, player['player_id']))
+        footer = [(dict(totals[0], **{'Name': 'Team Totals', 'OPS+': 100, 'ERA+': 100, 'W-L%': .5, 'SO/W': 2.0}), None)] if totals else []
+        page_name = 'batting' if table_type == 'b' else 'pitching'
+        return page(f'{year} {team_code} {page_name}', self.summary(team_id, year), stat_table(table_id, labels, rows, footer))
+
+    def render(self, url):
+        # Page content for a data_insert url, None for anything else (and team seasons the database doesn't have)
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        match = re.fullmatch(r'/teams/([A-Z]{3})/(\d{4})-(batting|pitching)\.shtml', parsed.path)
+        if parsed.path == '/teams/tgl.cgi':
+            team_code, year, table_type = query.get('team', [''])[0], query.get('year', ['0'])[0], query.get('t', [''])[0]
+            if team_code not in team_codes or table_type not in ('b', 'p') or not year.isdigit() or not self.has_season(team_code, int(year)):
+                return None
+            return self.gamelog_page(team_code, int(year), table_type)
+        if match and match.group(1) in team_codes and self.has_season(match.group(1), int(match.group(2))):
+            return self.season_page(match.group(1), int(match.group(2)), match.group(3)[0])
+        return None
+
+    def content(self, url):
+        with self._lock:
+            if url in self._pages:
+                return self._pages[url]
+        content = self.render(url)
+        with self._lock:
+            self._pages[url] = content
+        return content
+
+    def draw_fault(self):
+        with self._lock:
+            if self.fault_rate and self._random.random() < self.fault_rate:
+                return self._random.choice(self.faults)
+        return None
+
+    def log(self, path, outcome, client_address):
+        with self._lock:
+            self.requests.append((time.monotonic(), path, outcome))
+            self.connections.add(client_address)
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 so clients keep their connections open between pages
+        protocol_version = 'HTTP/1.1'
+
+        def send_body(self, status, body, headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            fault = site.draw_fault()
+            site.log(self.path, fault or 'ok', self.client_address)
+            if fault == '429':
+                return self.send_body(429, b'Too Many Requests', [('Retry-After', str(site.retry_after))])
+            if fault == '503':
+                return self.send_body(503, b'Service Unavailable')
+            if fault == 'reset':
+                self.close_connection = True
+                return
+            if fault == 'stall':
+                time.sleep(site.stall)
+
+            content = site.content(self.path)
+            if content is None:
+                return self.send_body(404, b'Not Found')
+            etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+            headers = [('Content-Type', 'text/html; charset=utf-8'), ('ETag', etag), ('Last-Modified', last_modified)]
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                for name, value in headers[1:]:
+                    self.send_header(name, value)
+                self.end_headers()
+                return
+            if fault == 'truncate':
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content[:len(content) // 2])
+                self.close_connection = True
+                return
+            self.send_body(200, content, headers)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on stalled responses, that's the point of them
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def serve(site, host='127.0.0.1', port=0):
+    # Server running in a daemon thread, its base url is f'http://{host}:{server.server_port}'
+    server = StubServer((host, port), make_handler(site))
+    threading.Thread(target=server.serve_forever, name='stub-site', daemon=True).start()
+    return server
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Serve Baseball Reference shaped pages from a synthetic database')
+    parser.add_argument('--db', required=True, help='db_scripts/synthetic_db.py database')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8060)
+    parser.add_argument('--fault-rate', type=float, default=0.0, help='share of requests that get a fault')
+    parser.add_argument('--faults', default=','.join(fault_kinds), help=f'comma separated fault kinds ({",".join(fault_kinds)})')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds on 429 responses')
+    parser.add_argument('--stall', type=float, default=40.0, help='seconds a stalled response is held back')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    site = StubSite(args.db, args.fault_rate, args.faults.split(','), args.retry_after, args.stall, args.seed)
+    server = StubServer((args.host, args.port), make_handler(site))
+    print(f'Serving {args.db} at http://{args.host}:{server.server_port} (BB_BASE_URL), Ctrl+C to stop')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,13 @@
+import pytest
+
+from db_scripts.synthetic_db import generate
+
+# At the repo root so pytest puts the repo on sys.path for tests/, run with
+#   python -m pytest
+
+# A small db_scripts/synthetic_db.py database shared by the tests: every real team, the last two seasons, short schedules
+@pytest.fixture(scope='session')
+def synthetic_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('db') / 'synthetic.db')
+    generate(path, seasons=2, games=20)
+    return path
@@ -1,58 +1,56 @@
-import sys,requests,sqlite3,json,hashlib
+import sys,json,time,hashlib,argparse
+from datetime import datetime
 import pandas as pd
 import numpy as np
-from datetime import datetime
-from bs4 import BeautifulSoup
 from lxml import html
-from requests.exceptions import HTTPError
 import os
 
 from db_scripts.db_connect import db_setup,db_error_cleanup
+from db_scripts.db_write import RowStage,get_watermark,set_watermark,bump_data_version,clear_unit,done_jobs,start_jobs,finish_job,fail_job
+from db_scripts.aggregates import build_aggregates
+from load_pipeline import run_pipeline
+from fetch_client import FetchClient,default_client
+from page_cache import PageCache
+from html_tables import extract_table
+from teams import team_codes,team_id_dict
 
 # TODO: Allow insertion of deprecated team codes (e.g. the Marlins used FLA before 2012)
 
 sql_max_int = 2147483647
-team_codes = [
-    'ARI',
-    'ATL',
-    'BAL',
-    'BOS',
-    'CHC',
-    'CHW',
-    'CIN',
-    'CLE',
-    'COL',
-    'DET',
-    'HOU',
-    'KCR',
-    'LAA',
-    'LAD',
-    'MIA',
-    'MIL',
-    'MIN',
-    'NYM',
-    'NYY',
-    'OAK',
-    'PHI',
-    'PIT',
-    'SDP',
-    'SFG',
-    'SEA',
-    'STL',
-    'TBR',
-    'TEX',
-    'TOR',
-    'WSN'
-]
-team_id_dict = dict(zip(team_codes, list(range(len(team_codes)))))
+seasons = list(range(2020, 2011, -1))
+# BB_BASE_URL points the scrapers at another server, e.g. the offline stub in benchmarks/stub_site.py
+base_url = os.environ.get('BB_BASE_URL', 'https://www.baseball-reference.com').rstrip('/')
+default_requests_per_minute = float(os.environ.get('BB_REQUESTS_PER_MINUTE', 20))
 
-def new_db(conn):
+def gamelog_url(team_code, year, table_type):
+    return f'{base_url}/teams/tgl.cgi?team={team_code}&t={table_type}&year={year}'
+
+def season_url(team_code, year, table_type):
+    page = 'batting' if table_type == 'b' else 'pitching'
+    return f'{base_url}/teams/{team_code}/{year}-{page}.shtml'
+
+def fetch_page(url, client=None):
+    # Retrieve html from Baseball Reference
+    # The client retries, times out and rate limits, a page that still can't be fetched raises fetch_client.FetchError
+    return (client or default_client()).fetch(url)
+
+def run_script(conn, name):
     directory = os.path.dirname(os.path.abspath(__file__))
-    # Drop and recreate tables
-    with open(os.path.join(directory, 'db_scripts', 'new_tables.sql'), 'r') as f:
+    with open(os.path.join(directory, 'db_scripts', name), 'r') as f:
         script = f.read()
         conn.executescript(script)
 
+def migrate_db(conn):
+    # Schema additions that can be applied to an existing database without dropping anything
+    run_script(conn, 'load_tables.sql')
+    run_script(conn, 'indexes.sql')
+
+def new_db(conn):
+    directory = os.path.dirname(os.path.abspath(__file__))
+    # Drop and recreate tables
+    run_script(conn, 'new_tables.sql')
+    migrate_db(conn)
+
     # Populate Teams table
     df = pd.read_csv(os.path.join(directory, 'db_scripts', 'team_table.csv'))
     df['id'] = df['id'].apply(pd.to_numeric)
@@ -61,49 +59,82 @@ def new_db(conn):
 
     conn.commit()
 
-def insert_team_data(conn, team_code, year):
-    # Retrieve html from Baseball Reference
-    url = f'https://www.baseball-reference.com/teams/tgl.cgi?team={team_code}&t=b&year={year}'
-    try:
-        r = requests.get(url)
-        # If the response was successful, no exception will be raised
-        r.raise_for_status()
-    except HTTPError as http_err:
-        raise http_err
-    
+def parse_game_dates(dates, year):
+    # Fix Date column for double headers and made it SQLite compatible
+    dates = dates.str.encode('ascii', 'ignore').str.decode('ascii').str.strip()
+    dates = dates.str.replace('susp', '')
+    dates = dates.str.split('(').str[0] + str(year)
+    dates = dates.str.replace(' ', '')
+    return pd.to_datetime(dates, format='%b%d%Y').dt.strftime('%Y-%m-%d')
+
+def game_ids(data, team_code, runs_for, runs_against):
+    # Unique game id for each game (home/away independent): both teams build the same key from the home team's side
+    # Runs go through int so typed and text columns give the same key ('5', never '5.0')
+    runs_for = runs_for.astype('int64').astype(str)
+    runs_against = runs_against.astype('int64').astype(str)
+    team = pd.Series(team_code, index=data.index)
+    home = data.game_date.str.cat([data.opp_id, runs_against, team, runs_for])
+    away = data.game_date.str.cat([team, runs_for, data.opp_id, runs_against])
+    keys = np.where(data.HomeAway == 'H', home, away)
+    # sha256 mod the max SQLite int, so ids match everything loaded before. Only the digests are per game, the mod runs on
+    # their four big-endian 64 bit words at once: sql_max_int is 2**31 - 1, so 2**64 is 4 mod it and the word weights are 4**i
+    digests = b''.join([hashlib.sha256(key.encode('utf-8')).digest() for key in keys])
+    words = np.frombuffer(digests, dtype='>u8').reshape(-1, 4).astype(np.uint64) % np.uint64(sql_max_int)
+    weights = np.array([4 ** 3, 4 ** 2, 4, 1], dtype=np.uint64)
+    return ((words * weights).sum(axis=1) % np.uint64(sql_max_int)).astype('int64')
+
+def parse_team_data(content, team_code, year):
     # Pull important data from xml tree
-    tree = html.fromstring(r.content)
+    tree = html.fromstring(content)
     wins,losses = tree.xpath('//div/div/div/div[contains(@data-template, \'Partials/Teams/Summary\')]/p/text()[contains(.,\'-\')]')[0].split()[0].split('-')
     losses = losses[:-1]
+    return (team_id_dict[team_code], year, wins, losses)
 
-    # SQLite insert team
-    query = 'INSERT INTO TeamSeason (team_id, season, wins, losses) VALUES (?,?,?,?)'
+def load_payload(conn, writer, payload):
+    # Write one parsed page outside the load pipeline, in its own transaction
+    stage = RowStage()
     try:
-        conn.execute(query, (team_id_dict[team_code], year, wins, losses))
-    except sqlite3.IntegrityError:
-        print(f'Team Season exists: {team_code} {year}')
-        return True
+        rows = writer(conn, payload, stage)
+        stage.flush(conn)
+        conn.commit()
     except Exception as e:
         db_error_cleanup(conn, e)
-        return False
+    return rows
+
+# Writers stage their rows (db_write.RowStage), the caller flushes and commits them, so a batch of pages is one transaction
+def write_team_data(conn, team_season, stage):
+    # SQLite upsert team, the record changes every day during the season
+    rows = stage.upsert('TeamSeason', ['team_id', 'season', 'wins', 'losses'], [team_season], ['team_id', 'season'])
+    set_watermark(conn, team_season[0], team_season[1], 'TeamSeason')
+    return rows
+
+def write_game_data(conn, table, data, stage):
+    team_id = int(data.index.get_level_values('team_id')[0])
+    season = int(data.season.iloc[0])
+
+    # Only games on or after the watermark are new (the watermark date itself is kept for double headers)
+    watermark = get_watermark(conn, team_id, season, table)
+    if watermark is not None and watermark[0] is not None:
+        data = data[data.game_date >= watermark[0]]
+
+    rows = stage.upsert_frame(table, data, ['game_id', 'team_id'])
+    set_watermark(conn, team_id, season, table, data.game_date.max() if rows else None)
+    return rows
+
+def insert_team_data(conn, team_code, year):
+    content = fetch_page(gamelog_url(team_code, year, 'b'))
+    load_payload(conn, write_team_data, parse_team_data(content, team_code, year))
     return True
 
-def insert_batting_game_data(conn, team_code, year):
-    team_id = team_id_dict[team_code]
+def read_batting_game_table(content):
+    # Retrieve Batting Table from XML page and put into a DataFrame (repeated header rows are skipped)
+    return extract_table(content, 'team_batting_gamelogs')
 
-    # Retrieve team batting data from Baseball Reference
-    url = f'https://www.baseball-reference.com/teams/tgl.cgi?team={team_code}&t=b&year={year}'
-    try:
-        r = requests.get(url)
-        # If the response was successful, no exception will be raised
-        r.raise_for_status()
-    except HTTPError as http_err:
-        raise http_err
+def parse_batting_game_data(content, team_code, year):
+    return transform_batting_game_data(read_batting_game_table(content), team_code, year)
 
-    # Retrieve Batting Table from XML page and put into a DataFrame
-    soup = BeautifulSoup(r.content, "lxml")
-    table = soup.find('table', attrs=dict(id='team_batting_gamelogs'))
-    data = pd.read_html(str(table))[0]
+def transform_batting_game_data(data, team_code, year):
+    team_id = team_id_dict[team_code]
 
     #   Rename some of the columns
     data.rename(columns={'Unnamed: 3':'HomeAway',
@@ -111,9 +142,6 @@ def insert_batting_game_data(conn, team_code, year):
                         'Opp':'opp_id',
                         'Date': 'game_date'}, inplace=True)
 
-    #   Drop place holder rows 
-    data.drop(data[data.OBP == 'OBP'].index, inplace=True)
-
     #   Fix Home/Away column values
     data.replace({'HomeAway': {'@':'A'}}, inplace=True)
     data.HomeAway.fillna('H', inplace=True)
@@ -122,59 +150,43 @@ def insert_batting_game_data(conn, team_code, year):
     data[['Result', 'RunsAgainst']] = data.Rslt.str.split(',', expand=True)
     data.RunsAgainst = data.RunsAgainst.str.split('-').str[1]
 
-    #   Fix Date column for double headers and made it SQLite compatible
-    data.game_date = data.game_date.str.encode('ascii', 'ignore').str.decode('ascii').str.strip()
-    data.game_date = data.game_date.str.replace('susp', '')
-    data.game_date = data.game_date.str.split('(').str[0] + str(year)
-    data.game_date = data.game_date.str.replace(' ', '')
-    data.game_date = data.game_date.apply(lambda x: datetime.strptime(x, '%b%d%Y').strftime('%Y-%m-%d'))
+    data.game_date = parse_game_dates(data.game_date, year)
     data['season'] = year
 
     #   Generate unique game id for each game and make it the index (home/away independent)
-    game_ids = [data.game_date.iloc[i] + ((data.opp_id.iloc[i] + data.RunsAgainst.iloc[i] + team_code + data.R.iloc[i]) if data.HomeAway.iloc[i] == 'H' else (team_code + data.R.iloc[i] + data.opp_id.iloc[i] + data.RunsAgainst.iloc[i])) for i in range(len(data.index))]
-    game_ids = [int(hashlib.sha256(s.encode('utf-8')).hexdigest(), 16) % sql_max_int for s in game_ids]
-    data['game_id'] = game_ids
+    data['game_id'] = game_ids(data, team_code, data.R, data.RunsAgainst)
 
     # Add team ids
     data['team_id'] = team_id
-    data.opp_id = data.opp_id.apply(lambda x: team_id_dict[x])
+    data.opp_id = data.opp_id.map(team_id_dict)
 
-    #   Drop unneccessary columns and reorder the remains
-    data.drop(columns=['Rslt', 'Rk', 'Gtm', '#', 'Opp. Starter (GmeSc)'], inplace=True)
+    #   Keep only the needed columns, in table order
     data = data[['game_id', 'team_id', 'opp_id', 'game_date', 'season', 'HomeAway', 'OppStarterThr', 'Result', 'RunsAgainst', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'BB',
                 'IBB', 'SO', 'HBP', 'SH', 'SF', 'ROE', 'GDP', 'SB', 'CS', 'LOB', 'BA', 'OBP', 'SLG', 'OPS']]
-                
-    #   Convert numeric columns to numeric types
-    data = data.copy()
-    data.loc[:, 'RunsAgainst':] = data.loc[:, 'RunsAgainst':].apply(pd.to_numeric)
+
+    #   RunsAgainst comes from the result text, the other stat columns are already numeric
+    data.RunsAgainst = pd.to_numeric(data.RunsAgainst)
 
     data.set_index(['game_id','team_id'], inplace=True)
+    return data
 
-    try:
-        data.to_sql('TeamBattingGame', conn, if_exists='append')
-    except sqlite3.IntegrityError:
-        return True
-    except Exception as e:
-        db_error_cleanup(conn, e)
-        return False
+def write_batting_game_data(conn, data, stage):
+    return write_game_data(conn, 'TeamBattingGame', data, stage)
+
+def insert_batting_game_data(conn, team_code, year):
+    content = fetch_page(gamelog_url(team_code, year, 'b'))
+    load_payload(conn, write_batting_game_data, parse_batting_game_data(content, team_code, year))
     return True
 
-def insert_pitching_game_data(conn, team_code, year):
-    team_id = team_id_dict[team_code]
+def read_pitching_game_table(content):
+    # Retrieve Pitching Table from XML page and put into a DataFrame (repeated header rows are skipped)
+    return extract_table(content, 'team_pitching_gamelogs')
 
-    # Retrieve team batting data from Baseball Reference
-    url = f'https://www.baseball-reference.com/teams/tgl.cgi?team={team_code}&t=p&year={year}'
-    try:
-        r = requests.get(url)
-        # If the response was successful, no exception will be raised
-        r.raise_for_status()
-    except HTTPError as http_err:
-        raise http_err
+def parse_pitching_game_data(content, team_code, year):
+    return transform_pitching_game_data(read_pitching_game_table(content), team_code, year)
 
-    # Retrieve Batting Table from XML page and put into a DataFrame
-    soup = BeautifulSoup(r.content, "lxml")
-    table = soup.find('table', attrs=dict(id='team_pitching_gamelogs'))
-    data = pd.read_html(str(table))[0]
+def transform_pitching_game_data(data, team_code, year):
+    team_id = team_id_dict[team_code]
 
     #   Rename some of the columns
     data.rename(columns={'Unnamed: 3':'HomeAway',
@@ -184,9 +196,6 @@ def insert_pitching_game_data(conn, team_code, year):
                         'Str': 'Strikes',
                         'Date': 'game_date'}, inplace=True)
 
-    #   Drop place holder rows 
-    data.drop(data[data.ERA == 'ERA'].index, inplace=True)
-
     #   Fix Home/Away column values
     data.replace({'HomeAway': {'@':'A'}}, inplace=True)
     data.HomeAway.fillna('H', inplace=True)
@@ -195,81 +204,51 @@ def insert_pitching_game_data(conn, team_code, year):
     data[['Result', 'RunsFor']] = data.Rslt.str.split(',', expand=True)
     data.RunsFor = data.RunsFor.str.split('-').str[0]
 
-    #   Fix Date column for double headers and made it SQLite compatible
-    data.game_date = data.game_date.str.encode('ascii', 'ignore').str.decode('ascii').str.strip()
-    data.game_date = data.game_date.str.replace('susp', '')
-    data.game_date = data.game_date.str.split('(').str[0] + str(year)
-    data.game_date = data.game_date.str.replace(' ', '')
-    data.game_date = data.game_date.apply(lambda x: datetime.strptime(x, '%b%d%Y').strftime('%Y-%m-%d'))
+    data.game_date = parse_game_dates(data.game_date, year)
     data['season'] = year
 
     #   Generate unique game id for each game (home/away independent) and make it the index
-    game_ids = [data.game_date.iloc[i] + ((data.opp_id.iloc[i] + data.R.iloc[i] + team_code + data.RunsFor.iloc[i]) if data.HomeAway.iloc[i] == 'H' else (team_code + data.RunsFor.iloc[i] + data.opp_id.iloc[i] + data.R.iloc[i])) for i in range(len(data.index))]
-    game_ids = [int(hashlib.sha256(s.encode('utf-8')).hexdigest(), 16) % sql_max_int for s in game_ids]
-    data['game_id'] = game_ids
+    data['game_id'] = game_ids(data, team_code, data.RunsFor, data.R)
 
     # Add team ids
     data['team_id'] = team_id
-    data.opp_id = data.opp_id.apply(lambda x: team_id_dict[x])
+    data.opp_id = data.opp_id.map(team_id_dict)
 
-    #   Drop unneccessary columns and reorder the remains
-    data.drop(columns=['Rslt', 'Rk', 'Gtm', 'Umpire', 'Pitchers Used (Rest-GameScore-Dec)'], inplace=True)
+    #   Keep only the needed columns, in table order
     data = data[['game_id', 'team_id', 'opp_id', 'game_date', 'season', 'HomeAway', 'Result', 'RunsFor', 'H', 'R', 'ER', 'UER', 'BB', 'SO', 'HR', 'HBP', 'BF', 'Pitches', 'Strikes', 'IR',
             'IS', 'SB', 'CS', 'AB', '2B', '3B', 'IBB', 'SH', 'SF', 'ROE', 'GDP', 'PitchersUsed', 'IP', 'ERA']]
-                
-    #   Convert numeric columns to numeric types
-    data.loc[:, 'RunsFor':] = data.loc[:, 'RunsFor':].apply(pd.to_numeric)
+
+    #   RunsFor comes from the result text, the other stat columns are already numeric
+    data.RunsFor = pd.to_numeric(data.RunsFor)
 
     data.set_index(['game_id','team_id'], inplace=True)
+    return data
 
-    try:
-        data.to_sql('TeamPitchingGame', conn, if_exists='append')
-    except sqlite3.IntegrityError:
-        return True
-    except Exception as e:
-        db_error_cleanup(conn, e)
-        return False
+def write_pitching_game_data(conn, data, stage):
+    return write_game_data(conn, 'TeamPitchingGame', data, stage)
+
+def insert_pitching_game_data(conn, team_code, year):
+    content = fetch_page(gamelog_url(team_code, year, 'p'))
+    load_payload(conn, write_pitching_game_data, parse_pitching_game_data(content, team_code, year))
     return True
 
-def insert_batting_season_data(conn, team_code, year):
+def parse_batting_season_data(content, team_code, year):
     team_id = team_id_dict[team_code]
 
-    # Retrieve team batting data from Baseball Reference
-    url = f'https://www.baseball-reference.com/teams/{team_code}/{year}-batting.shtml'
-    try:
-        r = requests.get(url)
-        # If the response was successful, no exception will be raised
-        r.raise_for_status()
-    except HTTPError as http_err:
-        raise http_err
-
-    # Retrieve Batting Table from XML page and put into a DataFrame
-    soup = BeautifulSoup(r.content, "lxml")
-    table = soup.find('table', attrs=dict(id='team_batting'))
-    data = pd.read_html(str(table))[0]
+    # Retrieve Batting Table from XML page and put into a DataFrame, player ids come with it (player_id column)
+    data = extract_table(content, 'team_batting', include_footer=True)
 
     #   Get team's overall stats for the season
     team_batting_data = data.loc[data['Name'] == 'Team Totals'].copy()
-    team_batting_data.drop(columns=['Rk', 'Pos', 'Name', 'OPS+'], inplace=True)
+    team_batting_data.drop(columns=['player_id', 'Rk', 'Pos', 'Name', 'OPS+'], inplace=True)
     team_batting_data = list(pd.to_numeric(team_batting_data.iloc[0]).round(3))
 
-    #   Drop place holder rows 
-    data.drop(data[data.OBP == 'OBP'].index, inplace=True)
-    data.dropna(axis=0, subset=['Rk'], inplace=True)
+    #   Drop footer rows
+    data = data.dropna(subset=['Rk'])
 
     #   Remove players with no at bats
-    data.fillna('0', inplace=True)
-    data = data[data.AB != '0']
-
-    #   Add player ids
-    player_elements = table.findAll('td', attrs={'data-stat':'player'})
-    player_ids = {}
-    for row in player_elements:
-        player_id = row.get('data-append-csv', None)
-        if player_id is None:
-            continue
-        player_ids[row.get_text()] = player_id
-    data.insert(0, 'player_id', data.Name.map(player_ids))
+    data = data[data.AB.fillna(0) != 0].fillna(0)
+
     data.insert(1, 'season', year)
     data.insert(2, 'team_id', team_id)
 
@@ -283,74 +262,49 @@ def insert_batting_season_data(conn, team_code, year):
 
     #   Drop unneccessary columns and reorder the remains
     data.drop(columns=['Rk', 'Name', 'Pos', 'OPS+'], inplace=True)
-                
-    #   Convert numeric columns to numeric types
-    data.loc['Age':] = data.loc['Age':].apply(pd.to_numeric)
 
     data.set_index(['player_id', 'season', 'team_id'], inplace=True)
+    return players, data, [team_id, year, *team_batting_data]
 
-    # Insert players into Players table if they're not already there
-    query = 'INSERT INTO Batters (id, Name, Pos, Handedness) VALUES (?,?,?,?)'
-    for i,row in players.iterrows():
-        try:
-            conn.execute(query, (i, *row))
-        except sqlite3.IntegrityError:
-            print(f'\t\t\tPlayer already inserted: {row[0]}')
+def write_batting_season_data(conn, season_data, stage):
+    players, data, team_batting_data = season_data
 
-    try:
-        # Insert player and team's season batting data
-        data.to_sql('PlayerBattingSeason', conn, if_exists='append')
-        query = 'INSERT INTO TeamBattingSeason (team_id, season, Age, G, PA, AB, R, H, "2B", "3B", HR, RBI, SB, CS, BB, SO, BA, OBP, SLG, OPS, TB, GDP, HBP, SH, SF, IBB) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'
-        conn.execute(query, (team_id, year, *team_batting_data))
-    except sqlite3.IntegrityError:
-        return True
-    except Exception as e:
-        db_error_cleanup(conn, e)
-        return False
+    # Insert players into Batters table if they're not already there
+    stage.insert_new_frame('Batters', players.rename_axis('id'))
+
+    # Upsert player and team's season batting data
+    rows = stage.upsert_frame('PlayerBattingSeason', data, ['player_id', 'season', 'team_id'])
+    columns = ['team_id', 'season', 'Age', 'G', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'BA', 'OBP', 'SLG', 'OPS', 'TB', 'GDP', 'HBP', 'SH', 'SF', 'IBB']
+    rows += stage.upsert('TeamBattingSeason', columns, [team_batting_data], ['team_id', 'season'])
+    set_watermark(conn, team_batting_data[0], team_batting_data[1], 'PlayerBattingSeason')
+    return rows
+
+def insert_batting_season_data(conn, team_code, year):
+    content = fetch_page(season_url(team_code, year, 'b'))
+    load_payload(conn, write_batting_season_data, parse_batting_season_data(content, team_code, year))
     return True
 
-def insert_pitching_season_data(conn, team_code, year):
+def parse_pitching_season_data(content, team_code, year):
     team_id = team_id_dict[team_code]
 
-    # Retrieve team batting data from Baseball Reference
-    url = f'https://www.baseball-reference.com/teams/{team_code}/{year}-pitching.shtml'
-    try:
-        r = requests.get(url)
-        # If the response was successful, no exception will be raised
-        r.raise_for_status()
-    except HTTPError as http_err:
-        raise http_err
-
-    # Retrieve Batting Table from XML page and put into a DataFrame
-    soup = BeautifulSoup(r.content, "lxml")
-    table = soup.find('table', attrs=dict(id='team_pitching'))
-    data = pd.read_html(str(table))[0]
+    # Retrieve Pitching Table from XML page and put into a DataFrame, player ids come with it (player_id column)
+    data = extract_table(content, 'team_pitching', include_footer=True)
 
     #   Get team's overall stats for the season
     team_pitching_data = data.loc[data['Name'] == 'Team Totals'].copy()
-    team_pitching_data.drop(columns=['Rk', 'Pos', 'Name', 'SO/W', 'ERA+', 'W', 'L', 'W-L%'], inplace=True)
+    team_pitching_data.drop(columns=['player_id', 'Rk', 'Pos', 'Name', 'SO/W', 'ERA+', 'W', 'L', 'W-L%'], inplace=True)
     team_pitching_data = list(pd.to_numeric(team_pitching_data.iloc[0]).round(3))
 
     #   Rename some of the columns
     data.rename(columns={'W':'wins',
                         'L':'losses'}, inplace=True)
 
-    #   Drop place holder rows 
-    data.drop(data[data.ERA == 'ERA'].index, inplace=True)
-    data.dropna(axis=0, subset=['Rk'], inplace=True)
+    #   Drop footer rows
+    data = data.dropna(subset=['Rk'])
 
     #   Fill NaN win-loss %
-    data.fillna(.000, inplace=True)
-
-    #   Add player ids
-    player_elements = table.findAll('td', attrs={'data-stat':'player'})
-    player_ids = {}
-    for row in player_elements:
-        player_id = row.get('data-append-csv', None)
-        if player_id is None:
-            continue
-        player_ids[row.get_text()] = player_id
-    data.insert(0, 'player_id', data.Name.map(player_ids))
+    data = data.fillna(.000)
+
     data.insert(1, 'season', year)
     data.insert(2, 'team_id', team_id)
 
@@ -364,45 +318,235 @@ def insert_pitching_season_data(conn, team_code, year):
 
     #   Drop unneccessary columns and reorder the remains
     data.drop(columns=['Rk', 'Name', 'Pos', 'W-L%', 'SO/W', 'ERA+'], inplace=True)
-                
-    #   Convert numeric columns to numeric types
-    data.loc['Age':] = data.loc['Age':].apply(pd.to_numeric)
 
     data.set_index(['player_id', 'season', 'team_id'], inplace=True)
+    return players, data, [team_id, year, *team_pitching_data]
 
-    # Insert players into Players table if they're not already there
-    query = 'INSERT INTO Pitchers (id, Name, Handedness) VALUES (?,?,?)'
-    for i,row in players.iterrows():
-        try:
-            conn.execute(query, (i, *row))
-        except sqlite3.IntegrityError:
-            print(f'\t\t\tPlayer already inserted: {row[0]}')
+def write_pitching_season_data(conn, season_data, stage):
+    players, data, team_pitching_data = season_data
 
-    try:
-        # Insert player and team's season pitching data
-        data.to_sql('PlayerPitchingSeason', conn, if_exists='append')
-        query = 'INSERT INTO TeamPitchingSeason (team_id, season, Age, ERA, G, GS, GF, CG, SHO, SV, IP, H, R, ER, HR, BB, IBB, SO, HBP, BK, WP, BF, FIP, WHIP, H9, HR9, BB9, SO9) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)'
-        conn.execute(query, (team_id, year, *team_pitching_data))
-    except sqlite3.IntegrityError:
-        return True
-    except Exception as e:
-        db_error_cleanup(conn, e)
-        return False
-    return True
+    # Insert players into Pitchers table if they're not already there
+    stage.insert_new_frame('Pitchers', players.rename_axis('id'))
+
+    # Upsert player and team's season pitching data
+    rows = stage.upsert_frame('PlayerPitchingSeason', data, ['player_id', 'season', 'team_id'])
+    columns = ['team_id', 'season', 'Age', 'ERA', 'G', 'GS', 'GF', 'CG', 'SHO', 'SV', 'IP', 'H', 'R', 'ER', 'HR', 'BB', 'IBB', 'SO', 'HBP', 'BK', 'WP', 'BF', 'FIP', 'WHIP', 'H9', 'HR9', 'BB9', 'SO9']
+    rows += stage.upsert('TeamPitchingSeason', columns, [team_pitching_data], ['team_id', 'season'])
+    set_watermark(conn, team_pitching_data[0], team_pitching_data[1], 'PlayerPitchingSeason')
+    return rows
 
+def insert_pitching_season_data(conn, team_code, year):
+    content = fetch_page(season_url(team_code, year, 'p'))
+    load_payload(conn, write_pitching_season_data, parse_pitching_season_data(content, team_code, year))
+    return True
 
-def populate_db():
-    with db_setup() as conn:
-        new_db(conn)
-        for team in team_codes:
-            print(team)
-            for year in range(2020, 2011, -1):
-                print('\t', year)
-                insert_team_data(conn, team, year)
-                insert_batting_game_data(conn, team, year)
-                insert_pitching_game_data(conn, team, year)
-                insert_batting_season_data(conn, team, year)
-                insert_pitching_season_data(conn, team, year)
+# Table each writer records its watermark under
+watermark_tables = {
+    write_team_data: 'TeamSeason',
+    write_batting_game_data: 'TeamBattingGame',
+    write_pitching_game_data: 'TeamPitchingGame',
+    write_batting_season_data: 'PlayerBattingSeason',
+    write_pitching_season_data: 'PlayerPitchingSeason',
+}
+
+# Tables each writer fills for its team season, cleared before the unit is reloaded so rows the site dropped don't linger
+unit_tables = {
+    write_team_data: ['TeamSeason'],
+    write_batting_game_data: ['TeamBattingGame'],
+    write_pitching_game_data: ['TeamPitchingGame'],
+    write_batting_season_data: ['PlayerBattingSeason', 'TeamBattingSeason'],
+    write_pitching_season_data: ['PlayerPitchingSeason', 'TeamPitchingSeason'],
+}
+
+def season_jobs(team_code, year):
+    # Every (url, parser, writer) needed to load one team season
+    # insert_team_data and insert_batting_game_data read the same gamelog page, the pipeline only fetches it once
+    return [
+        (gamelog_url(team_code, year, 'b'), parse_team_data, write_team_data),
+        (gamelog_url(team_code, year, 'b'), parse_batting_game_data, write_batting_game_data),
+        (gamelog_url(team_code, year, 'p'), parse_pitching_game_data, write_pitching_game_data),
+        (season_url(team_code, year, 'b'), parse_batting_season_data, write_batting_season_data),
+        (season_url(team_code, year, 'p'), parse_pitching_season_data, write_pitching_season_data),
+    ]
+
+def has_tables(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='TeamSeason'").fetchone() is not None
+
+def unit_writer(writer, team_id, year, replace, started, url):
+    # The writer of one (team, season, table) unit, marking its LoadJob done in the same transaction as its rows
+    # replace clears what an earlier load left of the unit first, started holds when each url was requested
+    table = watermark_tables[writer]
+    def write(conn, payload, stage):
+        if replace:
+            clear_unit(conn, stage, team_id, year, table, unit_tables[writer])
+        rows = writer(conn, payload, stage)
+        finish_job(conn, team_id, year, table, rows, started.get(url))
+        return rows
+    write.__name__ = writer.__name__
+    write.unit = (team_id, year, table)
+    return write
+
+def unit_failed(conn, writer, args, e):
+    fail_job(conn, *writer.unit, repr(e))
+
+def finish_load():
+    # Rebuild the leaderboard/summary tables, then invalidate the app's cached queries now that the load succeeded
+    conn = db_setup()
+    build_aggregates(conn)
+    with conn:
+        bump_data_version(conn)
+    conn.close()
+
+def bulk_load_conn():
+    # Writer connection for populate_db: no fsync per commit, a killed load keeps every committed unit and resumes
+    # from there, only an OS crash or power loss could cost the database
+    conn = db_setup()
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+def populate_db(teams=team_codes, years=seasons, fetch_workers=4, parse_workers=2, requests_per_minute=default_requests_per_minute,
+        use_cache=True, offline=False, restart=False):
+    # Checkpointed load of every (team, season, table) unit of teams and years, tracked in LoadJob
+    # Units already done are skipped, so a load that died halfway picks up where it stopped. Once nothing is left over
+    # (or with restart) the whole selection is loaded again: from an empty database when that's every team and season,
+    # otherwise in place, keeping the rest of the database
+    selection = [(team, year, url, parser, writer) for year in years for team in teams for url,parser,writer in season_jobs(team, year)]
+    unit = lambda team, year, writer: (team_id_dict[team], year, watermark_tables[writer])
+    conn = db_setup()
+    with conn:
+        if has_tables(conn):
+            migrate_db(conn)
+            done = done_jobs(conn)
+        else:
+            done = None
+        todo = [job for job in selection if done is not None and unit(job[0], job[1], job[4]) not in done]
+        if done is None or restart or not todo:
+            todo = selection
+        fresh = done is None or (todo is selection and set(teams) == set(team_codes) and set(years) == set(seasons))
+        if fresh:
+            new_db(conn)
+        start_jobs(conn, [unit(team, year, writer) for team,year,_,_,writer in todo])
+    conn.close()
+    if fresh:
+        print(f'Loading {len(todo)} units into an empty database')
+    elif todo is selection:
+        print(f'Reloading {len(todo)} units')
+    else:
+        print(f'Resuming: {len(selection) - len(todo)} of {len(selection)} units already loaded, {len(todo)} to go')
+
+    # Pages cached after their season ended are served from the page cache, so a rebuild mostly goes to the network for the current season
+    # Only requests that go to the network take a token from the client's bucket, cache hits aren't held back
+    client = FetchClient(requests_per_minute=requests_per_minute, connections=fetch_workers)
+    cache = PageCache(client, offline=offline) if use_cache or offline else None
+    fetch = cache.fetch if cache is not None else client.fetch
+    started = {}
+    def timed_fetch(url):
+        started[url] = time.time()
+        return fetch(url)
+
+    # Season by season, so the write batches hold whole seasons of every team
+    jobs = [(url, parser, unit_writer(writer, team_id_dict[team], year, not fresh, started, url), (team, year))
+        for team,year,url,parser,writer in todo]
+    try:
+        run_pipeline(jobs, timed_fetch, bulk_load_conn, RowStage(),
+            fetch_workers=fetch_workers,
+            parse_workers=parse_workers,
+            on_error=unit_failed)
+    finally:
+        client.close()
+
+    conn = db_setup()
+    done = done_jobs(conn)
+    conn.close()
+    left = sum(unit(team, year, writer) not in done for team,year,_,_,writer in selection)
+    if left:
+        print(f'{left} units not loaded (see LoadJob), run again to retry just those')
+    finish_load()
+    if cache is not None:
+        cache.report()
+    client.report()
+
+def sync_seasons_default():
+    # The last rebuilt season up to the one being played, which is the one a nightly sync is for
+    return list(range(datetime.now().year, max(seasons) - 1, -1))
+
+def sync_db(teams=team_codes, sync_seasons=None, fetch_workers=4, parse_workers=2, requests_per_minute=default_requests_per_minute, use_cache=True):
+    # Incremental load: keep what's already in baseball.db and only upsert what's newer than each table's watermark
+    sync_seasons = sync_seasons or sync_seasons_default()
+    conn = db_setup()
+    with conn:
+        if not has_tables(conn):
+            new_db(conn)
+        migrate_db(conn)
+        watermarks = {(team_id, season, table): loaded_at for team_id,season,table,loaded_at in
+            conn.execute('SELECT team_id, season, table_name, loaded_at FROM LoadWatermark')}
+    conn.close()
+
+    jobs = []
+    loaded_urls = {}
+    for team in teams:
+        team_id = team_id_dict[team]
+        for year in sync_seasons:
+            units = season_jobs(team, year)
+            loaded_at = [watermarks.get((team_id, year, watermark_tables[writer])) for _,_,writer in units]
+            # A season loaded after the year it was played in is final, skip it without fetching anything
+            if all(t is not None and t >= f'{year + 1}-01-01' for t in loaded_at):
+                continue
+            # Once the season is over its pages are parsed even if the cached copy is still current, so the watermarks
+            # get past the season's end and the next sync skips it
+            over = datetime.now() >= datetime(year + 1, 1, 1)
+            for (url, parser, writer), t in zip(units, loaded_at):
+                jobs.append((url, parser, writer, (team, year)))
+                loaded_urls[url] = loaded_urls.get(url, True) and t is not None and not over
+    if not jobs:
+        print('Everything is up to date')
+        return
+
+    client = FetchClient(requests_per_minute=requests_per_minute, connections=fetch_workers)
+    if use_cache:
+        cache = PageCache(client)
+        # Pages whose tables are all loaded only need parsing if the page itself changed
+        fetch = lambda url: cache.fetch_changed(url) if loaded_urls[url] else cache.fetch(url)
+    else:
+        cache, fetch = None, client.fetch
+    try:
+        run_pipeline(jobs, fetch, db_setup, RowStage(),
+            fetch_workers=fetch_workers,
+            parse_workers=parse_workers)
+    finally:
+        client.close()
+    finish_load()
+    if cache is not None:
+        cache.report()
+    client.report()
 
 if __name__=='__main__':
-    populate_db()
+    parser = argparse.ArgumentParser(description='Scrape Baseball Reference into baseball.db')
+    parser.add_argument('--teams', nargs='+', choices=team_codes, default=team_codes, metavar='TEAM', help='team codes to load (default: all of them)')
+    parser.add_argument('--seasons', nargs='+', type=int, metavar='YEAR',
+        help=f'seasons to load (default: {seasons[-1]}-{seasons[0]}, with --sync {seasons[0]} to the current season)')
+    parser.add_argument('--workers', type=int, default=4, help='number of concurrent page fetchers')
+    parser.add_argument('--rpm', type=float, default=default_requests_per_minute, help='requests per minute to the site, over all fetchers (default: BB_REQUESTS_PER_MINUTE or 20)')
+    parser.add_argument('--no-cache', action='store_true', help='always download pages instead of using the page cache')
+    parser.add_argument('--offline', action='store_true', help='rebuild from the page cache only, without network access')
+    parser.add_argument('--restart', action='store_true', help='reload every selected unit instead of resuming the ones an earlier load left unfinished')
+    parser.add_argument('--sync', action='store_true', help='incrementally update the existing database instead of rebuilding it')
+    parser.add_argument('--migrate', action='store_true', help='only apply schema migrations (indexes, load tables) to the existing database')
+    parser.add_argument('--aggregates', action='store_true', help='only rebuild the aggregate tables of the existing database')
+    parser.add_argument('--parquet', action='store_true', help='export every table to Parquet afterwards (db_scripts/parquet_export.py, needs pyarrow)')
+    args = parser.parse_args()
+    if args.migrate:
+        conn = db_setup()
+        with conn:
+            migrate_db(conn)
+        conn.close()
+    elif args.aggregates:
+        finish_load()
+    elif args.sync:
+        sync_db(args.teams, args.seasons, fetch_workers=args.workers, requests_per_minute=args.rpm, use_cache=not args.no_cache)
+    else:
+        populate_db(args.teams, args.seasons or seasons, fetch_workers=args.workers, requests_per_minute=args.rpm, use_cache=not args.no_cache,
+            offline=args.offline, restart=args.restart)
+    if args.parquet:
+        from db_scripts.parquet_export import export
+        export()
@@ -0,0 +1,212 @@
+import time
+import pandas as pd
+import numpy as np
+
+# Materialized summary tables, rebuilt from the loaded tables after every data_insert load (data_insert.finish_load)
+# League*Season: league and division totals per season (plus 'All' division and 'MLB' rollups), rates recomputed from the totals
+# Player*Rank: per season percentile rank (0-1, higher is better) of every numeric stat across all teams, rate stats only
+#   rank qualified players (3.1 PA / 1 IP per team game) and are NULL for everyone else
+# TeamGameTrend: every team's season-to-date and rolling_games batting lines after each game (the Leaders page's run
+#   differential trend), computed by team_lines, which the time series tabs also use live for any window (db_scripts/time_series.py)
+# Everything is built under a _new name and swapped in with one transaction, so the app never sees a half built table
+
+rolling_games = 10
+key_columns = ['player_id', 'season', 'team_id']
+
+batting_sum_columns = ['G', 'PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'TB', 'GDP', 'HBP', 'SH', 'SF', 'IBB']
+pitching_sum_columns = ['G', 'GS', 'GF', 'CG', 'SHO', 'SV', 'H', 'R', 'ER', 'HR', 'BB', 'IBB', 'SO', 'HBP', 'BK', 'WP', 'BF']
+batting_rate_stats = ['BA', 'OBP', 'SLG', 'OPS']
+pitching_rate_stats = ['ERA', 'FIP', 'WHIP', 'H9', 'HR9', 'BB9', 'SO9']
+# Everything else ranks higher values as better
+lower_is_better = {
+    'b': {'SO', 'CS', 'GDP'},
+    'p': {'losses', 'ERA', 'H', 'R', 'ER', 'HR', 'BB', 'IBB', 'HBP', 'BK', 'WP', 'FIP', 'WHIP', 'H9', 'HR9', 'BB9'},
+}
+
+aggregate_indexes = [
+    'CREATE INDEX IF NOT EXISTS idx_LeagueBattingSeason_season ON LeagueBattingSeason (season, league, division)',
+    'CREATE INDEX IF NOT EXISTS idx_LeaguePitchingSeason_season ON LeaguePitchingSeason (season, league, division)',
+    'CREATE INDEX IF NOT EXISTS idx_PlayerBattingRank_season_team ON PlayerBattingRank (season, team_id)',
+    'CREATE INDEX IF NOT EXISTS idx_PlayerPitchingRank_season_team ON PlayerPitchingRank (season, team_id)',
+    'CREATE INDEX IF NOT EXISTS idx_TeamGameTrend_season_team ON TeamGameTrend (season, mode, team_id)',
+]
+
+# Team lines: game counts summed over the season or a window, rates recomputed from the sums
+count_columns = {
+    'b': ['PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'BB', 'IBB', 'SO', 'HBP', 'SH', 'SF', 'ROE', 'GDP', 'SB', 'CS', 'LOB', 'RunsAgainst'],
+    'p': ['H', 'R', 'ER', 'UER', 'BB', 'SO', 'HR', 'HBP', 'BF', 'Pitches', 'Strikes', 'IR', 'IS', 'SB', 'CS', 'AB', '2B', '3B', 'IBB', 'SH', 'SF', 'ROE', 'GDP', 'RunsFor', 'innings'],
+}
+rate_stats = {
+    'b': ['BA', 'OBP', 'SLG', 'OPS'],
+    'p': ['IP', 'ERA', 'WHIP', 'H9', 'HR9', 'BB9', 'SO9'],
+}
+modes = ['cumulative', 'rolling']
+
+def innings(ip):
+    # Baseball Reference IP is whole innings plus outs after the point (6.2 is 6 2/3)
+    whole = np.floor(ip)
+    return whole + np.round((ip - whole) * 10) / 3
+
+def innings_pitched(true_innings):
+    outs = np.round(true_innings * 3)
+    return outs // 3 + (outs % 3) / 10
+
+def ratio(numerator, denominator):
+    return (numerator / denominator.replace(0, np.nan)).round(3)
+
+def batting_rates(df):
+    df['BA'] = ratio(df.H, df.AB)
+    df['OBP'] = ratio(df.H + df.BB + df.HBP, df.AB + df.BB + df.HBP + df.SF)
+    df['SLG'] = ratio(df.TB, df.AB)
+    df['OPS'] = (df.OBP + df.SLG).round(3)
+    return df
+
+def pitching_rates(df, true_innings):
+    df['IP'] = innings_pitched(true_innings)
+    df['ERA'] = ratio(9 * df.ER, true_innings)
+    df['WHIP'] = ratio(df.BB + df.H, true_innings)
+    for stat, column in [('H9', 'H'), ('HR9', 'HR'), ('BB9', 'BB'), ('SO9', 'SO')]:
+        df[stat] = ratio(9 * df[column], true_innings)
+    return df
+
+def prepare_games(games, table_type):
+    # Gamelog rows with their counts as numbers (and true innings for pitching)
+    if table_type == 'p':
+        games['innings'] = innings(pd.to_numeric(games.IP))
+    for column in count_columns[table_type]:
+        games[column] = pd.to_numeric(games[column])
+    return games
+
+def running_sums(games, table_type):
+    # Every team's season-to-date counts after each game, games are one season's in play order
+    return games.groupby('team_id', sort=False)[count_columns[table_type]].cumsum()
+
+def team_lines(games, cum, table_type, mode, size):
+    # Team, game_date, counting stats and rates after each game; counts are season totals (cumulative) or per game
+    # averages over the last size games (rolling), an N game window is cum[i] - cum[i-N]
+    counts = count_columns[table_type]
+    game_number = games.groupby('team_id', sort=False).cumcount() + 1
+    if mode == 'rolling':
+        lagged = cum.groupby(games.team_id, sort=False).shift(size).fillna(0)
+        totals = cum - lagged
+        played = np.minimum(game_number, size)
+    else:
+        totals = cum
+        played = game_number
+
+    rates = totals.copy()
+    if table_type == 'b':
+        rates['TB'] = rates.H + rates['2B'] + 2 * rates['3B'] + 3 * rates.HR
+        rates = batting_rates(rates)
+        run_diff = totals.R - totals.RunsAgainst
+    else:
+        rates = pitching_rates(rates, rates.innings)
+        run_diff = totals.RunsFor - totals.R
+
+    df = games[['Team', 'game_date']].copy()
+    df['Games'] = game_number
+    shown = [col for col in counts if col != 'innings']
+    per_game = totals[shown].div(played, axis=0).round(2) if mode == 'rolling' else totals[shown]
+    df = pd.concat([df, per_game, rates[rate_stats[table_type]]], axis=1)
+    df['Run Differential'] = (run_diff / played).round(2) if mode == 'rolling' else run_diff
+    return df
+
+def league_rollups(df, teams, sum_columns):
+    # Division, league ('All' division) and MLB rows for every season
+    df = df.merge(teams, left_on='team_id', right_on='id')
+    for column in sum_columns + ['Age']:
+        df[column] = pd.to_numeric(df[column])
+    levels = [df, df.assign(division='All'), df.assign(league='MLB', division='All')]
+    keys = ['season', 'league', 'division']
+    frames = []
+    for level in levels:
+        grouped = level.groupby(keys)
+        totals = grouped[sum_columns].sum()
+        totals.insert(0, 'teams', grouped.size())
+        totals.insert(1, 'Age', grouped.Age.mean().round(1))
+        frames.append(totals)
+    return frames
+
+def league_batting(conn, teams):
+    df = pd.read_sql_query('SELECT * FROM TeamBattingSeason', conn)
+    frames = []
+    for totals in league_rollups(df, teams, batting_sum_columns):
+        frames.append(batting_rates(totals))
+    return pd.concat(frames).reset_index()
+
+def league_pitching(conn, teams):
+    df = pd.read_sql_query('SELECT * FROM TeamPitchingSeason', conn)
+    df['innings'] = innings(df.IP)
+    df['fip_innings'] = df.FIP * df.innings
+    frames = []
+    for totals in league_rollups(df, teams, pitching_sum_columns + ['innings', 'fip_innings']):
+        totals = pitching_rates(totals, totals.innings)
+        # FIP's constant is league specific, so the team values are combined weighted by innings
+        totals['FIP'] = ratio(totals.fip_innings, totals.innings)
+        frames.append(totals.drop(columns=['innings', 'fip_innings']))
+    return pd.concat(frames).reset_index()
+
+def percent_ranks(df, table_type, rate_stats, qualified):
+    ranks = df[key_columns].copy()
+    seasons = df.season
+    for stat in df.columns.drop(key_columns):
+        values = pd.to_numeric(df[stat], errors='coerce')
+        if stat in rate_stats:
+            values = values.where(qualified)
+        ranks[stat] = values.groupby(seasons).rank(pct=True, ascending=stat not in lower_is_better[table_type]).round(3)
+    return ranks
+
+def player_ranks(conn, table_type):
+    table = 'PlayerBattingSeason' if table_type == 'b' else 'PlayerPitchingSeason'
+    df = pd.read_sql_query(f'SELECT * FROM {table}', conn)
+    team_games = pd.read_sql_query('SELECT team_id, season, wins + losses team_games FROM TeamSeason', conn)
+    games = df.merge(team_games, on=['team_id', 'season'], how='left').team_games
+    if table_type == 'b':
+        return percent_ranks(df, 'b', batting_rate_stats, df.PA >= 3.1 * games)
+    return percent_ranks(df, 'p', pitching_rate_stats, innings(df.IP) >= games)
+
+def team_game_trends(conn):
+    # Both modes of team_lines for every team's batting games, one season at a time (rowid breaks double header ties)
+    df = pd.read_sql_query('''
+        SELECT t.team_code Team, g.*
+        FROM Teams t JOIN TeamBattingGame g
+            ON t.id=g.team_id
+        ORDER BY g.season, g.team_id, g.game_date, g.rowid''', conn)
+    frames = []
+    for season, games in df.groupby('season', sort=True):
+        games = prepare_games(games.reset_index(drop=True), 'b')
+        cum = running_sums(games, 'b')
+        for mode in modes:
+            lines = team_lines(games, cum, 'b', mode, rolling_games).drop(columns=['Team'])
+            lines.insert(0, 'team_id', games.team_id)
+            lines.insert(1, 'season', season)
+            lines.insert(2, 'game_id', games.game_id)
+            lines.insert(3, 'mode', mode)
+            frames.append(lines)
+    if not frames:
+        return pd.DataFrame(columns=['team_id', 'season', 'game_id', 'mode', 'game_date', 'Games'])
+    return pd.concat(frames, ignore_index=True)
+
+def build_aggregates(conn):
+    start = time.perf_counter()
+    teams = pd.read_sql_query('SELECT id, league, division FROM Teams', conn)
+    tables = {
+        'LeagueBattingSeason': league_batting(conn, teams),
+        'LeaguePitchingSeason': league_pitching(conn, teams),
+        'PlayerBattingRank': player_ranks(conn, 'b'),
+        'PlayerPitchingRank': player_ranks(conn, 'p'),
+        'TeamGameTrend': team_game_trends(conn),
+    }
+    for name, df in tables.items():
+        df.to_sql(f'{name}_new', conn, if_exists='replace', index=False)
+    with conn:
+        # DDL doesn't open a transaction on its own in sqlite3
+        conn.execute('BEGIN')
+        for name in tables:
+            conn.execute(f'DROP TABLE IF EXISTS {name}')
+            conn.execute(f'ALTER TABLE {name}_new RENAME TO {name}')
+        for statement in aggregate_indexes:
+            conn.execute(statement)
+    rows = sum(len(df.index) for df in tables.values())
+    print(f'Built {len(tables)} aggregate tables ({rows} rows) in {time.perf_counter() - start:.1f}s')
+    return rows
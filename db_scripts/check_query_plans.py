@@ -0,0 +1,107 @@
+import os,sys,sqlite3,argparse
+
+from db_scripts import graph_data_query as query_engine
+from db_scripts.aggregates import build_aggregates
+
+# Regression check for the graph_data_query plans, run from the main repo directory with
+#   python -m db_scripts.check_query_plans [--db baseball.db]
+# Every query filters on team_id and season, so a full table SCAN in any plan means an index went missing
+# Exits non-zero if any plan scans a table, tests/test_query_plans.py runs the same cases under pytest
+
+directory = os.path.dirname(os.path.abspath(__file__))
+schema_scripts = ['new_tables.sql', 'load_tables.sql', 'indexes.sql']
+
+# Index each query is expected to use for its stat table
+expected_indexes = {
+    ('players_query', 'b'): 'idx_PlayerBattingSeason_season_team',
+    ('players_query', 'p'): 'idx_PlayerPitchingSeason_season_team',
+    ('team_season_query', 'b'): 'sqlite_autoindex_TeamBattingSeason_1',
+    ('team_season_query', 'p'): 'sqlite_autoindex_TeamPitchingSeason_1',
+    ('gamelogs_query', 'b'): 'idx_TeamBattingGame_team_season',
+    ('gamelogs_query', 'p'): 'idx_TeamPitchingGame_team_season',
+}
+
+# Same for the queries over the db_scripts/aggregates.py tables
+expected_aggregate_indexes = {
+    ('league_season_query', 'b'): 'idx_LeagueBattingSeason_season',
+    ('league_season_query', 'p'): 'idx_LeaguePitchingSeason_season',
+    ('leaderboard_query', 'b'): 'idx_PlayerBattingRank_season_team',
+    ('leaderboard_query', 'p'): 'idx_PlayerPitchingRank_season_team',
+    ('percentiles_query', 'b'): 'idx_PlayerBattingRank_season_team',
+    ('percentiles_query', 'p'): 'idx_PlayerPitchingRank_season_team',
+    ('team_trends_query', 'b'): 'idx_TeamGameTrend_season_team',
+}
+
+def schema_conn():
+    conn = sqlite3.connect(':memory:')
+    for name in schema_scripts:
+        with open(os.path.join(directory, name), 'r') as f:
+            conn.executescript(f.read())
+    # Empty aggregate tables, built the same way as after a load
+    build_aggregates(conn)
+    return conn
+
+def aggregate_query(builder, team_ids, years, table_type):
+    # (query, params) for each aggregate query builder, they don't share a signature
+    if builder == 'league_season_query':
+        return query_engine.league_season_query(years, table_type), [*years]
+    elif builder == 'leaderboard_query':
+        return query_engine.leaderboard_query(team_ids, years, table_type, 'HR'), [*team_ids, *years, 10]
+    elif builder == 'percentiles_query':
+        return query_engine.percentiles_query(team_ids, years, table_type), [*team_ids, *years]
+    elif builder == 'team_trends_query':
+        return query_engine.team_trends_query(team_ids, years), [*team_ids, *years, 'rolling']
+
+def plan_failures(conn, label, query, params, index):
+    plan = query_plan(conn, query, params)
+    failures = []
+    scans = [step for step in plan if step.startswith('SCAN')]
+    if scans:
+        failures.append(f'{label} scans: {scans}')
+    if not any(index in step for step in plan):
+        failures.append(f'{label} does not use {index}: {plan}')
+    return failures
+
+def query_plan(conn, query, params):
+    return [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+
+def plan_cases():
+    # (label, query, params, index) for every query the app runs
+    cases = []
+    # Single and multiple selections build different WHERE clauses (=? vs IN), check both
+    selections = [([20], [2020]), ([20, 21, 22], [2019, 2020])]
+    for (builder, table_type), index in expected_indexes.items():
+        kind = builder[:-len('_query')]
+        for team_ids, years in selections:
+            query = getattr(query_engine, builder)(team_ids, years, table_type)
+            # The Tables tab pages through a projected, sorted query and counts the rows, both wrap the builder's query
+            paged, params = query_engine.shaped_query(query, kind, columns=['season'], order_by='season', descending=True, limit=50, offset=50)
+            variants = [('', query, []), (' paged', paged, params), (' count', query_engine.count_query(query), [])]
+            for variant, variant_query, variant_params in variants:
+                label = f'{builder}({team_ids}, {years}, {table_type!r}){variant}'
+                cases.append((label, variant_query, [*team_ids, *years, *variant_params], index))
+    for (builder, table_type), index in expected_aggregate_indexes.items():
+        for team_ids, years in selections:
+            query, params = aggregate_query(builder, team_ids, years, table_type)
+            cases.append((f'{builder}({team_ids}, {years}, {table_type!r})', query, params, index))
+    return cases
+
+def check_plans(conn):
+    failures = []
+    for label, query, params, index in plan_cases():
+        failures += plan_failures(conn, label, query, params, index)
+    return failures
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Check that graph_data_query plans use the secondary indexes')
+    parser.add_argument('--db', help='check against an existing database instead of a fresh in-memory schema')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db) if args.db else schema_conn()
+    failures = check_plans(conn)
+    conn.close()
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print('All query plans use their indexes')
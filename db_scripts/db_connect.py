@@ -1,15 +1,34 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+directory = os.path.dirname(os.path.abspath(__file__))
+# BB_DB_PATH points the app, loaders and benchmarks at another database (e.g. one from db_scripts/synthetic_db.py)
+db_path = os.environ.get('BB_DB_PATH', os.path.join(directory, '..', 'baseball.db'))
+
+def db_identity():
+    # Which database file is in use: the path, and inode and mtime so a regenerated or rebuilt file at the same path
+    # (where PRAGMA user_version starts over) doesn't look like the old one
+    path = os.path.abspath(db_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return path, None, None
+    return path, st.st_ino, st.st_mtime_ns
 
 def db_setup():
     # Connect to db
     # Setup db connection, conn variable is None if connection unsuccessful
+    # This is the read/write connection used by data_insert, the Dash query path reads through read_pool() instead
     conn = None
     try:
         # Note that if db file doesn't already exist, one will be made
         # Also be weary of the check_same_thread condition, could cause problems if multiple threads try to access db
-        directory = os.path.dirname(os.path.abspath(__file__))
-        conn = sqlite3.connect(os.path.join(directory, '..', 'baseball.db'), check_same_thread=False)
+        conn = sqlite3.connect(db_path, check_same_thread=False)
     except Exception as e:
         # Don't continue if there's an Exception here
         db_error_cleanup(conn, e)
@@ -20,3 +39,115 @@ def db_error_cleanup(conn, e):
     conn.rollback()
     conn.close()
     raise e
+
+class ConnectionPool:
+    # Bounded pool of read-only connections for the Dash callbacks
+    # Each thread holds at most one connection at a time (nested checkouts on the same thread reuse it),
+    # and threads block once max_size connections are out
+    def __init__(self, path=None, max_size=8, timeout=30, mmap_size=256 * 1024 * 1024, cache_size=-64 * 1024):
+        self.path = os.path.abspath(path or db_path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.mmap_size = mmap_size
+        # Negative cache_size is in KiB
+        self.cache_size = cache_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._enable_wal()
+
+    def _enable_wal(self):
+        # WAL lets readers keep going while data_insert writes, it's stored in the db file so it only has to be set once
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        uri = f'file:{pathname2url(self.path)}?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        conn.execute('PRAGMA query_only=ON')
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f'No database connection free after {self.timeout}s ({self.max_size} in use)')
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        start = time.perf_counter()
+        conn = self._checkout()
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self._created,
+                'max_size': self.max_size,
+                'idle': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'wait_avg_ms': 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max_ms': 1000 * self.wait_max,
+            }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+def read_pool():
+    # Process wide pool, created on first use so importing this module never touches the db
+    global _read_pool
+    with _read_pool_lock:
+        if _read_pool is None:
+            _read_pool = ConnectionPool(max_size=int(os.environ.get('BB_DB_POOL_SIZE', 8)))
+        return _read_pool
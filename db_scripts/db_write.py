@@ -0,0 +1,148 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Batched writes shared by the data_insert loaders
+# Upserts replace the old to_sql(if_exists='append') calls, so one duplicate row no longer throws away a whole team season
+
+batch_size = 500
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+def upsert_query(table, columns, key_columns):
+    cols = ', '.join(quote(c) for c in columns)
+    params = ','.join('?' for _ in columns)
+    keys = ', '.join(quote(c) for c in key_columns)
+    updates = ', '.join(f'{quote(c)}=excluded.{quote(c)}' for c in columns if c not in key_columns)
+    conflict = f'DO UPDATE SET {updates}' if updates else 'DO NOTHING'
+    return f'INSERT INTO {table} ({cols}) VALUES ({params}) ON CONFLICT({keys}) {conflict}'
+
+def delete_query(table, key_columns):
+    return f'DELETE FROM {table} WHERE ' + ' AND '.join(f'{quote(c)}=?' for c in key_columns)
+
+def insert_new_query(table, columns):
+    # Rows whose key is already there are left alone (players come back every season they play)
+    cols = ', '.join(quote(c) for c in columns)
+    params = ','.join('?' for _ in columns)
+    return f'INSERT OR IGNORE INTO {table} ({cols}) VALUES ({params})'
+
+def upsert_rows(conn, table, columns, rows, key_columns):
+    # rows is any iterable of tuples ordered like columns, written with one executemany per batch
+    query = upsert_query(table, columns, key_columns)
+    rows = list(rows)
+    for i in range(0, len(rows), batch_size):
+        conn.executemany(query, rows[i:i + batch_size])
+    return len(rows)
+
+def frame_rows(df):
+    # sqlite3 can't bind numpy scalars or NaN, so hand it plain python values
+    # The index levels come first, named like reset_index would; numpy's object cast gives python ints/floats
+    levels = df.index.nlevels
+    names = [name if name is not None else ('index' if levels == 1 else f'level_{i}') for i,name in enumerate(df.index.names)]
+    index = [df.index.get_level_values(i).to_numpy(dtype=object) for i in range(levels)]
+    values = np.column_stack([*index, df.to_numpy(dtype=object)])
+    values[pd.isna(values)] = None
+    return names + list(df.columns), list(map(tuple, values))
+
+def upsert_frame(conn, table, df, key_columns):
+    columns, rows = frame_rows(df)
+    return upsert_rows(conn, table, columns, rows, key_columns)
+
+class RowStage:
+    # Rows of several payloads held back and written with one executemany per statement, so the load pipeline
+    # writes a batch of team seasons with a handful of statements inside one transaction
+    def __init__(self):
+        self.rows = 0
+        self._pending = {}
+
+    def _add(self, query, rows):
+        rows = list(rows)
+        self._pending.setdefault(query, []).extend(rows)
+        self.rows += len(rows)
+        return len(rows)
+
+    def upsert(self, table, columns, rows, key_columns):
+        return self._add(upsert_query(table, columns, key_columns), rows)
+
+    def upsert_frame(self, table, df, key_columns):
+        columns, rows = frame_rows(df)
+        return self.upsert(table, columns, rows, key_columns)
+
+    def insert_new(self, table, columns, rows):
+        return self._add(insert_new_query(table, columns), rows)
+
+    def insert_new_frame(self, table, df):
+        columns, rows = frame_rows(df)
+        return self.insert_new(table, columns, rows)
+
+    def delete(self, table, key_columns, keys):
+        # Deletes run at the flush like everything else, ahead of rows staged for the same table afterwards
+        return self._add(delete_query(table, key_columns), keys)
+
+    def flush(self, conn):
+        # Statements run in the order they were first staged, rows in the order they were added, so later payloads win
+        # Returns the rows actually inserted, updated or deleted, players that were already there don't count
+        changes = conn.total_changes
+        for query, rows in self._pending.items():
+            conn.executemany(query, rows)
+        self.clear()
+        return conn.total_changes - changes
+
+    def clear(self):
+        self.rows = 0
+        self._pending = {}
+
+def get_watermark(conn, team_id, season, table_name):
+    query = 'SELECT last_game_date, loaded_at FROM LoadWatermark WHERE team_id=? AND season=? AND table_name=?'
+    return conn.execute(query, (team_id, season, table_name)).fetchone()
+
+def set_watermark(conn, team_id, season, table_name, last_game_date=None):
+    # last_game_date only moves forward, an empty reload keeps the old one
+    query = '''
+        INSERT INTO LoadWatermark (team_id, season, table_name, last_game_date, loaded_at) VALUES (?,?,?,?,?)
+        ON CONFLICT(team_id, season, table_name) DO UPDATE SET
+            last_game_date=COALESCE(MAX(excluded.last_game_date, LoadWatermark.last_game_date), excluded.last_game_date, LoadWatermark.last_game_date),
+            loaded_at=excluded.loaded_at'''
+    conn.execute(query, (team_id, season, table_name, last_game_date, datetime.now().isoformat(timespec='seconds')))
+
+def clear_unit(conn, stage, team_id, season, table_name, tables):
+    # Before a unit is reloaded: its rows in tables are deleted with the next flush, its watermark right away so the
+    # writer takes every game again
+    for table in tables:
+        stage.delete(table, ['team_id', 'season'], [(team_id, season)])
+    conn.execute('DELETE FROM LoadWatermark WHERE team_id=? AND season=? AND table_name=?', (team_id, season, table_name))
+
+def done_jobs(conn):
+    return set(conn.execute("SELECT team_id, season, table_name FROM LoadJob WHERE status='done'"))
+
+def start_jobs(conn, units):
+    # units are (team_id, season, table_name), each one starts another attempt
+    query = '''
+        INSERT INTO LoadJob (team_id, season, table_name, status, attempts, started_at) VALUES (?,?,?,'running',1,?)
+        ON CONFLICT(team_id, season, table_name) DO UPDATE SET
+            status='running', attempts=LoadJob.attempts + 1, started_at=excluded.started_at,
+            finished_at=NULL, seconds=NULL, rows=NULL, error=NULL'''
+    now = datetime.now().isoformat(timespec='seconds')
+    conn.executemany(query, [(*unit, now) for unit in units])
+
+def finish_job(conn, team_id, season, table_name, rows, started=None):
+    # started is the time.time() the unit's page was requested, the attempt's start if it's not known
+    now = time.time()
+    started_at = datetime.fromtimestamp(started).isoformat(timespec='seconds') if started is not None else None
+    query = '''
+        UPDATE LoadJob SET status='done', rows=?, started_at=COALESCE(?, started_at), finished_at=?, seconds=?, error=NULL
+        WHERE team_id=? AND season=? AND table_name=?'''
+    conn.execute(query, (rows, started_at, datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+        round(now - started, 3) if started is not None else None, team_id, season, table_name))
+
+def fail_job(conn, team_id, season, table_name, error):
+    query = "UPDATE LoadJob SET status='failed', finished_at=?, error=? WHERE team_id=? AND season=? AND table_name=?"
+    conn.execute(query, (datetime.now().isoformat(timespec='seconds'), error, team_id, season, table_name))
+
+def bump_data_version(conn):
+    # Tells the Dash query cache (graph_data_query.data_version) that the data changed
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.execute(f'PRAGMA user_version={version + 1}')
+    return version + 1
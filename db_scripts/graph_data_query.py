@@ -1,17 +1,70 @@
+import os,time,threading
 import pandas as pd
 import numpy as np
-from db_scripts.db_connect import db_setup,db_error_cleanup
+from db_scripts import db_connect
+from db_scripts.db_connect import read_pool
+from db_scripts.db_write import quote
+from db_scripts.query_cache import QueryCache,memoize
+from db_scripts.snapshot_engine import SnapshotEngine
+import metrics
 
 # This file has general interaction with the SQLite database, and will return DataFrames from the queries
 # Any DataFrame cleanup should be done in the page's update_dataframe function
 # table_type is either 'b' or 'p'
+# The *_query functions only build the SQL, which lets db_scripts/check_query_plans.py inspect the plans without running them
+# The get_* functions take an optional shape: columns (projection), order_by/descending and limit/offset, applied in SQL
+# Every get_* has a latency histogram in metrics.py, and inside callback requests make_query adds its SQL and DataFrame
+# build times, row counts and query cache hits to the request's trace
 
-def make_query(query, team_ids, years):
-    with db_setup() as conn:
-        df = pd.read_sql_query(query, conn, params=[*team_ids, *years], coerce_float=True)
+# Repeated selections are served from memory until data_insert bumps the data version (PRAGMA user_version)
+query_cache = QueryCache(
+    max_entries=int(os.environ.get('BB_QUERY_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('BB_QUERY_CACHE_TTL', 600)),
+    on_lookup=lambda hit: metrics.count('query_cache_hits' if hit else 'query_cache_misses'))
+version_check_interval = 1.0
+_version = {'value': None, 'checked': 0.0}
+_version_lock = threading.Lock()
+
+def data_version():
+    # Re-read at most once per version_check_interval so cache hits don't go back to SQLite every time
+    with _version_lock:
+        now = time.monotonic()
+        if _version['value'] is None or now - _version['checked'] > version_check_interval:
+            with read_pool().connection() as conn:
+                _version['value'] = conn.execute('PRAGMA user_version').fetchone()[0]
+            _version['checked'] = now
+        return _version['value']
+
+def cache_stats():
+    return query_cache.stats()
+
+def make_query(query, team_ids, years, params=()):
+    # Pooled read-only connection, returned to the pool (not closed) when the query is done
+    # Same frame pd.read_sql_query builds, split so execute/fetch and the DataFrame build are timed apart
+    with read_pool().connection() as conn:
+        with metrics.phase('sql'):
+            cursor = conn.execute(query, [*(team_ids or []), *(years or []), *params])
+            rows = cursor.fetchall()
+    with metrics.phase('dataframe'):
+        df = pd.DataFrame.from_records(rows, columns=[col[0] for col in cursor.description], coerce_float=True)
+    metrics.count('rows', len(rows))
     return df
 
-def get_players(team_ids, years, table_type):
+def in_clause(values):
+    return 'IN (' + ','.join(['?' for _ in values]) + ')' if len(values)>1 else '=?'
+
+def where_clause(team_col, season_col, team_ids, years, *conditions):
+    # team_ids/years of None select every team/season (used to load whole tables for the snapshot engine)
+    # conditions are extra filters without parameters, ANDed after the team and season ones
+    filters = []
+    if team_ids is not None:
+        filters.append(f'{team_col} {in_clause(team_ids)}')
+    if years is not None:
+        filters.append(f'{season_col} {in_clause(years)}')
+    filters += conditions
+    return 'WHERE ' + '\n                AND '.join(filters) if filters else ''
+
+def players_query(team_ids, years, table_type):
     # From Player season table
     if table_type == 'b':
         query = f'''
@@ -20,8 +73,7 @@ def get_players(team_ids, years, table_type):
                 ON t.id=pbs.team_id
             JOIN Batters b
                 ON pbs.player_id=b.id
-            WHERE t.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND pbs.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
+            {where_clause('t.id', 'pbs.season', team_ids, years)}'''
     else:
         query = f'''
             SELECT p.Name, p.Handedness, t.team_code Team, pps.*
@@ -29,11 +81,10 @@ def get_players(team_ids, years, table_type):
                 ON t.id=pps.team_id
             JOIN Pitchers p
                 ON pps.player_id=p.id
-            WHERE t.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND pps.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
-    return make_query(query, team_ids, years)
+            {where_clause('t.id', 'pps.season', team_ids, years)}'''
+    return query
 
-def get_team_season(team_ids, years, table_type):
+def team_season_query(team_ids, years, table_type):
     # Team season table
     if table_type == 'b':
         query = f'''
@@ -43,8 +94,7 @@ def get_team_season(team_ids, years, table_type):
             JOIN TeamSeason ts
                 ON t.id=ts.team_id
                     AND ts.season=tbs.season
-            WHERE t.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND tbs.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
+            {where_clause('t.id', 'tbs.season', team_ids, years)}'''
     else:
         query = f'''
             SELECT t.Name, (ts.wins || '-' || ts.losses) as Record, tps.*
@@ -53,12 +103,10 @@ def get_team_season(team_ids, years, table_type):
             JOIN TeamSeason ts
                 ON t.id=ts.team_id
                     AND ts.season=tps.season
-            WHERE t.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND tps.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
-    
-    return make_query(query, team_ids, years)
+            {where_clause('t.id', 'tps.season', team_ids, years)}'''
+    return query
 
-def get_gamelogs(team_ids, years, table_type):
+def gamelogs_query(team_ids, years, table_type):
     # From gamelogs table
     if table_type == 'b':
         query = f'''
@@ -67,8 +115,7 @@ def get_gamelogs(team_ids, years, table_type):
                 ON t1.id=tbg.team_id
             JOIN Teams t2
                 ON t2.id=tbg.opp_id
-            WHERE t1.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND tbg.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
+            {where_clause('t1.id', 'tbg.season', team_ids, years)}'''
     else:
         query = f'''
             SELECT t1.team_code Team, t1.team_code || CASE tpg.HomeAway WHEN 'H' THEN ' vs. ' ELSE ' @ ' END || t2.team_code Game, tpg.RunsFor || '-' || tpg.R Score, tpg.*
@@ -76,9 +123,255 @@ def get_gamelogs(team_ids, years, table_type):
                 ON t1.id=tpg.team_id
             JOIN Teams t2
                 ON t2.id=tpg.opp_id
-            WHERE t1.id {'IN (' + ','.join(['?' for _ in team_ids]) + ')' if len(team_ids)>1 else '=?'}
-                AND tpg.season {'IN (' + ','.join(['?' for _ in years]) + ')' if len(years)>1 else '=?'}'''
-    
-    return make_query(query, team_ids, years)
+            {where_clause('t1.id', 'tpg.season', team_ids, years)}'''
+    return query
+
+builders = {
+    'players': players_query,
+    'team_season': team_season_query,
+    'gamelogs': gamelogs_query,
+}
+
+# Column names of each result set, they don't depend on the selection or the query engine
+_columns = {}
+_columns_lock = threading.Lock()
+
+def result_columns(kind, table_type):
+    # Read once per process from the builder's result description, LIMIT 0 doesn't read any rows
+    key = (kind, table_type)
+    with _columns_lock:
+        if key not in _columns:
+            with read_pool().connection() as conn:
+                cursor = conn.execute(builders[kind]([0], [0], table_type) + ' LIMIT 0', [0, 0])
+                _columns[key] = [col[0] for col in cursor.description]
+        return _columns[key]
+
+# Row key of each result set, appended to ORDER BY so ties come back in the same order on every page
+sort_keys = {
+    'players': ['team_id', 'season', 'player_id'],
+    'team_season': ['team_id', 'season'],
+    'gamelogs': ['team_id', 'season', 'game_date', 'game_id'],
+}
+
+def shaped_query(query, kind, columns=None, order_by=None, descending=False, limit=None, offset=0):
+    # Projection, ORDER BY and LIMIT around one of the *_query builders, returns (query, extra params)
+    # SQLite flattens the subquery, so only the requested columns and rows are produced
+    if columns is None and order_by is None and limit is None:
+        return query, []
+    select = ', '.join(quote(col) for col in columns) if columns is not None else '*'
+    query = f'''
+            SELECT {select} FROM ({query}
+            )'''
+    order = [f'{quote(order_by)} IS NULL', f'{quote(order_by)} {"DESC" if descending else "ASC"}'] if order_by is not None else []
+    query += '\n            ORDER BY ' + ', '.join(order + [quote(col) for col in sort_keys[kind]])
+    if limit is None:
+        return query, []
+    return query + '\n            LIMIT ? OFFSET ?', [limit, offset]
+
+def count_query(query):
+    return f'''
+            SELECT COUNT(*) n FROM ({query}
+            )'''
+
+def shape_frame(df, kind, columns=None, order_by=None, descending=False, limit=None, offset=0):
+    # Same shape as shaped_query for frames that don't come from SQLite (snapshot engine)
+    if order_by is not None:
+        df = df.sort_values([order_by] + sort_keys[kind], ascending=[not descending] + [True] * len(sort_keys[kind]), na_position='last', kind='mergesort')
+    if limit is not None:
+        df = df.iloc[offset:offset + limit]
+    if columns is not None:
+        df = df[list(columns)]
+    return df.reset_index(drop=True)
+
+@memoize(query_cache, data_version)
+def query_players(team_ids, years, table_type, **shape):
+    query, params = shaped_query(players_query(team_ids, years, table_type), 'players', **shape)
+    return make_query(query, team_ids, years, params)
+
+@memoize(query_cache, data_version)
+def query_team_season(team_ids, years, table_type, **shape):
+    query, params = shaped_query(team_season_query(team_ids, years, table_type), 'team_season', **shape)
+    return make_query(query, team_ids, years, params)
+
+@memoize(query_cache, data_version)
+def query_gamelogs(team_ids, years, table_type, **shape):
+    query, params = shaped_query(gamelogs_query(team_ids, years, table_type), 'gamelogs', **shape)
+    return make_query(query, team_ids, years, params)
+
+@memoize(query_cache, data_version)
+def query_count(team_ids, years, table_type, kind):
+    return make_query(count_query(builders[kind](team_ids, years, table_type)), team_ids, years)
+
+# Precomputed tables from db_scripts/aggregates.py (rebuilt after every load)
+def league_season_query(years, table_type):
+    # League and division totals, with 'All' division and 'MLB' rollup rows
+    table = 'LeagueBattingSeason' if table_type == 'b' else 'LeaguePitchingSeason'
+    query = f'''
+            SELECT *
+            FROM {table}
+            {where_clause(None, 'season', None, years)}
+            ORDER BY season, league, division'''
+    return query
+
+def leaderboard_query(team_ids, years, table_type, stat):
+    # Best players by one stat's percentile rank (every team unless team_ids is given), unqualified players have no rank
+    if table_type == 'b':
+        query = f'''
+            SELECT b.Name, t.team_code Team, pbs.season, pbs.PA, pbs.{quote(stat)}, r.{quote(stat)} Percentile
+            FROM PlayerBattingRank r JOIN PlayerBattingSeason pbs
+                ON pbs.player_id=r.player_id
+                    AND pbs.season=r.season
+                    AND pbs.team_id=r.team_id
+            JOIN Batters b
+                ON r.player_id=b.id
+            JOIN Teams t
+                ON t.id=r.team_id
+            {where_clause('r.team_id', 'r.season', team_ids, years, f'r.{quote(stat)} IS NOT NULL')}
+            ORDER BY r.{quote(stat)} DESC, b.Name
+            LIMIT ?'''
+    else:
+        query = f'''
+            SELECT p.Name, t.team_code Team, pps.season, pps.IP, pps.{quote(stat)}, r.{quote(stat)} Percentile
+            FROM PlayerPitchingRank r JOIN PlayerPitchingSeason pps
+                ON pps.player_id=r.player_id
+                    AND pps.season=r.season
+                    AND pps.team_id=r.team_id
+            JOIN Pitchers p
+                ON r.player_id=p.id
+            JOIN Teams t
+                ON t.id=r.team_id
+            {where_clause('r.team_id', 'r.season', team_ids, years, f'r.{quote(stat)} IS NOT NULL')}
+            ORDER BY r.{quote(stat)} DESC, p.Name
+            LIMIT ?'''
+    return query
+
+def percentiles_query(team_ids, years, table_type):
+    # Percentile rank of every stat for the selected teams' players
+    if table_type == 'b':
+        query = f'''
+            SELECT b.Name, t.team_code Team, r.*
+            FROM PlayerBattingRank r JOIN Batters b
+                ON r.player_id=b.id
+            JOIN Teams t
+                ON t.id=r.team_id
+            {where_clause('r.team_id', 'r.season', team_ids, years)}'''
+    else:
+        query = f'''
+            SELECT p.Name, t.team_code Team, r.*
+            FROM PlayerPitchingRank r JOIN Pitchers p
+                ON r.player_id=p.id
+            JOIN Teams t
+                ON t.id=r.team_id
+            {where_clause('r.team_id', 'r.season', team_ids, years)}'''
+    return query
+
+def team_trends_query(team_ids, years):
+    # Season-to-date or rolling (aggregates.rolling_games) team batting lines, one row per game, mode is the last parameter
+    query = f'''
+            SELECT t.team_code Team, tr.*
+            FROM Teams t JOIN TeamGameTrend tr
+                ON t.id=tr.team_id
+            {where_clause('tr.team_id', 'tr.season', team_ids, years, 'tr.mode=?')}
+            ORDER BY tr.season, tr.team_id, tr.Games'''
+    return query
+
+@memoize(query_cache, data_version)
+def query_league_season(team_ids, years, table_type):
+    return make_query(league_season_query(years, table_type), None, years)
+
+@memoize(query_cache, data_version)
+def query_leaderboard(team_ids, years, table_type, stat, limit):
+    return make_query(leaderboard_query(team_ids, years, table_type, stat), team_ids, years, [limit])
+
+@memoize(query_cache, data_version)
+def query_percentiles(team_ids, years, table_type):
+    return make_query(percentiles_query(team_ids, years, table_type), team_ids, years)
+
+@memoize(query_cache, data_version)
+def query_team_trends(team_ids, years, mode):
+    return make_query(team_trends_query(team_ids, years), team_ids, years, [mode])
+
+@metrics.timed('query')
+def get_league_season(years, table_type):
+    return query_league_season(None, years, table_type)
+
+@metrics.timed('query')
+def get_leaderboard(years, table_type, stat, limit=10, team_ids=None):
+    return query_leaderboard(team_ids, years, table_type, stat, int(limit))
+
+@metrics.timed('query')
+def get_percentiles(team_ids, years, table_type):
+    return query_percentiles(team_ids, years, table_type)
+
+@metrics.timed('query')
+def get_team_trends(team_ids, years, mode='rolling'):
+    return query_team_trends(team_ids, years, mode)
+
+# BB_QUERY_ENGINE=snapshot loads every table into memory at startup and filters there instead of querying SQLite
+snapshot = None
+if os.environ.get('BB_QUERY_ENGINE', 'sqlite') == 'snapshot':
+    snapshot = SnapshotEngine(db_connect.db_path, builders)
+
+# BB_QUERY_ENGINE=parquet answers them from the Parquet export instead (db_scripts/parquet_export.py, BB_PARQUET_DIR),
+# reading only the selected seasons, teams and columns; the aggregate queries stay on SQLite either way
+columnar = None
+if os.environ.get('BB_QUERY_ENGINE', 'sqlite') == 'parquet':
+    from db_scripts.parquet_export import default_dir
+    from db_scripts.parquet_engine import ParquetEngine
+    columnar = ParquetEngine(os.environ.get('BB_PARQUET_DIR', default_dir))
+
+def columnar_lookup(kind, team_ids, years, table_type, shape):
+    # Parquet engine result shaped like shaped_query's, only reading the columns the shape needs
+    columns = None
+    if 'columns' in shape:
+        columns = [*shape['columns'], *([shape['order_by']] if 'order_by' in shape else [])]
+    return shape_frame(columnar.lookup(kind, team_ids, years, table_type, columns), kind, **shape)
+
+def query_shape(columns, order_by, descending, limit, offset):
+    # Only the parts that were asked for, columns as a tuple so the memoize key stays hashable
+    shape = {}
+    if columns is not None:
+        shape['columns'] = tuple(columns)
+    if order_by is not None:
+        shape['order_by'] = order_by
+        shape['descending'] = bool(descending)
+    if limit is not None:
+        shape['limit'] = int(limit)
+        shape['offset'] = int(offset)
+    return shape
+
+@metrics.timed('query')
+def get_players(team_ids, years, table_type, columns=None, order_by=None, descending=False, limit=None, offset=0):
+    shape = query_shape(columns, order_by, descending, limit, offset)
+    if snapshot is not None:
+        return shape_frame(snapshot.lookup('players', team_ids, years, table_type), 'players', **shape)
+    if columnar is not None:
+        return columnar_lookup('players', team_ids, years, table_type, shape)
+    return query_players(team_ids, years, table_type, **shape)
+
+@metrics.timed('query')
+def get_team_season(team_ids, years, table_type, columns=None, order_by=None, descending=False, limit=None, offset=0):
+    shape = query_shape(columns, order_by, descending, limit, offset)
+    if snapshot is not None:
+        return shape_frame(snapshot.lookup('team_season', team_ids, years, table_type), 'team_season', **shape)
+    if columnar is not None:
+        return columnar_lookup('team_season', team_ids, years, table_type, shape)
+    return query_team_season(team_ids, years, table_type, **shape)
 
+@metrics.timed('query')
+def get_gamelogs(team_ids, years, table_type, columns=None, order_by=None, descending=False, limit=None, offset=0):
+    shape = query_shape(columns, order_by, descending, limit, offset)
+    if snapshot is not None:
+        return shape_frame(snapshot.lookup('gamelogs', team_ids, years, table_type), 'gamelogs', **shape)
+    if columnar is not None:
+        return columnar_lookup('gamelogs', team_ids, years, table_type, shape)
+    return query_gamelogs(team_ids, years, table_type, **shape)
 
+@metrics.timed('query')
+def get_count(kind, team_ids, years, table_type):
+    # Number of rows get_<kind> returns without a limit
+    if snapshot is not None:
+        return len(snapshot.lookup(kind, team_ids, years, table_type).index)
+    if columnar is not None:
+        return len(columnar.lookup(kind, team_ids, years, table_type, columns=[]).index)
+    return int(query_count(team_ids, years, table_type, kind).n.iloc[0])
@@ -0,0 +1,10 @@
+-- Secondary indexes shaped like the graph_data_query lookups (every query filters on team_id and season)
+-- Safe to run against an existing database, db_scripts/check_query_plans.py verifies the queries use them
+
+-- Gamelogs are looked up per team and season, game_date keeps each season's games in order
+CREATE INDEX IF NOT EXISTS idx_TeamBattingGame_team_season ON TeamBattingGame (team_id, season, game_date);
+CREATE INDEX IF NOT EXISTS idx_TeamPitchingGame_team_season ON TeamPitchingGame (team_id, season, game_date);
+
+-- Player seasons are keyed on player_id first, so team and season lookups need their own index
+CREATE INDEX IF NOT EXISTS idx_PlayerBattingSeason_season_team ON PlayerBattingSeason (season, team_id);
+CREATE INDEX IF NOT EXISTS idx_PlayerPitchingSeason_season_team ON PlayerPitchingSeason (season, team_id);
@@ -0,0 +1,29 @@
+-- Bookkeeping for incremental loads, created if missing so existing databases can be synced without a rebuild
+
+-- Latest data loaded per team, season and table (last_game_date is only set for gamelog tables)
+CREATE TABLE IF NOT EXISTS LoadWatermark (
+    team_id integer,
+    season integer,
+    table_name string,
+    last_game_date string,
+    loaded_at string,
+    PRIMARY KEY (team_id, season, table_name),
+    FOREIGN KEY(team_id) REFERENCES Teams(id)
+);
+
+-- One row per (team, season, table) unit of data_insert.populate_db, written in the same transaction as the unit's rows
+-- status is running from the start of an attempt until the unit is done, or failed with the error of its last attempt
+CREATE TABLE IF NOT EXISTS LoadJob (
+    team_id integer,
+    season integer,
+    table_name string,
+    status string,
+    attempts integer,
+    started_at string,
+    finished_at string,
+    seconds real,
+    rows integer,
+    error string,
+    PRIMARY KEY (team_id, season, table_name),
+    FOREIGN KEY(team_id) REFERENCES Teams(id)
+);
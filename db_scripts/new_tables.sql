@@ -12,6 +12,14 @@ DROP TABLE IF EXISTS Batters;
 DROP TABLE IF EXISTS Pitchers;
 DROP TABLE IF EXISTS PlayerBattingSeason;
 DROP TABLE IF EXISTS PlayerPitchingSeason;
+DROP TABLE IF EXISTS LoadWatermark;
+DROP TABLE IF EXISTS LoadJob;
+-- Aggregates are rebuilt by db_scripts/aggregates.py after the load
+DROP TABLE IF EXISTS LeagueBattingSeason;
+DROP TABLE IF EXISTS LeaguePitchingSeason;
+DROP TABLE IF EXISTS PlayerBattingRank;
+DROP TABLE IF EXISTS PlayerPitchingRank;
+DROP TABLE IF EXISTS TeamGameTrend;
 
 -- Create tables
 CREATE TABLE Teams (
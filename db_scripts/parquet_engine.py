@@ -0,0 +1,189 @@
+import os,json,threading,time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+import metrics
+
+# Optional query engine over the Parquet export (BB_QUERY_ENGINE=parquet in graph_data_query, files from db_scripts/parquet_export.py)
+# Answers the players/team_season/gamelogs calls with the same rows and columns as the SQL builders: the fact table is scanned
+# with the team_id/season filters pushed down (unselected season directories are never opened, row groups are skipped by
+# their team_id min/max), reading only the columns the caller needs, from memory mapped files.
+# Teams, TeamSeason, Batters and Pitchers are small and kept in memory for the joins. When the export is replaced (new manifest), the
+# next lookup reopens everything, lookups already running finish on the old files.
+
+facts = {
+    ('players', 'b'): 'PlayerBattingSeason',
+    ('players', 'p'): 'PlayerPitchingSeason',
+    ('team_season', 'b'): 'TeamBattingSeason',
+    ('team_season', 'p'): 'TeamPitchingSeason',
+    ('gamelogs', 'b'): 'TeamBattingGame',
+    ('gamelogs', 'p'): 'TeamPitchingGame',
+}
+# Fact columns every lookup reads: the graph_data_query sort keys, the join columns, and what each computed column is built from
+keys = {
+    'players': ['team_id', 'season', 'player_id'],
+    'team_season': ['team_id', 'season'],
+    'gamelogs': ['team_id', 'season', 'game_date', 'game_id'],
+}
+join_columns = {'gamelogs': ['opp_id']}
+computed = {
+    ('gamelogs', 'b'): {'Game': ['HomeAway'], 'Score': ['R', 'RunsAgainst']},
+    ('gamelogs', 'p'): {'Game': ['HomeAway'], 'Score': ['RunsFor', 'R']},
+}
+
+def as_text(s, arrow_type):
+    # Column as SQLite's || would print it, NULL stays None
+    null = s.isna()
+    if arrow_type == 'int64':
+        s = s.fillna(0).astype('int64')
+    return s.astype(str).where(~null, None)
+
+def concat(parts):
+    # SQL a || b || ...: NULL if any part is NULL
+    text = parts[0]
+    for part in parts[1:]:
+        text = text + part
+    null = np.zeros(len(text.index), dtype=bool)
+    for part in parts:
+        if isinstance(part, pd.Series):
+            null |= part.isna().to_numpy()
+    return text.where(~null, None)
+
+class Export:
+    # One opened export: manifest, datasets and the small tables
+    def __init__(self, directory, filesystem):
+        self.directory = directory
+        self.filesystem = filesystem
+        with open(os.path.join(directory, '_manifest.json'), 'r') as f:
+            self.manifest = json.load(f)
+        self._datasets = {}
+        self._lock = threading.Lock()
+        teams = self.read('Teams')
+        self.team_codes = teams.set_index('id').team_code
+        self.team_names = teams.set_index('id').Name
+        self.people = {
+            'b': self.read('Batters').set_index('id')[['Name', 'Pos', 'Handedness']],
+            'p': self.read('Pitchers').set_index('id')[['Name', 'Handedness']],
+        }
+        self.records = self.read('TeamSeason').rename(columns={'wins': '_wins', 'losses': '_losses'}).set_index(['team_id', 'season'])
+
+    def columns(self, table):
+        return self.manifest['tables'][table]['columns']
+
+    def types(self, table):
+        return dict(zip(self.columns(table), self.manifest['tables'][table]['types']))
+
+    def dataset(self, table):
+        with self._lock:
+            dataset = self._datasets.get(table)
+            if dataset is None:
+                info = self.manifest['tables'][table]
+                partitioning = ds.partitioning(pa.schema([('season', pa.int64())]), flavor='hive') if 'season' in info['columns'] else None
+                dataset = ds.dataset(os.path.join(self.directory, table), format='parquet', filesystem=self.filesystem, partitioning=partitioning)
+                self._datasets[table] = dataset
+            return dataset
+
+    def read(self, table, team_ids=None, years=None, columns=None):
+        # Frame of the table's rows for team_ids x years (None for all), columns in the SQLite order
+        names = [c for c in self.columns(table) if columns is None or c in columns]
+        if self.manifest['tables'][table]['rows'] == 0:
+            # Nothing was written for an empty partitioned table
+            return pd.DataFrame({c: pd.Series(dtype=object) for c in names})
+        condition = None
+        if team_ids is not None:
+            condition = ds.field('team_id').isin(list(team_ids))
+        if years is not None:
+            season = ds.field('season').isin(list(years))
+            condition = season if condition is None else condition & season
+        with metrics.phase('scan'):
+            table = self.dataset(table).to_table(columns=names, filter=condition)
+        with metrics.phase('dataframe'):
+            return table.to_pandas()
+
+class ParquetEngine:
+    def __init__(self, directory, check_interval=1.0):
+        self.directory = os.path.abspath(directory)
+        self.check_interval = check_interval
+        self.filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+        self._reload_lock = threading.Lock()
+        self._checked = 0.0
+        self._signature = self._manifest_signature()
+        self.export = Export(self.directory, self.filesystem)
+        self.reloads = 0
+
+    def _manifest_signature(self):
+        # The export directory is swapped in whole, so a new manifest means new files
+        st = os.stat(os.path.join(self.directory, '_manifest.json'))
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = now
+            signature = self._manifest_signature()
+            if signature != self._signature:
+                self.export = Export(self.directory, self.filesystem)
+                self._signature = signature
+                self.reloads += 1
+        finally:
+            self._reload_lock.release()
+
+    def lookup(self, kind, team_ids, years, table_type, columns=None):
+        # Result of builders[kind](team_ids, years, table_type) sorted by the kind's keys; with columns, only those
+        # (plus the keys) are read and returned
+        self._maybe_reload()
+        export = self.export
+        fact = facts[(kind, table_type)]
+        derived = computed.get((kind, table_type), {})
+        needed = None
+        if columns is not None:
+            needed = set(columns) | set(keys[kind]) | set(join_columns.get(kind, []))
+            for name, sources in derived.items():
+                if name in columns:
+                    needed |= set(sources)
+        df = export.read(fact, team_ids, years, needed)
+        types = export.types(fact)
+
+        with metrics.phase('dataframe'):
+            # Inner joins of the SQL builders: rows without a team (or opponent, player) are dropped
+            keep = df.team_id.isin(export.team_codes.index)
+            if kind == 'players':
+                keep &= df.player_id.isin(export.people[table_type].index)
+            elif kind == 'gamelogs':
+                keep &= df.opp_id.isin(export.team_codes.index)
+            if kind == 'team_season':
+                # An empty join comes back indexed by team_id and season, which sort_values can't tell from the columns
+                df = df[keep].join(export.records, on=['team_id', 'season'], how='inner').reset_index(drop=True)
+            else:
+                df = df[keep]
+            df = df.sort_values(keys[kind], kind='mergesort').reset_index(drop=True)
+
+            front = {}
+            if kind == 'players':
+                people = export.people[table_type].reindex(df.player_id)
+                for name in people.columns:
+                    front[name] = people[name].to_numpy()
+                front['Team'] = export.team_codes.reindex(df.team_id).to_numpy()
+            elif kind == 'team_season':
+                front['Name'] = export.team_names.reindex(df.team_id).to_numpy()
+                front['Record'] = concat([as_text(df._wins, 'int64'), '-', as_text(df._losses, 'int64')]).to_numpy()
+                df = df.drop(columns=['_wins', '_losses'])
+            else:
+                team = pd.Series(export.team_codes.reindex(df.team_id).to_numpy())
+                front['Team'] = team.to_numpy()
+                if 'HomeAway' in df.columns:
+                    opponent = pd.Series(export.team_codes.reindex(df.opp_id).to_numpy())
+                    front['Game'] = concat([team, pd.Series(np.where(df.HomeAway == 'H', ' vs. ', ' @ ')), opponent]).to_numpy()
+                first, second = derived['Score']
+                if first in df.columns and second in df.columns:
+                    front['Score'] = concat([as_text(df[first], types[first]), '-', as_text(df[second], types[second])]).to_numpy()
+            df = pd.concat([pd.DataFrame(front, index=df.index), df], axis=1)
+        metrics.count('rows', len(df.index))
+        return df
@@ -0,0 +1,118 @@
+import os,json,shutil,sqlite3,argparse,time
+from urllib.request import pathname2url
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from db_scripts import db_connect
+from db_scripts.db_write import quote
+
+# Copies every table of baseball.db to Parquet for offline analysis and the parquet query engine (db_scripts/parquet_engine.py)
+#   python -m db_scripts.parquet_export [--db baseball.db] [--out baseball.parquet]
+# or python data_insert.py --parquet to export after a load. Needs pyarrow (pip install pyarrow), which the app only
+# imports with BB_QUERY_ENGINE=parquet.
+# Layout: <out>/<table>/season=<year>/part-0.parquet for tables with a season column (the season is in the directory
+# name only), <out>/<table>/part-0.parquet for the others, and <out>/_manifest.json with every table's columns in the
+# SQLite order, row counts and the data version they were exported at.
+# Columns are typed from the SQLite declared types (INTEGER -> int64, REAL -> double, text -> string), widened to double
+# when a column holds mixed values. Rows are sorted by team_id inside every season, so the row group
+# statistics let readers skip groups by team as well, and team and player ids are dictionary encoded.
+# The new export is written next to the old one and swapped in once it's complete.
+
+default_dir = os.path.splitext(db_connect.db_path)[0] + '.parquet'
+dictionary_columns = ['team_id', 'opp_id', 'player_id', 'team_code', 'Team']
+row_group_size = 8192
+
+def arrow_type(declared, values):
+    # SQLite affinity of the declared type, widened if the stored values don't fit it
+    declared = (declared or '').upper()
+    present = [v for v in values if v is not None]
+    if 'INT' in declared:
+        return pa.int64() if all(isinstance(v, int) for v in present) else pa.float64()
+    if any(t in declared for t in ['REAL', 'FLOA', 'DOUB']):
+        return pa.float64()
+    if present and all(isinstance(v, int) for v in present):
+        return pa.int64()
+    if present and all(isinstance(v, (int, float)) for v in present):
+        return pa.float64()
+    return pa.string()
+
+def read_table(conn, table):
+    # The whole table as an arrow Table, built from the rows sqlite3 returns
+    info = list(conn.execute(f'PRAGMA table_info({quote(table)})'))
+    names = [row[1] for row in info]
+    rows = conn.execute(f'SELECT {", ".join(quote(name) for name in names)} FROM {quote(table)}').fetchall()
+    columns = list(zip(*rows)) if rows else [() for _ in names]
+    arrays = []
+    for (_, name, declared, *_), values in zip(info, columns):
+        kind = arrow_type(declared, values)
+        if kind == pa.string():
+            values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+        arrays.append(pa.array(values, type=kind))
+    return pa.Table.from_arrays(arrays, names=names)
+
+def sort_order(table):
+    return [(name, 'ascending') for name in ['team_id', 'game_date', 'game_id', 'player_id'] if name in table.column_names]
+
+def write_file(table, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path,
+        row_group_size=row_group_size,
+        use_dictionary=[name for name in dictionary_columns if name in table.column_names],
+        compression='zstd')
+
+def export(db_path=None, out_dir=None):
+    db_path = os.path.abspath(db_path or db_connect.db_path)
+    out_dir = os.path.abspath(out_dir or default_dir)
+    start = time.perf_counter()
+    staging = out_dir + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    conn = sqlite3.connect(f'file:{pathname2url(db_path)}?mode=ro', uri=True)
+    manifest = {'data_version': conn.execute('PRAGMA user_version').fetchone()[0], 'tables': {}}
+    try:
+        tables = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        for name in tables:
+            table = read_table(conn, name)
+            order = sort_order(table)
+            seasons = []
+            if 'season' in table.column_names:
+                table = table.take(pc.sort_indices(table, sort_keys=[('season', 'ascending')] + order))
+                seasons = sorted(s for s in pc.unique(table['season']).to_pylist() if s is not None)
+                for season in seasons:
+                    part = table.filter(pc.equal(table['season'], season)).drop(['season'])
+                    write_file(part, os.path.join(staging, name, f'season={season}', 'part-0.parquet'))
+            else:
+                if order:
+                    table = table.take(pc.sort_indices(table, sort_keys=order))
+                write_file(table, os.path.join(staging, name, 'part-0.parquet'))
+            manifest['tables'][name] = {
+                'columns': table.column_names,
+                'types': [str(t) for t in table.schema.types],
+                'rows': table.num_rows,
+                'seasons': seasons,
+            }
+    finally:
+        conn.close()
+    with open(os.path.join(staging, '_manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    # Swap the finished export in, readers holding the old files keep them until they reopen
+    old = out_dir + '.old'
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old)
+    os.replace(staging, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+
+    rows = sum(t['rows'] for t in manifest['tables'].values())
+    size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(out_dir) for f in files)
+    print(f'Exported {len(manifest["tables"])} tables ({rows} rows) to {out_dir} in {time.perf_counter() - start:.1f}s '
+        f'({size / 1024 ** 2:.1f} MB, db {os.path.getsize(db_path) / 1024 ** 2:.1f} MB)')
+    return manifest
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Export baseball.db to Parquet')
+    parser.add_argument('--db', default=db_connect.db_path, help='database to export (default: BB_DB_PATH or baseball.db)')
+    parser.add_argument('--out', help=f'output directory (default: the database path with .parquet, {default_dir})')
+    args = parser.parse_args()
+    export(args.db, args.out or os.path.splitext(os.path.abspath(args.db))[0] + '.parquet')
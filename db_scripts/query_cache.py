@@ -0,0 +1,96 @@
+import threading,time
+from collections import OrderedDict
+from functools import wraps
+
+# Memoization for the graph_data_query get_* functions
+# Keys are normalized (function, sorted team_ids, sorted years, table_type) so the same selection in a different order is a hit.
+# Entries expire after ttl seconds, the least recently used are evicted past max_entries, and everything cached under an
+# older data version is dropped (data_insert bumps the version after every successful load).
+
+class QueryCache:
+    def __init__(self, max_entries=256, ttl=600, on_lookup=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Called with True/False after every hit/miss (metrics.py counts them per request)
+        self.on_lookup = on_lookup
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        entry = self._lookup(key, version)
+        if self.on_lookup is not None:
+            self.on_lookup(entry is not None)
+        return entry
+
+    def _lookup(self, key, version):
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'data_version': self._version,
+            }
+
+def selection_key(values):
+    # None selects every team/season (league wide queries)
+    return None if values is None else tuple(sorted(values))
+
+def memoize(cache, version):
+    # version() returns the current data version, cached DataFrames are copied out since callers drop columns in place
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(team_ids, years, table_type, *args, **kwargs):
+            key = (fn.__name__, selection_key(team_ids), selection_key(years), table_type, args, tuple(sorted(kwargs.items())))
+            current = version()
+            df = cache.get(key, current)
+            if df is None:
+                df = fn(team_ids, years, table_type, *args, **kwargs)
+                cache.put(key, current, df)
+            return df.copy()
+        return wrapper
+    return decorator
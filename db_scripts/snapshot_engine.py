@@ -0,0 +1,110 @@
+import os,sqlite3,threading,time
+from urllib.request import pathname2url
+import pandas as pd
+import numpy as np
+
+# Optional in-process query engine (BB_QUERY_ENGINE=snapshot in graph_data_query)
+# The whole dataset is small, so every get_* result set is loaded once for all teams and seasons with the same SQL the
+# query engine uses (minus the WHERE clause), sorted by (team_id, season), and answered with row ranges per (team_id, season).
+# When baseball.db (or its WAL) changes, a new snapshot is built on a background thread and swapped in once it's ready,
+# every request (including the one that noticed the change) keeps using the current one meanwhile.
+
+class Snapshot:
+    def __init__(self, frames):
+        # frames: {(kind, table_type): DataFrame sorted by team_id, season}
+        self.frames = {}
+        self.ranges = {}
+        for key, df in frames.items():
+            df = df.reset_index(drop=True)
+            team_ids = df.team_id.to_numpy()
+            seasons = df.season.to_numpy()
+            # Start of every (team_id, season) run in the sorted frame
+            bounds = np.flatnonzero((team_ids[1:] != team_ids[:-1]) | (seasons[1:] != seasons[:-1])) + 1
+            starts = np.concatenate([[0], bounds]) if len(df.index) else np.array([], dtype=int)
+            stops = np.concatenate([bounds, [len(df.index)]]) if len(df.index) else np.array([], dtype=int)
+            self.frames[key] = df
+            self.ranges[key] = {(int(team_ids[a]), int(seasons[a])): (a, b) for a, b in zip(starts, stops)}
+
+    def lookup(self, kind, team_ids, years, table_type):
+        key = (kind, table_type)
+        ranges = self.ranges[key]
+        slices = [ranges[(t, y)] for t in sorted(set(team_ids)) for y in sorted(set(years)) if (t, y) in ranges]
+        if slices:
+            rows = np.concatenate([np.arange(a, b) for a, b in slices])
+        else:
+            rows = np.array([], dtype=int)
+        return self.frames[key].take(rows).reset_index(drop=True)
+
+class SnapshotEngine:
+    def __init__(self, path, builders, check_interval=1.0):
+        # builders: {kind: function(team_ids, years, table_type) -> SQL}, called with None filters to select everything
+        self.path = os.path.abspath(path)
+        self.builders = builders
+        self.check_interval = check_interval
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._checked = 0.0
+        self._signature = self._file_signature()
+        self.snapshot = self._build()
+        self.reloads = 0
+
+    def _file_signature(self):
+        # Writes land in the -wal file before they are checkpointed, so watch both
+        signature = []
+        for path in [self.path, self.path + '-wal']:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _build(self):
+        start = time.perf_counter()
+        frames = {}
+        conn = sqlite3.connect(f'file:{pathname2url(self.path)}?mode=ro', uri=True)
+        try:
+            for kind, builder in self.builders.items():
+                for table_type in ['b', 'p']:
+                    df = pd.read_sql_query(builder(None, None, table_type), conn, coerce_float=True)
+                    sort_cols = ['team_id', 'season'] + (['game_date'] if 'game_date' in df.columns else [])
+                    frames[(kind, table_type)] = df.sort_values(sort_cols, kind='mergesort')
+        finally:
+            conn.close()
+        snapshot = Snapshot(frames)
+        self.build_seconds = time.perf_counter() - start
+        return snapshot
+
+    def _reload(self, signature):
+        # Signature is taken before the build, so writes that land during it trigger another reload
+        try:
+            snapshot = self._build()
+        except Exception as e:
+            # E.g. a table dropped halfway through a rebuild, the next check tries again
+            print(f'Snapshot reload failed: {e!r}')
+        else:
+            self.snapshot = snapshot
+            self._signature = signature
+            self.reloads += 1
+        finally:
+            with self._reload_lock:
+                self._reloading = False
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        # Only one rebuild at a time, and never on the request's thread
+        with self._reload_lock:
+            if self._reloading or now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            signature = self._file_signature()
+            if signature == self._signature:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, args=(signature,), name='snapshot-reload', daemon=True).start()
+
+    def lookup(self, kind, team_ids, years, table_type):
+        self._maybe_reload()
+        return self.snapshot.lookup(kind, team_ids, years, table_type)
@@ -0,0 +1,369 @@
+import os,sqlite3,argparse,time
+import numpy as np
+import pandas as pd
+
+from db_scripts.db_write import quote,bump_data_version
+from db_scripts.aggregates import innings_pitched,batting_rates,pitching_rates,build_aggregates
+
+# Fills a database with generated data in the baseball.db schema, for benchmarks that shouldn't need scraping
+#   python -m db_scripts.synthetic_db --db /tmp/synthetic.db [--teams 30] [--seasons 9] [--games 162] [--batters 15] [--pitchers 12]
+# Same seed and sizes give the same database, sizes go well past the real 30 teams x 9 seasons (teams after the 30 real
+# ones are made up franchises, seasons count back from 2020).
+# How it's drawn:
+#   - every season has its own run environment and every team a batting and a pitching talent that carries over
+#     from season to season, players have their own talent and age through stints of a few seasons on one team
+#   - a game's line comes from times on base before 27 outs, split into hits, walks and so on from the batting team's
+#     and the opposing pitchers' talents; a team's pitching line is its opponent's batting line of the same game
+#   - team seasons are the sums of their games, players split the team's plate appearances / batters faced by role
+#   - every rate (BA, OBP, SLG, ERA, WHIP, FIP, ...) is computed from the generated counts
+# Rows are bulk inserted one season per transaction with journaling off (the file is rebuilt from scratch anyway),
+# the secondary indexes are created after the data.
+
+directory = os.path.dirname(os.path.abspath(__file__))
+last_season = 2020
+stint_seasons = 5
+
+# League averages the draws are centered on
+base = {
+    'reach': .318,                      # times on base (hits, walks, hit by pitch, errors) per plate appearance
+    'reach_split': [.68, .26, .03, .03],    # of those: H, BB, HBP, ROE
+    'hit_split': [.64, .20, .02, .14],      # of hits: 1B, 2B, 3B, HR
+    'SO': .32, 'SF': .009, 'SH': .005, 'GDP': .03,  # per out
+    'IBB': .05, 'score': .28, 'SB': .04, 'CS': .27, 'UER': .07,
+}
+divisions = [('AL', 'East'), ('AL', 'Central'), ('AL', 'West'), ('NL', 'East'), ('NL', 'Central'), ('NL', 'West')]
+positions = ['C', '1B', '2B', '3B', 'SS', 'LF', 'CF', 'RF', 'DH']
+
+def make_teams(count):
+    # The real teams from team_table.csv, then made up ones spread over the six divisions
+    teams = pd.read_csv(os.path.join(directory, 'team_table.csv'), encoding='utf-8-sig').head(count)
+    extra = np.arange(len(teams.index), count)
+    made_up = pd.DataFrame({
+        'id': extra,
+        'name': [f'Synthetic Team {i}' for i in extra],
+        'team_code': [f'S{i:03d}' for i in extra],
+        'league': [divisions[i % 6][0] for i in extra],
+        'division': [divisions[i % 6][1] for i in extra],
+    })
+    return pd.concat([teams, made_up], ignore_index=True)
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def insert_frame(conn, table, df):
+    # One executemany of plain python values (tolist converts the numpy types sqlite3 can't bind)
+    columns = table_columns(conn, table)
+    query = f'INSERT INTO {table} ({", ".join(quote(c) for c in columns)}) VALUES ({",".join("?" for _ in columns)})'
+    conn.executemany(query, zip(*[df[c].tolist() for c in columns]))
+    return len(df.index)
+
+def split(rng, counts, shares):
+    # Multinomial split of every count by its row's shares, one column per share
+    return rng.multinomial(counts, shares).T
+
+def lines(rng, reaches, outs, reach_split, hit_split):
+    # Batting line from times on base and outs made, per row (a game or a player season)
+    df = pd.DataFrame({'PA': reaches + outs})
+    df['H'], df['BB'], df['HBP'], df['ROE'] = split(rng, reaches, reach_split)
+    singles, df['2B'], df['3B'], df['HR'] = split(rng, df.H.to_numpy(), hit_split)
+    df['SO'] = rng.binomial(outs, base['SO'])
+    df['SF'] = rng.binomial(outs - df.SO, base['SF'])
+    df['SH'] = rng.binomial(outs - df.SO - df.SF, base['SH'])
+    df['GDP'] = rng.binomial(outs - df.SO - df.SF - df.SH, base['GDP'])
+    df['AB'] = df.PA - df.BB - df.HBP - df.SF - df.SH
+    df['IBB'] = rng.binomial(df.BB, base['IBB'])
+    df['TB'] = df.H + df['2B'] + 2 * df['3B'] + 3 * df.HR
+    # Runs: every homer plus some of the other runners, the rest are left on base
+    others = df.H - df.HR + df.BB + df.HBP + df.ROE
+    df['R'] = df.HR + rng.binomial(others, base['score'])
+    df['RBI'] = df.R - rng.binomial(df.R, .05)
+    df['SB'] = rng.binomial(singles + df.BB + df.HBP, base['SB'])
+    df['CS'] = rng.binomial(df.SB, base['CS'])
+    return df
+
+def shares(talent, base_split, index):
+    # base_split with category index scaled by talent, renormalized per row
+    split = np.tile(base_split, (len(talent), 1))
+    split[:, index] *= talent
+    return split / split.sum(axis=1, keepdims=True)
+
+class Generator:
+    def __init__(self, teams, seasons, games, batters, pitchers, seed):
+        self.rng = np.random.default_rng(seed)
+        self.teams = teams
+        self.first_season = last_season - seasons + 1
+        self.games = games
+        self.batters = batters
+        self.pitchers = pitchers
+        self.next_game_id = 1
+        count = len(teams.index)
+        # Team talents (batting: on base and power, pitching: on base and power allowed) drift from season to season
+        self.team_talent = self.rng.normal(1, .04, (count, 4))
+        # Player talent, role noise and starting age per (team, slot, stint), ids stay with the stint
+        stints = seasons // stint_seasons + 2
+        self.batter_talent = self.rng.normal(1, .08, (count, batters, stints, 2))
+        self.pitcher_talent = self.rng.normal(1, .08, (count, pitchers, stints, 2))
+        self.batter_age = self.rng.integers(21, 31, (count, batters, stints))
+        self.pitcher_age = self.rng.integers(21, 31, (count, pitchers, stints))
+        self.environment = np.ones(2)
+
+    def next_season(self):
+        # Run environment (on base, power) and team talents are random walks / mean reverting draws
+        self.environment = np.clip(self.environment + self.rng.normal(0, .015, 2), .85, 1.15)
+        self.team_talent = .7 * self.team_talent + .3 * self.rng.normal(1, .04, self.team_talent.shape)
+
+    def schedule(self, season):
+        # games rounds of random pairings (an odd team out sits the day), one game per team per day from April 1st
+        team_ids = self.teams.id.to_numpy()
+        pairs = len(team_ids) // 2
+        days = np.arange(self.games)
+        order = self.rng.permuted(np.tile(team_ids, (self.games, 1)), axis=1)[:, :2 * pairs]
+        home, away = order[:, 0::2].reshape(-1), order[:, 1::2].reshape(-1)
+        dates = (pd.Timestamp(f'{season}-04-01') + pd.to_timedelta(days + days // 6, unit='D')).strftime('%Y-%m-%d').to_numpy()
+        game_ids = self.next_game_id + np.arange(len(home))
+        self.next_game_id += len(home)
+        # Both sides of a game next to each other: rows 2i (home) and 2i + 1 (away)
+        df = pd.DataFrame({
+            'game_id': np.repeat(game_ids, 2),
+            'team_id': np.column_stack([home, away]).reshape(-1),
+            'opp_id': np.column_stack([away, home]).reshape(-1),
+            'game_date': np.repeat(dates, pairs * 2),
+            'HomeAway': np.tile(['H', 'A'], len(home)),
+        })
+        df['season'] = season
+        return df
+
+    def season_games(self, season):
+        df = self.schedule(season)
+        rng = self.rng
+        batting_talent = self.team_talent[df.team_id.to_numpy()]
+        pitching_talent = self.team_talent[df.opp_id.to_numpy()]
+        reach = base['reach'] * self.environment[0] * batting_talent[:, 0] * pitching_talent[:, 2]
+        power = self.environment[1] * batting_talent[:, 1] * pitching_talent[:, 3]
+        # Times on base before the 27th out
+        reaches = rng.negative_binomial(27, 1 - reach)
+        df = pd.concat([df, lines(rng, reaches, np.full(len(reaches), 27), base['reach_split'], shares(power, base['hit_split'], 3))], axis=1)
+        df['LOB'] = np.maximum(df.H + df.BB + df.HBP + df.ROE - df.R - df.GDP - df.CS, 0)
+        df['OppStarterThr'] = np.where(rng.random(len(df.index)) < .7, 'R', 'L')
+        # Ties go to extra innings and a run for one side
+        runs = df.R.to_numpy().reshape(-1, 2)
+        tied = runs[:, 0] == runs[:, 1]
+        runs[tied, rng.integers(0, 2, tied.sum())] += 1
+        df['R'] = runs.reshape(-1)
+        df['RBI'] = np.minimum(df.RBI, df.R)
+        df['RunsAgainst'] = runs[:, ::-1].reshape(-1)
+        df['Result'] = np.where(df.R > df.RunsAgainst, 'W', 'L')
+        df['innings'] = np.where(np.repeat(tied, 2), 10.0, 9.0)
+
+        # A team's pitching line is the other row of the same game
+        pitching = df[['game_id', 'team_id', 'opp_id', 'game_date', 'season', 'HomeAway', 'Result', 'innings']].copy()
+        opponent = np.arange(len(df.index)) ^ 1
+        for column in ['H', 'R', 'BB', 'SO', 'HR', 'HBP', 'PA', 'SB', 'CS', 'AB', '2B', '3B', 'IBB', 'SH', 'SF', 'ROE', 'GDP']:
+            pitching[column] = df[column].to_numpy()[opponent]
+        pitching = pitching.rename(columns={'PA': 'BF'})
+        pitching['RunsFor'] = df.R.to_numpy()
+        pitching['UER'] = rng.binomial(pitching.R, base['UER'])
+        pitching['ER'] = pitching.R - pitching.UER
+        pitching['Pitches'] = np.round(pitching.BF * rng.normal(3.9, .2, len(df.index))).astype(int)
+        pitching['Strikes'] = rng.binomial(pitching.Pitches, .64)
+        pitching['PitchersUsed'] = 1 + rng.poisson(3, len(df.index))
+        pitching['IR'] = rng.poisson(1, len(df.index))
+        pitching['IS'] = rng.binomial(pitching.IR, .3)
+
+        # Gamelogs carry season to date rates, like Baseball Reference's
+        batting = df.drop(columns=['innings']).sort_values(['team_id', 'game_date'], kind='stable').reset_index(drop=True)
+        to_date = batting_rates(batting.groupby('team_id')[['H', 'AB', 'BB', 'HBP', 'SF', 'TB']].cumsum())
+        batting = batting.join(to_date[['BA', 'OBP', 'SLG', 'OPS']])
+        pitching = pitching.sort_values(['team_id', 'game_date'], kind='stable').reset_index(drop=True)
+        to_date = pitching.groupby('team_id')[['ER', 'innings']].cumsum()
+        pitching['ERA'] = (9 * to_date.ER / to_date.innings).round(2)
+        pitching['IP'] = innings_pitched(pitching.innings)
+        return batting, pitching
+
+    def roster(self, season, slots, talent, ages, kind):
+        # One row per team and slot with the slot's current stint
+        team_ids = np.repeat(self.teams.id.to_numpy(), slots)
+        slot = np.tile(np.arange(slots), len(self.teams.index))
+        # Stints are staggered by slot so a team doesn't turn over all at once
+        offset = slot * 3 % stint_seasons
+        stint = (season - self.first_season + offset) // stint_seasons
+        year_in_stint = (season - self.first_season + offset) % stint_seasons
+        df = pd.DataFrame({
+            'player_id': [f'syn{t:04d}{kind}{s:02d}{n:03d}' for t, s, n in zip(team_ids, slot, stint)],
+            'season': season,
+            'team_id': team_ids,
+            'Age': ages[team_ids, slot, stint] + year_in_stint,
+            'slot': slot,
+        })
+        return df, talent[team_ids, slot, stint]
+
+    def playing_time(self, total, slot, regulars, bench_weight):
+        # Regulars share most of the team total, the rest goes to the bench / bullpen
+        weight = np.where(slot < regulars, 1.0, bench_weight) * self.rng.uniform(.8, 1.15, len(slot))
+        team_weight = pd.Series(weight).groupby(np.arange(len(slot)) // (slot.max() + 1)).transform('sum').to_numpy()
+        return np.round(total * weight / team_weight).astype(int)
+
+    def player_seasons(self, season, team_batting, team_pitching):
+        rng = self.rng
+        env = self.environment
+        bat, talent = self.roster(season, self.batters, self.batter_talent, self.batter_age, 'b')
+        team_pa = team_batting.set_index('team_id').PA.reindex(bat.team_id).to_numpy()
+        pa = self.playing_time(team_pa, bat.slot.to_numpy(), 9, .2)
+        reaches = rng.binomial(pa, np.clip(base['reach'] * env[0] * talent[:, 0], .05, .6))
+        bat = pd.concat([bat, lines(rng, reaches, pa - reaches, base['reach_split'], shares(env[1] * talent[:, 1], base['hit_split'], 3)).drop(columns=['PA'])], axis=1)
+        bat['PA'] = pa
+        bat['G'] = np.minimum(self.games, np.ceil(pa / 4.2)).astype(int)
+        bat = batting_rates(bat[bat.AB > 0].reset_index(drop=True))
+
+        pit, talent = self.roster(season, self.pitchers, self.pitcher_talent, self.pitcher_age, 'p')
+        team_bf = team_pitching.set_index('team_id').BF.reindex(pit.team_id).to_numpy()
+        bf = self.playing_time(team_bf, pit.slot.to_numpy(), 5, .35)
+        reaches = rng.binomial(bf, np.clip(base['reach'] * env[0] * talent[:, 0], .05, .6))
+        allowed = lines(rng, reaches, bf - reaches, base['reach_split'], shares(env[1] * talent[:, 1], base['hit_split'], 3))
+        for stat in ['H', 'R', 'HR', 'BB', 'IBB', 'SO', 'HBP']:
+            pit[stat] = allowed[stat]
+        pit['BF'] = bf
+        pit['ER'] = pit.R - rng.binomial(pit.R, base['UER'])
+        # Innings are the outs made
+        true_innings = pd.Series(np.maximum(bf - reaches, 1) / 3.0)
+        starter = pit.slot < 5
+        closer = pit.slot == 5
+        pit['GS'] = np.where(starter, np.round(self.games / 5 * bf / np.maximum(team_bf / 5, 1)), 0).astype(int)
+        pit['G'] = np.where(starter, pit.GS, np.minimum(np.ceil(true_innings), self.games // 2)).astype(int)
+        pit['GF'] = np.where(closer, pit.G * .8, np.where(starter, 0, pit.G * .15)).astype(int)
+        pit['CG'] = np.where(starter, rng.binomial(pit.GS, .02), 0)
+        pit['SHO'] = rng.binomial(pit.CG, .3)
+        pit['SV'] = np.where(closer, rng.binomial(pit.GF, .75), rng.binomial(pit.GF, .05))
+        pit['BK'] = rng.binomial(1, .2, len(pit.index))
+        pit['WP'] = rng.poisson(true_innings / 30)
+        decisions = rng.binomial(pit.G, np.where(starter, .65, .12))
+        pit['wins'] = rng.binomial(decisions, np.clip(.5 + (4.3 - 9 * pit.ER / true_innings) / 20, .2, .8))
+        pit['losses'] = decisions - pit.wins
+        pit = pitching_rates(pit, true_innings)
+        pit['FIP'] = fip(pit, true_innings)
+        return bat, pit
+
+def fip(df, true_innings):
+    return ((13 * df.HR + 3 * (df.BB + df.HBP) - 2 * df.SO) / true_innings.replace(0, np.nan) + 3.1).round(2)
+
+def team_seasons(batting, pitching, games):
+    keys = ['team_id', 'season']
+    sums = ['PA', 'AB', 'R', 'H', '2B', '3B', 'HR', 'RBI', 'SB', 'CS', 'BB', 'SO', 'TB', 'GDP', 'HBP', 'SH', 'SF', 'IBB']
+    team_batting = batting.groupby(keys)[sums].sum()
+    team_batting['G'] = batting.groupby(keys).size()
+    team_batting = batting_rates(team_batting.reset_index())
+
+    team_pitching = pitching.groupby(keys)[['H', 'R', 'ER', 'HR', 'BB', 'IBB', 'SO', 'HBP', 'BF', 'innings']].sum()
+    team_pitching['G'] = pitching.groupby(keys).size()
+    team_pitching = team_pitching.reset_index()
+    team_pitching = pitching_rates(team_pitching, team_pitching.innings)
+    team_pitching['FIP'] = fip(team_pitching, team_pitching.innings)
+
+    wins = (batting.Result == 'W').groupby([batting.team_id, batting.season]).sum()
+    record = pd.DataFrame({'wins': wins, 'losses': team_batting.set_index(keys).G - wins}).reset_index()
+    return record, team_batting, team_pitching
+
+def finish_team_seasons(team_batting, team_pitching, bat, pit):
+    # Age and the pitching columns that only exist per pitcher come from the players
+    keys = ['team_id', 'season']
+    age = (bat.Age * bat.PA).groupby([bat.team_id, bat.season]).sum() / bat.groupby(keys).PA.sum()
+    team_batting['Age'] = age.round(1).reindex(pd.MultiIndex.from_frame(team_batting[keys])).to_numpy()
+    age = (pit.Age * pit.BF).groupby([pit.team_id, pit.season]).sum() / pit.groupby(keys).BF.sum()
+    team_pitching['Age'] = age.round(1).reindex(pd.MultiIndex.from_frame(team_pitching[keys])).to_numpy()
+    index = pd.MultiIndex.from_frame(team_pitching[keys])
+    for stat in ['GS', 'GF', 'CG', 'SHO', 'SV', 'BK', 'WP']:
+        team_pitching[stat] = pit.groupby(keys)[stat].sum().reindex(index).to_numpy()
+    team_pitching['GS'] = team_pitching.G
+    return team_batting, team_pitching
+
+def players(rng, bat, pit):
+    batter_ids = bat.player_id.drop_duplicates()
+    batters = pd.DataFrame({
+        'id': batter_ids,
+        'Name': 'Batter ' + batter_ids.str[3:],
+        'Pos': np.array(positions)[bat.loc[batter_ids.index, 'slot'] % len(positions)],
+        'Handedness': rng.choice(['R', 'L', 'S'], len(batter_ids), p=[.6, .3, .1]),
+    })
+    pitcher_ids = pit.player_id.drop_duplicates()
+    pitchers = pd.DataFrame({
+        'id': pitcher_ids,
+        'Name': 'Pitcher ' + pitcher_ids.str[3:],
+        'Handedness': rng.choice(['R', 'L'], len(pitcher_ids), p=[.7, .3]),
+    })
+    return batters, pitchers
+
+def generate(path, seasons=9, games=162, batters=15, pitchers=12, seed=0, teams=30, aggregates=True, overwrite=False):
+    start = time.perf_counter()
+    # Never replace a database by accident, a scraped one takes hours to rebuild
+    if os.path.exists(path) and not overwrite:
+        raise FileExistsError(f'{path} already exists, pass overwrite=True (--force) to replace it')
+    # The WAL and shared memory files go too, or SQLite would apply the old database's WAL to the new file
+    for suffix in ['', '-wal', '-shm', '-journal']:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    # Nothing to recover if this is interrupted, so no journal and no syncs until the end
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-262144')
+    for name in ['new_tables.sql', 'load_tables.sql']:
+        with open(os.path.join(directory, name), 'r') as f:
+            conn.executescript(f.read())
+    team_table = make_teams(teams)
+    generator = Generator(team_table, seasons, games, batters, pitchers, seed)
+    with conn:
+        insert_frame(conn, 'Teams', team_table.rename(columns={'name': 'Name'}))
+
+    rows = 0
+    known_batters, known_pitchers = set(), set()
+    for season in range(generator.first_season, last_season + 1):
+        generator.next_season()
+        batting, pitching = generator.season_games(season)
+        record, team_batting, team_pitching = team_seasons(batting, pitching, games)
+        bat, pit = generator.player_seasons(season, team_batting, team_pitching)
+        team_batting, team_pitching = finish_team_seasons(team_batting, team_pitching, bat, pit)
+        batter_rows, pitcher_rows = players(generator.rng, bat, pit)
+        batter_rows = batter_rows[~batter_rows.id.isin(known_batters)]
+        pitcher_rows = pitcher_rows[~pitcher_rows.id.isin(known_pitchers)]
+        known_batters.update(batter_rows.id)
+        known_pitchers.update(pitcher_rows.id)
+        with conn:
+            for table, df in [
+                ('Batters', batter_rows), ('Pitchers', pitcher_rows),
+                ('TeamBattingGame', batting), ('TeamPitchingGame', pitching), ('TeamSeason', record),
+                ('TeamBattingSeason', team_batting), ('TeamPitchingSeason', team_pitching),
+                ('PlayerBattingSeason', bat), ('PlayerPitchingSeason', pit),
+            ]:
+                rows += insert_frame(conn, table, df)
+        elapsed = time.perf_counter() - start
+        print(f'\tSeason {season}: {len(batting.index) // 2} games, {len(bat.index)} batter and {len(pit.index)} pitcher seasons'
+            f' ({rows} rows, {rows / elapsed:.0f} rows/s)')
+
+    # Indexes once at the end, cheaper than keeping them up to date through every insert
+    with open(os.path.join(directory, 'indexes.sql'), 'r') as f:
+        conn.executescript(f.read())
+    if aggregates:
+        build_aggregates(conn)
+    with conn:
+        bump_data_version(conn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+    elapsed = time.perf_counter() - start
+    print(f'Wrote {rows} rows ({os.path.getsize(path) / 1024 ** 2:.0f} MB) to {path} in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s)')
+    return rows
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic baseball.db')
+    parser.add_argument('--db', required=True, help='database to create, point BB_DB_PATH at it to use it')
+    parser.add_argument('--force', action='store_true', help='replace --db if it already exists')
+    parser.add_argument('--teams', type=int, default=30, help='number of teams, the first 30 are the real ones')
+    parser.add_argument('--seasons', type=int, default=9, help=f'number of seasons, ending with {last_season}')
+    parser.add_argument('--games', type=int, default=162, help='games per team and season')
+    parser.add_argument('--batters', type=int, default=15, help='batters per team and season')
+    parser.add_argument('--pitchers', type=int, default=12, help='pitchers per team and season')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-aggregates', action='store_true', help="don't build the aggregate tables (faster for big databases)")
+    args = parser.parse_args()
+    if os.path.exists(args.db) and not args.force:
+        parser.error(f'{args.db} already exists, pass --force to replace it')
+    generate(args.db, args.seasons, args.games, args.batters, args.pitchers, args.seed, args.teams, not args.no_aggregates, args.force)
@@ -0,0 +1,140 @@
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import numpy as np
+from db_scripts.db_connect import read_pool
+from db_scripts.aggregates import count_columns,modes,prepare_games,running_sums,team_lines
+from db_scripts.db_write import quote
+from db_scripts import graph_data_query as query_engine
+
+# Season-to-date and N game rolling team stats for the time series tabs
+# Every team's games of a season are kept in play order with running sums of the counting stats (one grouped cumsum),
+# so an N game window is cum[i] - cum[i-N] and rates come from the summed counts (BA = sum H / sum AB, not a mean of game BAs).
+# The lines themselves are db_scripts/aggregates.team_lines, which also builds the TeamGameTrend table after a load.
+# Seasons are cached; when the data version changes only games after the last loaded date are read and appended to the
+# running sums, the season is rebuilt if any game up to that date changed (see signature_query).
+
+def game_table(table_type):
+    return 'TeamBattingGame' if table_type == 'b' else 'TeamPitchingGame'
+
+def season_query(table_type, since=None):
+    query = f'''
+            SELECT t.team_code Team, g.*
+            FROM Teams t JOIN {game_table(table_type)} g
+                ON t.id=g.team_id
+            WHERE g.season=?{' AND g.game_date>?' if since is not None else ''}
+            ORDER BY g.team_id, g.game_date, g.rowid'''
+    return query
+
+def read_games(season, table_type, since=None):
+    # Every game of the season, or only the ones after since
+    params = [season] if since is None else [season, since]
+    return prepare_games(query_engine.make_query(season_query(table_type, since), None, None, params), table_type)
+
+def signature_query(table_type):
+    # Changes when any game up to a date is added, deleted, reinserted (new rowid) or has a stat corrected in place: the
+    # stats are weighted by column and the rows by rowid, so even a correction that keeps the totals shows
+    columns = [c for c in count_columns[table_type] if c != 'innings'] + (['IP'] if table_type == 'p' else [])
+    stats = ' + '.join(f'{i + 1} * COALESCE({quote(c)}, 0)' for i,c in enumerate(columns))
+    query = f'''
+            SELECT COUNT(*), MAX(rowid), TOTAL(rowid * ({stats})), TOTAL(rowid * julianday(game_date))
+            FROM {game_table(table_type)}
+            WHERE season=? AND game_date<=?'''
+    return query
+
+@contextmanager
+def read_transaction():
+    # One read transaction (a WAL snapshot) for the games and their signature, so a load can't slip in between
+    # read_games uses the same pooled connection, nested checkouts on a thread get the one it already holds
+    with read_pool().connection() as conn:
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
+
+class SeasonSeries:
+    def __init__(self, season, table_type, version):
+        self.season = season
+        self.table_type = table_type
+        self.version = version
+        self.rebuilds = 0
+        self.appends = 0
+        with read_transaction() as conn:
+            self._set(conn, read_games(season, table_type))
+
+    def _set(self, conn, games):
+        self.games = games.reset_index(drop=True)
+        self.cum = running_sums(self.games, self.table_type)
+        self.rebuilds += 1
+        self._mark(conn)
+
+    def _signature(self, conn, last_date):
+        return conn.execute(signature_query(self.table_type), (self.season, last_date)).fetchone()
+
+    def _mark(self, conn):
+        # Newest date loaded and the signature of every game up to it, to tell appended games from changed ones
+        self.last_date = self.games.game_date.max() if len(self.games.index) else None
+        self.signature = self._signature(conn, self.last_date) if self.last_date is not None else None
+
+    def refresh(self, version):
+        if version == self.version:
+            return
+        with read_transaction() as conn:
+            if self.last_date is None or self._signature(conn, self.last_date) != self.signature:
+                # A game up to the newest date was added, removed or corrected (a sync upsert, a reloaded unit, a
+                # rebuild), the running sums start over
+                self._set(conn, read_games(self.season, self.table_type))
+            else:
+                self._append(conn, read_games(self.season, self.table_type, since=self.last_date))
+        self.version = version
+
+    def _append(self, conn, new):
+        # Games after the newest date, everything up to it is unchanged
+        if not len(new.index):
+            return
+        new = new.reset_index(drop=True)
+        # Running sums continue from each team's last game
+        last = self.cum.groupby(self.games.team_id.to_numpy(), sort=False).last()
+        start = last.reindex(new.team_id.to_numpy()).fillna(0).to_numpy()
+        new_cum = running_sums(new, self.table_type) + start
+        games = pd.concat([self.games, new], ignore_index=True)
+        cum = pd.concat([self.cum, new_cum], ignore_index=True)
+        # Stable sort by team keeps the appended games after each team's earlier ones
+        order = np.argsort(games.team_id.to_numpy(), kind='stable')
+        self.games = games.take(order).reset_index(drop=True)
+        self.cum = cum.take(order).reset_index(drop=True)
+        self.appends += 1
+        self._mark(conn)
+
+    def window(self, team_ids, mode, size):
+        # team_lines of the selected teams
+        rows = np.flatnonzero(self.games.team_id.isin(team_ids).to_numpy())
+        games = self.games.take(rows).reset_index(drop=True)
+        cum = self.cum.take(rows).reset_index(drop=True)
+        return team_lines(games, cum, self.table_type, mode, size)
+
+class TimeSeriesEngine:
+    def __init__(self):
+        self._seasons = {}
+        self._lock = threading.Lock()
+
+    def _season(self, season, table_type, version):
+        series = self._seasons.get((season, table_type))
+        if series is None:
+            series = SeasonSeries(season, table_type, version)
+            self._seasons[(season, table_type)] = series
+        else:
+            series.refresh(version)
+        return series
+
+    def team_series(self, team_ids, season, table_type, mode, size=10):
+        version = query_engine.data_version()
+        # Appends replace the season's arrays, so windows are cut under the same lock
+        with self._lock:
+            return self._season(season, table_type, version).window(team_ids, mode, size)
+
+engine = TimeSeriesEngine()
+
+def get_team_series(team_ids, season, table_type, mode, size=10):
+    return engine.team_series(team_ids, season, table_type, mode, size)
@@ -0,0 +1,188 @@
+import os,time,atexit,random,asyncio,threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime,timezone
+import aiohttp
+
+# Shared HTTP client for the scrapers (data_insert, page_cache)
+# One asyncio event loop in a background thread owns an aiohttp session, so every fetch reuses the same pool of
+# keep-alive connections. fetch() and request() can be called from any thread (the load pipeline's fetchers), they run
+# the get() coroutine on the client's loop.
+# Every attempt takes a token from one requests-per-minute bucket, which is what Baseball Reference limits on (20/min).
+# Connection errors, timeouts, 429 and 5xx responses are retried with exponential backoff and full jitter; a Retry-After
+# header is honoured, and on a 429 it pauses the whole bucket, not just the request that got it. Other 4xx fail at once.
+
+retry_statuses = {429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    def __init__(self, url, status=None, attempts=1, cause=None):
+        self.url = url
+        self.status = status
+        self.attempts = attempts
+        reason = f'HTTP {status}' if status is not None else repr(cause)
+        super().__init__(f'{url}: {reason} after {attempts} attempt{"s" if attempts != 1 else ""}')
+
+class Page:
+    # Response of one successful request, headers are case insensitive
+    def __init__(self, url, status, headers, content):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+def retry_after(value):
+    # Seconds from a Retry-After header (delay or HTTP date), None if missing or unreadable
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    # requests_per_minute tokens refill continuously up to burst, every attempt waits for one
+    def __init__(self, requests_per_minute, burst=1):
+        self.rate = requests_per_minute / 60
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = None
+
+    async def acquire(self):
+        # The lock is made on first use so it belongs to the loop that uses it
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        # Nobody gets a token for seconds (the server said to back off), and the bucket starts empty afterwards
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+class FetchClient:
+    def __init__(self, requests_per_minute=20, burst=1, connections=4, timeout=30.0, connect_timeout=10.0,
+            max_attempts=5, backoff=2.0, max_backoff=120.0, seed=None):
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.connections = connections
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.bytes = 0
+        self._random = random.Random(seed)
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='fetch-client', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    async def _get_session(self):
+        # Created on the client's loop, the session can't move between loops
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout),
+                headers={'User-Agent': 'baseball-stats-loader'})
+        return self._session
+
+    def backoff_delay(self, attempt):
+        # Full jitter: anywhere between 0 and the exponential cap, so retrying fetchers don't line up
+        return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    async def get(self, url, headers=None):
+        # Page for a 2xx or 304 response, FetchError once the attempts run out or on any other status
+        session = await self._get_session()
+        for attempt in range(1, self.max_attempts + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            wait = None
+            try:
+                async with session.get(url, headers=headers) as r:
+                    content = await r.read()
+                    if r.status < 400:
+                        self.bytes += len(content)
+                        return Page(url, r.status, r.headers.copy(), content)
+                    if r.status not in retry_statuses:
+                        self.failures += 1
+                        raise FetchError(url, r.status, attempt)
+                    error = FetchError(url, r.status, attempt)
+                    wait = retry_after(r.headers.get('Retry-After'))
+                    if r.status == 429:
+                        self.throttled += 1
+                        self.bucket.pause(wait if wait is not None else self.backoff_delay(attempt))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt == self.max_attempts:
+                self.failures += 1
+                if isinstance(error, FetchError):
+                    raise FetchError(url, error.status, attempt)
+                raise FetchError(url, attempts=attempt, cause=error) from error
+            self.retries += 1
+            delay = max(wait or 0.0, self.backoff_delay(attempt))
+            print(f'\tretrying {url} in {delay:.1f}s ({error})')
+            await asyncio.sleep(delay)
+
+    def request(self, url, headers=None):
+        # get() from a thread outside the client's loop (the load pipeline's fetchers)
+        return asyncio.run_coroutine_threadsafe(self.get(url, headers), self._ensure_loop()).result()
+
+    def fetch(self, url):
+        return self.request(url).content
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+
+    def report(self):
+        print(f'HTTP: {self.requests} requests ({self.bytes / 1e6:.1f} MB), {self.retries} retries, '
+            f'{self.throttled} throttled (429), {self.failures} failed')
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def default_client():
+    # Process wide client for the one-off insert_* loaders, BB_REQUESTS_PER_MINUTE sets its rate
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = FetchClient(requests_per_minute=float(os.environ.get('BB_REQUESTS_PER_MINUTE', 20)))
+            atexit.register(_default_client.close)
+        return _default_client
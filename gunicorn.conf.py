@@ -0,0 +1,32 @@
+import os,multiprocessing
+
+# Production server settings, run from the main repo directory with
+#   gunicorn -c gunicorn.conf.py index:server
+# Debug, dev tools and hot reload only exist in index.py's run_server, so none of them are on here
+# BB_BIND, BB_WORKERS, BB_THREADS and BB_TIMEOUT override the defaults below
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get('BB_BIND', '0.0.0.0:8050')
+# Callbacks are mostly pandas and SQLite work holding the GIL, so one process per core adds throughput and threads cover
+# the waits (db reads, the result store disk tier, slow clients). More processes than cores only compete for the CPU.
+workers = int(os.environ.get('BB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('BB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('BB_TIMEOUT', 60))
+# The app is imported once in the master and forked, the db pools and caches are only created on first use in each worker
+preload_app = True
+# Recycle workers now and then so their in-memory caches don't only grow
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = os.environ.get('BB_ACCESS_LOG')
+
+# Workers share the stored DataFrames through the result store's disk tier, so a key one worker hands to the browser
+# can be loaded by any other without rerunning the query
+os.environ.setdefault('BB_RESULT_STORE_DIR', os.path.join(directory, '.result_cache'))
+
+def when_ready(server):
+    # The app itself loads plotting lazily (benchmarks/bench_startup.py), but here the master imports it once before
+    # forking so no worker pays for it on its first figure
+    import plotly.express
+    import plotly.graph_objects
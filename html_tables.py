@@ -0,0 +1,75 @@
+import pandas as pd
+from lxml import html,etree
+
+# Single pass extraction of Baseball Reference stat tables with lxml
+# Columns are labelled with the header text (blank headers become 'Unnamed: <i>' like pd.read_html) and body cells are
+# matched to them through their data-stat attribute, so repeated header rows, spacer rows and cell order don't matter.
+# Player ids come from the data-append-csv attribute of the player cell and end up in a player_id column.
+
+skip_row_classes = {'thead', 'over_header', 'spacer'}
+
+class TableNotFound(Exception):
+    pass
+
+def find_table(tree, table_id):
+    tables = tree.xpath('//table[@id=$table_id]', table_id=table_id)
+    if tables:
+        return tables[0]
+    # Some tables are shipped inside html comments and only uncommented by javascript
+    for comment in tree.xpath('//comment()[contains(., $table_id)]', table_id=table_id):
+        tables = html.fromstring(comment.text).xpath('//table[@id=$table_id]', table_id=table_id)
+        if tables:
+            return tables[0]
+    raise TableNotFound(table_id)
+
+def header_columns(table):
+    # (data-stat, label) for every column of the last header row
+    header_rows = table.xpath('./thead/tr')
+    if not header_rows:
+        raise TableNotFound(f'{table.get("id")} has no header')
+    columns = []
+    for i, th in enumerate(header_rows[-1].xpath('./th|./td')):
+        label = th.text_content().strip()
+        columns.append((th.get('data-stat'), label or f'Unnamed: {i}'))
+    return columns
+
+def body_rows(table, include_footer):
+    sections = ['./tbody/tr', './tfoot/tr'] if include_footer else ['./tbody/tr']
+    for section in sections:
+        for tr in table.xpath(section):
+            if skip_row_classes.intersection((tr.get('class') or '').split()):
+                continue
+            yield tr
+
+def typed_column(values):
+    # Numeric if every non-empty cell parses as a number, text otherwise
+    series = pd.Series(values, dtype=object)
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series
+
+def extract_table(content, table_id, include_footer=False):
+    tree = content if isinstance(content, etree._Element) else html.fromstring(content)
+    table = find_table(tree, table_id)
+    columns = header_columns(table)
+    stats = [stat for stat, _ in columns]
+    values = {stat: [] for stat in stats}
+    player_ids = []
+
+    for tr in body_rows(table, include_footer):
+        cells = {}
+        player_id = None
+        for cell in tr.xpath('./th|./td'):
+            stat = cell.get('data-stat')
+            cells[stat] = cell.text_content().strip() or None
+            if stat == 'player':
+                player_id = cell.get('data-append-csv')
+        for stat in stats:
+            values[stat].append(cells.get(stat))
+        player_ids.append(player_id)
+
+    data = pd.DataFrame({label: typed_column(values[stat]) for stat, label in columns})
+    if any(player_id is not None for player_id in player_ids):
+        data.insert(0, 'player_id', pd.Series(player_ids, dtype=object))
+    return data
@@ -1,19 +1,18 @@
+import os
 import dash
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input,Output
 
-import sys,requests,json,hashlib
-from requests.exceptions import HTTPError
-
 from app import app
-from pages import tables,scatter_plots,time_series
+from pages import tables,scatter_plots,time_series,leaders
 import sidebar
 
 server = app.server
 
-debug = True
+# Development server only, production runs app.server under gunicorn (gunicorn.conf.py)
+debug = os.environ.get('BB_DEBUG', '1') == '1'
 
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
@@ -43,6 +42,8 @@ def display_page(pathname):
         return tables.layout
     elif pathname == '/ts':
         return time_series.layout
+    elif pathname == '/leaders':
+        return leaders.layout
     else:
         return index_page
 
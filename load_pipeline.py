@@ -0,0 +1,182 @@
+import threading,queue,time
+from concurrent.futures import ThreadPoolExecutor
+
+# Staged scrape-and-load pipeline used by data_insert.populate_db
+# fetch (thread pool) -> parse (worker threads) -> write (single thread owning the db connection)
+# Rate limiting is up to the fetch function: data_insert's goes through the token bucket of a fetch_client.FetchClient
+# A job is (url, parser, writer, args): parser(content, *args) returns a payload and writer(conn, payload, stage) stages its rows
+# on a db_write.RowStage and returns how many. The writer thread flushes the stage and commits once batch_rows rows are
+# staged or no page arrived for commit_interval seconds, so an offline rebuild writes big batches and a rate limited scrape
+# still commits every page soon after it's parsed
+# on_error(conn, writer, args, e) runs on the writer thread for every job whose page couldn't be fetched or parsed, in the
+# same transaction as the next batch (data_insert records the failed unit there)
+
+class LoadStats:
+    def __init__(self):
+        self.pages = 0
+        self.page_bytes = 0
+        self.rows = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.errors = []
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add_page(self, content):
+        with self._lock:
+            self.pages += 1
+            self.page_bytes += len(content)
+
+    def add_batch(self, rows, seconds):
+        with self._lock:
+            self.rows += rows
+            self.batches += 1
+            self.write_seconds += seconds
+
+    def add_error(self, stage, label, e):
+        with self._lock:
+            self.errors.append((stage, label, e))
+        print(f'{stage} failed for {label}: {e!r}')
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        print(f'Fetched {self.pages} pages ({self.page_bytes / 1e6:.1f} MB) and wrote {self.rows} rows in {elapsed:.1f}s')
+        print(f'\t{self.pages / elapsed:.2f} pages/sec, {self.rows / elapsed:.1f} rows/sec')
+        if self.batches:
+            # Time the writer thread spent staging, inserting and committing, without waiting for pages
+            print(f'\tdb writes: {self.batches} transactions, {self.write_seconds:.2f}s, '
+                f'{self.rows / max(self.write_seconds, 1e-9):.0f} rows/sec')
+        if self.errors:
+            print(f'\t{len(self.errors)} errors')
+
+def _job_label(url, args):
+    return ' '.join(str(a) for a in args) if args else url
+
+def run_pipeline(jobs, fetch, open_conn, stage, fetch_workers=4, parse_workers=2, queue_size=32, batch_rows=20000, commit_interval=1.0, on_error=None):
+    stats = LoadStats()
+
+    # Group consumers by url so a page shared by several tables is only downloaded once
+    consumers = {}
+    for url, parser, writer, args in jobs:
+        consumers.setdefault(url, []).append((parser, writer, args))
+
+    # Bounded queues so fast fetchers can't pile up unparsed pages in memory
+    parse_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    fatal = []
+
+    def job_failed(url, writer, args, e):
+        # A None writer tells the writer thread to hand the failure to on_error
+        if on_error is not None:
+            write_queue.put((None, (writer, args, e), _job_label(url, args)))
+
+    def fetch_stage(url):
+        try:
+            content = fetch(url)
+        except Exception as e:
+            stats.add_error('fetch', url, e)
+            for parser, writer, args in consumers[url]:
+                job_failed(url, writer, args, e)
+            return
+        # None means the page hasn't changed since the last load, nothing to parse
+        if content is None:
+            return
+        stats.add_page(content)
+        parse_queue.put((url, content))
+
+    def parse_stage():
+        while True:
+            item = parse_queue.get()
+            if item is None:
+                break
+            url, content = item
+            for parser, writer, args in consumers[url]:
+                try:
+                    payload = parser(content, *args)
+                except Exception as e:
+                    stats.add_error('parse', f'{_job_label(url, args)} ({parser.__name__})', e)
+                    job_failed(url, writer, args, e)
+                    continue
+                write_queue.put((writer, payload, _job_label(url, args)))
+
+    def write_stage():
+        conn = open_conn()
+        labels = []
+        seconds = 0.0
+
+        def fail(label, e):
+            # Everything since the last commit goes, the load stops
+            stage.clear()
+            conn.rollback()
+            conn.close()
+            stats.add_error('write', label, e)
+            fatal.append(e)
+
+        def commit():
+            nonlocal seconds
+            start = time.perf_counter()
+            try:
+                rows = stage.flush(conn)
+                conn.commit()
+            except Exception as e:
+                fail(f'batch of {len(labels)} ({labels[0]} .. {labels[-1]})', e)
+                return
+            stats.add_batch(rows, seconds + time.perf_counter() - start)
+            print(f'\tcommitted {rows} rows of {len(labels)} pages')
+            labels.clear()
+            seconds = 0.0
+
+        try:
+            while True:
+                try:
+                    item = write_queue.get(timeout=commit_interval if labels and not fatal else None)
+                except queue.Empty:
+                    commit()
+                    continue
+                if item is None:
+                    break
+                # Keep draining after a fatal error so the parse stage never blocks on a full queue
+                if fatal:
+                    continue
+                writer, payload, label = item
+                start = time.perf_counter()
+                try:
+                    if writer is None:
+                        on_error(conn, *payload)
+                        labels.append(f'{label} {payload[0].__name__} failed')
+                        continue
+                    rows = writer(conn, payload, stage)
+                except Exception as e:
+                    fail(f'{label} ({(writer or payload[0]).__name__})', e)
+                    continue
+                seconds += time.perf_counter() - start
+                labels.append(f'{label} {writer.__name__}')
+                print(f'{label}\t{writer.__name__}: {rows} rows')
+                if stage.rows >= batch_rows:
+                    commit()
+            if labels and not fatal:
+                commit()
+        finally:
+            if not fatal:
+                conn.close()
+
+    writer_thread = threading.Thread(target=write_stage, name='db-writer')
+    parser_threads = [threading.Thread(target=parse_stage, name=f'parser-{i}') for i in range(parse_workers)]
+    writer_thread.start()
+    for t in parser_threads:
+        t.start()
+
+    with ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetcher') as pool:
+        list(pool.map(fetch_stage, consumers))
+
+    for _ in parser_threads:
+        parse_queue.put(None)
+    for t in parser_threads:
+        t.join()
+    write_queue.put(None)
+    writer_thread.join()
+
+    stats.report()
+    if fatal:
+        raise fatal[0]
+    return stats
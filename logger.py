@@ -1,16 +1,48 @@
-import sys,os,logging
+import sys,os,json,logging,traceback
+
+# Structured logs: every record is an event name plus fields, one line each
+# key=value pairs by default, BB_LOG_FORMAT=json writes JSON lines instead
+# BB_LOG_LEVEL sets the level (default INFO), BB_LOG_FILE a file to append to instead of stderr
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json=False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {'time': self.formatTime(record), 'level': record.levelname, 'event': record.getMessage()}
+        fields.update(getattr(record, 'fields', {}))
+        if self.as_json:
+            return json.dumps(fields, default=str)
+        # Strings with spaces and nested values are quoted as JSON so every line still splits on spaces
+        return ' '.join(f'{key}={value if isinstance(value, (int, float)) or (isinstance(value, str) and " " not in value) else json.dumps(value, default=str)}'
+            for key, value in fields.items())
+
+logger = logging.getLogger('bb')
+if not logger.handlers:
+    log_file = os.environ.get('BB_LOG_FILE')
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(StructuredFormatter(os.environ.get('BB_LOG_FORMAT') == 'json'))
+    logger.addHandler(handler)
+    logger.setLevel(os.environ.get('BB_LOG_LEVEL', 'INFO').upper())
+    logger.propagate = False
 
 def exepcetion_info(e):
-    pass
+    # Fields describing an exception, for log_error(..., **exepcetion_info(e))
+    return {
+        'error': type(e).__name__,
+        'message': str(e),
+        'traceback': ''.join(traceback.format_exception(type(e), e, e.__traceback__)),
+    }
 
-def log_debug():
-    pass
+def log_debug(event, **fields):
+    logger.debug(event, extra={'fields': fields})
 
-def log_info():
-    pass
+def log_info(event, **fields):
+    logger.info(event, extra={'fields': fields})
 
-def log_warning():
-    pass
+def log_warning(event, **fields):
+    logger.warning(event, extra={'fields': fields})
 
-def log_error():
-    pass
+def log_error(event, **fields):
+    logger.error(event, extra={'fields': fields})
@@ -0,0 +1,298 @@
+import os,time,json,random,threading,cProfile,pstats
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import flask
+
+import logger
+
+# Instrumentation for the Dash callbacks
+# Every /_dash-update-component request gets a trace: wall time by phase, rows read, cache hits/misses and response size.
+# Phases: deserialize (request JSON), sql (execute + fetch), scan (parquet engine reads), dataframe (building the frame),
+# store_load/store_save (result store pickles), figure (plotly figure build), compute (the rest of the callback) and
+# serialize (the rest of the request after the callback, almost all of it Dash encoding the outputs as JSON).
+# Finished traces go to the structured log (logger.py) and to rolling histograms served at /metrics (Prometheus text)
+# and /metrics.json (same histograms with percentiles, plus the cache and connection pool stats). Under gunicorn every
+# worker keeps its own, so each scrape only covers the worker that answered it.
+# BB_PROFILE=1 also profiles a sample of callback requests (BB_PROFILE_SAMPLE, default 1.0) and writes a report for every
+# one slower than BB_SLOW_MS (default 1000) to BB_PROFILE_DIR (cProfile, or pyinstrument if installed with BB_PROFILER=pyinstrument)
+
+directory = os.path.dirname(os.path.abspath(__file__))
+window = float(os.environ.get('BB_METRICS_WINDOW', 300))
+slow_seconds = float(os.environ.get('BB_SLOW_MS', 1000)) / 1000
+profile_enabled = os.environ.get('BB_PROFILE') == '1'
+profile_sample = float(os.environ.get('BB_PROFILE_SAMPLE', 1.0))
+profile_dir = os.environ.get('BB_PROFILE_DIR', os.path.join(directory, '.profiles'))
+profiler_kind = os.environ.get('BB_PROFILER', 'cprofile')
+
+# Phases that don't contain each other, compute is what's left of the callback after them
+leaf_phases = ['sql', 'scan', 'dataframe', 'store_load', 'store_save', 'figure']
+buckets = {
+    'seconds': [.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10],
+    'bytes': [1024, 4096, 16384, 65536, 262144, 1048576, 4194304],
+    'rows': [10, 100, 1000, 10000, 100000, 1000000],
+}
+
+class Histogram:
+    # Samples from the last window seconds (at most max_samples), so the percentiles follow the current load
+    def __init__(self, bounds, max_samples=4096):
+        self.bounds = bounds
+        self._samples = deque(maxlen=max_samples)
+
+    def add(self, value, now):
+        self._samples.append((now, value))
+
+    def snapshot(self, now):
+        while self._samples and self._samples[0][0] < now - window:
+            self._samples.popleft()
+        values = sorted(value for _, value in self._samples)
+        n = len(values)
+        cumulative, i = [], 0
+        for bound in self.bounds:
+            while i < n and values[i] <= bound:
+                i += 1
+            cumulative.append(i)
+        percentile = lambda q: values[min(n - 1, int(q * n))] if n else 0
+        return {
+            'count': n,
+            'sum': sum(values),
+            'p50': percentile(.5),
+            'p95': percentile(.95),
+            'p99': percentile(.99),
+            'max': values[-1] if n else 0,
+            'buckets': list(zip(self.bounds, cumulative)),
+        }
+
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+
+def observe(metric, unit, value, **labels):
+    key = (f'{metric}_{unit}', tuple(sorted(labels.items())))
+    now = time.monotonic()
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets[unit])
+        histogram.add(value, now)
+
+def increment(metric, n=1, **labels):
+    key = (f'{metric}_total', tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.callback = None
+        self.phases = {}
+        self.counts = {}
+        self.profiler = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+_local = threading.local()
+
+def current():
+    return getattr(_local, 'trace', None)
+
+@contextmanager
+def phase(name):
+    # Adds the block's wall time to the request's trace, also works as a decorator; free outside callback requests
+    trace = current()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+def count(name, n=1):
+    trace = current()
+    if trace is not None:
+        trace.counts[name] = trace.counts.get(name, 0) + n
+
+def timed(metric):
+    # Latency histogram per function (e.g. every graph_data_query get_*), recorded in and out of requests
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(metric, 'seconds', time.perf_counter() - start, function=fn.__name__)
+        return wrapper
+    return decorator
+
+def traced_callback(func):
+    name = f'{func.__module__.rsplit(".", 1)[-1]}.{func.__name__}'
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = current()
+        if trace is None:
+            return func(*args, **kwargs)
+        trace.callback = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.add('callback', time.perf_counter() - start)
+    return wrapper
+
+def start_profiler():
+    if profiler_kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.log_warning('profiler_missing', profiler='pyinstrument', using='cprofile')
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profiler(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+def write_profile(profiler, name, seconds):
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{name}-{int(1000 * seconds)}ms')
+    if isinstance(profiler, cProfile.Profile):
+        # .prof for snakeviz/pstats, .txt with the top functions by cumulative time
+        profiler.dump_stats(path + '.prof')
+        with open(path + '.txt', 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        return path + '.prof'
+    with open(path + '.html', 'w') as f:
+        f.write(profiler.output_html())
+    return path + '.html'
+
+def start_request():
+    if not flask.request.path.endswith('_dash-update-component'):
+        return
+    trace = _local.trace = Trace()
+    # Flask keeps the parsed body, so Dash's own get_json() afterwards is free
+    with phase('deserialize'):
+        flask.request.get_json(silent=True)
+    if profile_enabled and random.random() < profile_sample:
+        trace.profiler = start_profiler()
+
+def finish_request(response):
+    trace = current()
+    if trace is None:
+        return response
+    _local.trace = None
+    total = time.perf_counter() - trace.start
+    if trace.profiler is not None:
+        stop_profiler(trace.profiler)
+    name = trace.callback or 'unknown'
+    phases = trace.phases
+    callback = phases.pop('callback', 0.0)
+    phases['compute'] = max(callback - sum(phases.get(p, 0.0) for p in leaf_phases), 0.0)
+    phases['serialize'] = max(total - callback - phases.get('deserialize', 0.0), 0.0)
+    # Runs before Flask-Compress (after_request functions go in reverse order), so this is the uncompressed size
+    size = 0 if response.direct_passthrough else len(response.get_data())
+    counts = dict(trace.counts)
+    rows = counts.pop('rows', 0)
+
+    observe('callback', 'seconds', total, callback=name)
+    for p, seconds in phases.items():
+        observe('phase', 'seconds', seconds, callback=name, phase=p)
+    observe('response', 'bytes', size, callback=name)
+    observe('rows_read', 'rows', rows, callback=name)
+    increment('callback_requests', callback=name, status=response.status_code)
+    for counter, n in counts.items():
+        increment(counter, n, callback=name)
+
+    fields = dict(callback=name, status=response.status_code, ms=round(1000 * total, 1), bytes=size, rows=rows,
+        phases_ms={p: round(1000 * s, 1) for p, s in phases.items() if s}, **counts)
+    if total > slow_seconds:
+        if trace.profiler is not None:
+            # A report that can't be written shouldn't fail the request it describes
+            try:
+                fields['profile'] = write_profile(trace.profiler, name, total)
+            except OSError as e:
+                logger.log_error('profile_not_written', **logger.exepcetion_info(e))
+        logger.log_warning('slow_callback', **fields)
+    else:
+        logger.log_info('callback', **fields)
+    return response
+
+def snapshot():
+    now = time.monotonic()
+    with _lock:
+        histograms = {key: histogram.snapshot(now) for key, histogram in _histograms.items()}
+        counters = dict(_counters)
+    return histograms, counters
+
+def component_stats():
+    # Imported here, these modules import this one
+    from db_scripts import graph_data_query
+    from db_scripts.db_connect import read_pool
+    import result_store
+    return {
+        'query_cache': graph_data_query.cache_stats(),
+        'result_store': result_store.store.stats(),
+        'db_pool': read_pool().stats(),
+    }
+
+def label_text(labels, extra=()):
+    pairs = [*labels, *extra]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}' if pairs else ''
+
+def metrics_text():
+    histograms, counters = snapshot()
+    lines = []
+    for metric in sorted({key[0] for key in histograms}):
+        lines.append(f'# TYPE bb_{metric} histogram')
+        for (name, labels), h in sorted(histograms.items()):
+            if name != metric:
+                continue
+            for bound, n in h['buckets']:
+                lines.append(f'bb_{metric}_bucket{label_text(labels, [("le", bound)])} {n}')
+            lines.append(f'bb_{metric}_bucket{label_text(labels, [("le", "+Inf")])} {h["count"]}')
+            lines.append(f'bb_{metric}_sum{label_text(labels)} {h["sum"]}')
+            lines.append(f'bb_{metric}_count{label_text(labels)} {h["count"]}')
+    for metric in sorted({key[0] for key in counters}):
+        lines.append(f'# TYPE bb_{metric} counter')
+        for (name, labels), n in sorted(counters.items()):
+            if name == metric:
+                lines.append(f'bb_{metric}{label_text(labels)} {n}')
+    for component, stats in component_stats().items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'# TYPE bb_{component}_{stat} gauge')
+                lines.append(f'bb_{component}_{stat} {value}')
+    return flask.Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def metrics_json():
+    histograms, counters = snapshot()
+    return flask.Response(json.dumps({
+        'pid': os.getpid(),
+        'window_seconds': window,
+        'histograms': [{'metric': name, **dict(labels), **{k: v for k, v in h.items() if k != 'buckets'}}
+            for (name, labels), h in sorted(histograms.items())],
+        'counters': [{'metric': name, **dict(labels), 'value': n} for (name, labels), n in sorted(counters.items())],
+        **component_stats(),
+    }, default=str), mimetype='application/json')
+
+def instrument(app):
+    # Has to run before any page module registers its callbacks
+    register = app.callback
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+        return lambda func: decorator(traced_callback(func))
+    app.callback = callback
+    app.server.before_request(start_request)
+    app.server.after_request(finish_request)
+    app.server.add_url_rule('/metrics', 'metrics', metrics_text)
+    app.server.add_url_rule('/metrics.json', 'metrics_json', metrics_json)
@@ -0,0 +1,192 @@
+import os,re,json,gzip,hashlib,threading,tempfile,time
+from datetime import datetime
+
+# On disk cache for scraped Baseball Reference pages
+# Pages are stored gzipped under the sha256 of their content (blobs/), and an index entry per url (index/) points at the blob
+# along with the validators needed for conditional requests. A page fetched after its season ended never changes again, so
+# it's served straight from disk; anything fetched during the season is revalidated with If-None-Match/If-Modified-Since,
+# and the revalidated copy then counts as fetched after the season.
+
+directory = os.path.dirname(os.path.abspath(__file__))
+default_cache_dir = os.path.join(directory, '.page_cache')
+default_max_bytes = 512 * 1024 * 1024
+
+season_patterns = [re.compile(r'[?&]year=(\d{4})'), re.compile(r'/(\d{4})-\w+\.shtml')]
+
+class PageNotCached(Exception):
+    pass
+
+def url_season(url):
+    for pattern in season_patterns:
+        match = pattern.search(url)
+        if match:
+            return int(match.group(1))
+    return None
+
+def season_end(season):
+    # Epoch time the season is over by, final box scores and corrections included
+    return datetime(season + 1, 1, 1).timestamp()
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class PageCache:
+    def __init__(self, client=None, cache_dir=default_cache_dir, max_bytes=default_max_bytes, offline=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # offline: never touch the network, a page that isn't cached raises PageNotCached
+        self.offline = offline
+        # fetch_client.FetchClient for the requests that actually go to the network, it does the rate limiting and retries
+        self.client = client
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self._total_bytes = None
+        self._lock = threading.Lock()
+
+    def _index_path(self, url):
+        key = _sha256(url.encode('utf-8'))
+        return os.path.join(self.cache_dir, 'index', key[:2], key + '.json')
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.cache_dir, 'blobs', content_hash[:2], content_hash + '.gz')
+
+    def is_final(self, url, entry):
+        # Only a copy fetched once its season was over, one cached mid-season still misses the last games
+        season = url_season(url)
+        return season is not None and entry['fetched_at'] >= season_end(season)
+
+    def _count(self, counter):
+        # get() runs on the load pipeline's fetch threads
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _load_entry(self, url):
+        path = self._index_path(url)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+            with open(self._blob_path(entry['content_hash']), 'rb') as f:
+                content = gzip.decompress(f.read())
+        except (OSError, ValueError, KeyError):
+            return None, None
+        # Index mtime doubles as the last access time for eviction
+        os.utime(path)
+        return entry, content
+
+    def _store(self, url, content, response):
+        content_hash = _sha256(content)
+        blob_path = self._blob_path(content_hash)
+        new_blob = not os.path.exists(blob_path)
+        if new_blob:
+            _atomic_write(blob_path, gzip.compress(content))
+        entry = {
+            'url': url,
+            'content_hash': content_hash,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'size': os.path.getsize(blob_path),
+        }
+        _atomic_write(self._index_path(url), json.dumps(entry).encode('utf-8'))
+        if new_blob:
+            with self._lock:
+                if self._total_bytes is not None:
+                    self._total_bytes += entry['size']
+            if self.size() > self.max_bytes:
+                self.evict()
+
+    def get(self, url):
+        # Returns (content, changed), where changed is False when the cached copy is still current
+        entry, content = self._load_entry(url)
+        if entry is not None and (self.offline or self.is_final(url, entry)):
+            self._count('hits')
+            return content, False
+        if self.offline:
+            raise PageNotCached(url)
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        # Failed requests raise fetch_client.FetchError
+        r = self.client.request(url, headers=headers)
+        if r.status == 304 and entry is not None:
+            self._count('revalidated')
+            # Still the same page, but as of now, which makes it final once the season is over
+            entry['fetched_at'] = time.time()
+            _atomic_write(self._index_path(url), json.dumps(entry).encode('utf-8'))
+            return content, False
+
+        self._count('downloads')
+        changed = entry is None or entry['content_hash'] != _sha256(r.content)
+        self._store(url, r.content, r)
+        return r.content, changed
+
+    def fetch(self, url):
+        return self.get(url)[0]
+
+    def fetch_changed(self, url):
+        # Same as fetch but None for pages that haven't changed since they were last cached
+        content, changed = self.get(url)
+        return content if changed else None
+
+    def _blob_sizes(self):
+        sizes = {}
+        for root, _, files in os.walk(os.path.join(self.cache_dir, 'blobs')):
+            for name in files:
+                sizes[name[:-len('.gz')]] = os.path.getsize(os.path.join(root, name))
+        return sizes
+
+    def size(self):
+        # Total compressed bytes on disk, scanned once and then kept up to date as blobs are added and evicted
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(self._blob_sizes().values())
+            return self._total_bytes
+
+    def evict(self):
+        # Drop least recently used urls until the blobs fit under max_bytes
+        with self._lock:
+            entries = []
+            for root, _, files in os.walk(os.path.join(self.cache_dir, 'index')):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        with open(path, 'r') as f:
+                            entry = json.load(f)
+                        entries.append((os.path.getmtime(path), path, entry))
+                    except (OSError, ValueError):
+                        continue
+            total = sum(self._blob_sizes().values())
+            if total <= self.max_bytes:
+                self._total_bytes = total
+                return
+
+            refs = {}
+            for _, _, entry in entries:
+                refs[entry['content_hash']] = refs.get(entry['content_hash'], 0) + 1
+            for _, path, entry in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                refs[entry['content_hash']] -= 1
+                if refs[entry['content_hash']] == 0:
+                    try:
+                        os.remove(self._blob_path(entry['content_hash']))
+                    except OSError:
+                        pass
+                    total -= entry['size']
+            self._total_bytes = total
+
+    def report(self):
+        print(f'Page cache: {self.hits} hits, {self.revalidated} revalidated (304), {self.downloads} downloads')
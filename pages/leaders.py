@@ -0,0 +1,13 @@
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+import dash_bootstrap_components as dbc
+
+from app import app
+from .tabs import batting_leaders,pitching_leaders,team_trends
+
+layout = dbc.Tabs([
+    dbc.Tab(batting_leaders.layout, label='Batting'),
+    dbc.Tab(pitching_leaders.layout, label='Pitching'),
+    dbc.Tab(team_trends.layout, label='Team Trends')
+])
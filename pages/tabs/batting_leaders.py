@@ -0,0 +1,81 @@
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output
+
+from app import app
+import db_scripts.graph_data_query as query_engine
+from teams import team_id_dict
+from .table_paging import table_columns,native_table
+
+# Leaderboard, league/division totals and player percentiles, read from the aggregate tables (db_scripts/aggregates.py)
+
+ranked_stats = ['HR', 'BA', 'OBP', 'SLG', 'OPS', 'R', 'H', 'RBI', 'TB', 'BB', 'SB', 'SO', '2B', '3B']
+
+layout = html.Div(children=[
+    html.Div([
+        dcc.Dropdown(
+            id='b-leaders-stat',
+            options=[{'label': stat, 'value': stat} for stat in ranked_stats],
+            placeholder='Stat (default: HR)',
+            searchable=False,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+        dcc.Dropdown(
+            id='b-leaders-team-name',
+            options=[{'label': team_code, 'value': team_id} for team_code,team_id in team_id_dict.items()],
+            placeholder='Team (default: all)',
+            multi=True,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+        dcc.Dropdown(
+            id='b-leaders-season-year',
+            options=[{'label': year, 'value': year} for year in range(2020, 2011, -1)],
+            placeholder='Year (default: 2020)',
+            searchable=False,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+    ]),
+    html.Br(),
+    html.H3(id='b-leaders-label'),
+    native_table('b-leaders'),
+    html.Br(),
+    html.H3('League and Division Totals'),
+    native_table('b-league'),
+    html.Br(),
+    html.H3('Player Percentiles'),
+    html.P('Percentile rank of every stat within the season, rate stats only rank qualified players (3.1 PA per team game)'),
+    native_table('b-percentiles'),
+])
+
+def selection(stat, team_ids, year):
+    return stat or 'HR', team_ids or None, year or 2020
+
+@app.callback(
+    [Output('b-leaders', 'columns'),
+    Output('b-leaders', 'data'),
+    Output('b-leaders-label', 'children'),
+    Output('b-percentiles', 'columns'),
+    Output('b-percentiles', 'data')],
+    [Input('b-leaders-stat', 'value'),
+    Input('b-leaders-team-name', 'value'),
+    Input('b-leaders-season-year', 'value')]
+)
+def update_leaders(stat, team_ids, year):
+    stat, team_ids, year = selection(stat, team_ids, year)
+    leaders = query_engine.get_leaderboard([year], 'b', stat, limit=10, team_ids=team_ids).round(3)
+    # Every player of the selected teams (all of them by default), best in the chosen stat first
+    ranks = query_engine.get_percentiles(team_ids, [year], 'b').drop(columns=['player_id', 'team_id', 'season'])
+    ranks = ranks.sort_values(stat, ascending=False, na_position='last')
+    return (table_columns(leaders), leaders.to_dict('records'), f'{year} {stat} Leaders',
+        table_columns(ranks), ranks.to_dict('records'))
+
+@app.callback(
+    [Output('b-league', 'columns'),
+    Output('b-league', 'data')],
+    [Input('b-leaders-season-year', 'value')]
+)
+def update_league(year):
+    df = query_engine.get_league_season([year or 2020], 'b').drop(columns=['season'])
+    return table_columns(df), df.to_dict('records')
@@ -2,13 +2,15 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 import pandas as pd
 
 from app import app
 import db_scripts.graph_data_query as query_engine
-from data_insert import team_id_dict
+import result_store
+from . import table_paging
+from teams import team_id_dict
 
 table_placeholder = dbc.Jumbotron([
     dbc.Container([
@@ -49,74 +51,75 @@ layout = html.Div(children=[
             style={'width': 300, 'display': 'inline-block'}
         ),
     ]),
-    dbc.Row([
-        dbc.Col([
-            dbc.Label('Sort By:'),
-            dcc.Dropdown(id='b-table-sorter')
-        ]),
-        dbc.Col([
-            dbc.Label(''),
-            dbc.RadioItems(
-                id='b-table-asc-desc',
-                options=[
-                    {'label': 'Ascending', 'value': True},
-                    {'label': 'Descending', 'value': False}
-                ]
-            )
-        ]),
-    ]),
     html.Br(),
-    html.Div(table_placeholder, id='b-table-result'),
+    html.Div(table_placeholder, id='b-table-placeholder'),
+    html.Div(table_paging.data_table('b-table'), id='b-table-result', style={'display': 'none'}),
     html.Div(id='b-table-save', style={'display': 'none'})
 ])
 
-@app.callback(
-    [Output('b-table-save', 'children'),
-    Output('b-table-sorter', 'value'),
-    Output('b-table-asc-desc', 'value')],
-    [Input('b-table-type', 'value'),
-    Input('b-table-team-name', 'value'),
-    Input('b-table-season-year', 'value'),]
-)
-def update_dataframe(table_type, team_ids, years):
+def selection(team_ids, years):
     if team_ids is None or not team_ids:
         team_ids = [20]
     if years is None or not years:
         years = [2020]
-    if table_type == 'pbs':
-        df = query_engine.get_players(team_ids, years, 'b')
-        df.drop(columns=['player_id', 'team_id'], inplace=True)
+    return team_ids, years
 
+def table_query(table_type):
+    # (query engine result set, getter, columns the table leaves out)
+    if table_type == 'pbs':
+        return 'players', query_engine.get_players, ['player_id', 'team_id']
     elif table_type == 'tbs':
-        df = query_engine.get_team_season(team_ids, years, 'b')
-        df.drop(columns=['team_id'], inplace=True)
-
+        return 'team_season', query_engine.get_team_season, ['team_id']
     elif table_type == 'tbg':
-        df = query_engine.get_gamelogs(team_ids, years, 'b')
-        df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'RunsAgainst', 'R', 'team_code'], inplace=True)
+        return 'gamelogs', query_engine.get_gamelogs, ['team_id', 'game_id', 'opp_id', 'HomeAway', 'RunsAgainst', 'R']
+
+def load_dataframe(table_type, team_ids, years, **shape):
+    # Only the shown columns are selected, shape (order_by, limit, ...) is passed on to the query engine
+    kind, getter, hidden = table_query(table_type)
+    columns = [col for col in query_engine.result_columns(kind, 'b') if col not in hidden]
+    return getter(team_ids, years, 'b', columns=columns, **shape)
 
-    else:
-        return None, None, None
-    
-    return df.to_json(orient='split'), None, None
+@app.callback(
+    [Output('b-table-save', 'children'),
+    Output('b-table-placeholder', 'children'),
+    Output('b-table-result', 'style'),
+    Output('b-table', 'columns'),
+    Output('b-table', 'page_current'),
+    Output('b-table', 'sort_by'),
+    Output('b-table', 'filter_query')],
+    [Input('b-table-type', 'value'),
+    Input('b-table-team-name', 'value'),
+    Input('b-table-season-year', 'value'),]
+)
+def update_dataframe(table_type, team_ids, years):
+    if table_type not in ['pbs', 'tbs', 'tbg']:
+        return None, table_placeholder, {'display': 'none'}, [], 0, [], ''
+    team_ids, years = selection(team_ids, years)
+    # Only the key goes to the browser, the whole DataFrame is only loaded into the result store if the table gets filtered
+    key = result_store.fingerprint(table_type, team_ids, years, query_engine.data_version())
+    first_page = load_dataframe(table_type, team_ids, years, limit=table_paging.page_size)
+    return key, None, {'display': 'block'}, table_paging.table_columns(first_page), 0, [], ''
 
 @app.callback(
-    [Output('b-table-result', 'children'),
-    Output('b-table-sorter', 'options')],
+    [Output('b-table', 'data'),
+    Output('b-table', 'page_count')],
     [Input('b-table-save', 'children'),
-    Input('b-table-sorter', 'value'),
-    Input('b-table-asc-desc', 'value')]
+    Input('b-table', 'page_current'),
+    Input('b-table', 'page_size'),
+    Input('b-table', 'sort_by'),
+    Input('b-table', 'filter_query')],
+    [State('b-table-type', 'value'),
+    State('b-table-team-name', 'value'),
+    State('b-table-season-year', 'value')]
 )
-def update_table_type(data, sort_by, asc_desc):
+def update_table_page(data, page_current, page_size, sort_by, filter_query, table_type, team_ids, years):
     if data is None:
-        table, sorter = table_placeholder, []
-    else:
-        df = pd.read_json(data, orient='split').round(3)
-        if sort_by is not None:
-            # Table is getting sorted
-            df = df.sort_values(by=[sort_by], ascending=asc_desc)
-        table = dbc.Table.from_dataframe(df, striped=True, bordered=True, hover=True, style={'font-size': 11})
-        sorter = [{'label': col, 'value': col} for col in df.columns]
-
-    return table, sorter
-    
+        return [], 1
+    team_ids, years = selection(team_ids, years)
+    if not filter_query:
+        # Sorting and paging run in SQLite, only the visible rows are read
+        row_count = query_engine.get_count(table_query(table_type)[0], team_ids, years, 'b')
+        return table_paging.query_page(lambda **shape: load_dataframe(table_type, team_ids, years, **shape), row_count, page_current, page_size, sort_by)
+    # Filters run on the stored DataFrame, only the visible page is sent back
+    df = result_store.load(data, lambda: load_dataframe(table_type, team_ids, years)).round(3)
+    return table_paging.table_page(data, df, page_current, page_size, sort_by, filter_query)
@@ -2,13 +2,15 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 import pandas as pd
 
 from app import app
 import db_scripts.graph_data_query as query_engine
-from data_insert import team_id_dict
+import result_store
+from db_scripts import time_series
+from teams import team_id_dict
 from .graphing import build_time_series
 
 ts_placeholder = dbc.Spinner(color='secondary')
@@ -42,12 +44,43 @@ layout = html.Div([
             )
         ])
     ]),
+    dbc.Row([
+        dbc.Col([
+            dbc.RadioItems(
+                id='b-ts-mode',
+                options=[
+                    {'label': 'Per Game', 'value': 'game'},
+                    {'label': 'Season to Date', 'value': 'cumulative'},
+                    {'label': 'Rolling', 'value': 'rolling'}
+                ],
+                value='game',
+                inline=True
+            )
+        ]),
+        dbc.Col([
+            dbc.Label('Rolling Window (games)', html_for='b-ts-window'),
+            dcc.Slider(
+                id='b-ts-window',
+                min=3,
+                max=30,
+                step=1,
+                marks={n: str(n) for n in [3, 5, 10, 15, 20, 30]},
+                value=10
+            )
+        ]),
+    ]),
     html.Br(),
     html.H3(id='b-ts-label', style={'text-align': 'center'}),
     html.Div(ts_placeholder, id='b-ts-result'),
     html.Div(id='b-ts-save', style={'display': 'none'})
 ])
 
+def load_dataframe(team_ids, year):
+    df = query_engine.get_gamelogs(team_ids, [year], 'b')
+    df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'season', 'Game', 'Score'], inplace=True)
+    df['Run Differential'] = df.R - df.RunsAgainst
+    return df
+
 @app.callback(
     Output('b-ts-save', 'children'),
     [Input('b-ts-team-name', 'value'),
@@ -56,11 +89,9 @@ layout = html.Div([
 def update_dataframe(team_ids, year):
     if team_ids is None or not team_ids:
         team_ids = [20]
-    df = query_engine.get_gamelogs(team_ids, [year], 'b')
-    df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'season', 'Game', 'Score'], inplace=True)
-    df['Run Differential'] = df.R - df.RunsAgainst
-    
-    return df.to_json(orient='split')
+    # Only the key goes to the browser, the DataFrame stays in the result store
+    key = result_store.fingerprint('b-ts', team_ids, [year], query_engine.data_version())
+    return result_store.ensure(key, lambda: load_dataframe(team_ids, year))
 
 @app.callback(
     [Output('b-ts-result', 'children'),
@@ -68,13 +99,25 @@ def update_dataframe(team_ids, year):
     Output('b-ts-label', 'children')],
     [Input('b-ts-save', 'children'),
     Input('b-ts-y', 'value'),
-    Input('b-ts-team-name', 'value')]
+    Input('b-ts-team-name', 'value'),
+    Input('b-ts-mode', 'value'),
+    Input('b-ts-window', 'value')],
+    [State('b-ts-season', 'value')]
 )
-def update_ts_data(data, y_axis, team_ids):
+def update_ts_data(data, y_axis, team_ids, mode, window, year):
     if data is None:
         return ts_placeholder, None, None
     if y_axis is None:
         y_axis = 'BA'
-    df = pd.read_json(data, orient='split').round(3)
-    return build_time_series(df, y_axis, team_ids, '%{y:.3f}' if y_axis in ['BA', 'OBP', 'SLG', 'OPS'] else '%{y:d}')
-    
+    if mode in time_series.modes:
+        # Season to date and rolling lines come from the time series engine's running sums
+        df = time_series.get_team_series(team_ids or [20], year, 'b', mode, window or 10)
+    else:
+        df = result_store.load(data, lambda: load_dataframe(team_ids or [20], year)).round(3)
+    if y_axis not in df.columns:
+        y_axis = 'BA'
+    if y_axis in ['BA', 'OBP', 'SLG', 'OPS']:
+        hover_template = '%{y:.3f}'
+    else:
+        hover_template = '%{y:.2f}' if mode == 'rolling' else '%{y:d}'
+    return build_time_series(df, y_axis, team_ids, hover_template)
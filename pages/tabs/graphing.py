@@ -3,20 +3,122 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 
-import plotly.express as px
-import plotly.graph_objects as go
-import statsmodels.api as sm
-
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
 
+import metrics
+
 # This file has general creation of plotly graphs
+# plotly (and statsmodels for LOWESS) are imported inside the builders, so they load on the first graph instead of at startup
+
+# Scatters with more points than this are drawn with WebGL (Scattergl) over a server side density heatmap
+webgl_threshold = 2000
+density_bins = 40
+trend_bins = 20
+fit_cache_size = 256
+_fits = OrderedDict()
+_fits_lock = threading.Lock()
+
+def linear_fit(x, y):
+    # Closed form least squares line and Pearson r from centered sums, pairs with a missing value are left out
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    x, y = x[mask], y[mask]
+    if len(x) < 2:
+        return None
+    dx, dy = x - x.mean(), y - y.mean()
+    sxx, syy, sxy = dx @ dx, dy @ dy, dx @ dy
+    if sxx == 0:
+        return None
+    slope = sxy / sxx
+    r = sxy / np.sqrt(sxx * syy) if syy > 0 else np.nan
+    return {
+        'n': len(x),
+        'slope': slope,
+        'intercept': y.mean() - slope * x.mean(),
+        'r': r,
+        'r2': r * r,
+        'x_min': x.min(),
+        'x_max': x.max(),
+    }
+
+def binned_trend(x, y):
+    # Mean of y in trend_bins equal count bins of x
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    x, y = x[mask], y[mask]
+    if not len(x):
+        return np.array([]), np.array([])
+    edges = np.unique(np.quantile(x, np.linspace(0, 1, trend_bins + 1)))
+    bins = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, max(len(edges) - 2, 0))
+    counts = np.bincount(bins)
+    used = counts > 0
+    return np.bincount(bins, weights=x)[used] / counts[used], np.bincount(bins, weights=y)[used] / counts[used]
+
+def lowess_trend(x, y):
+    # statsmodels is only imported when a LOWESS trend is asked for
+    from statsmodels.nonparametric.smoothers_lowess import lowess
+    fitted = lowess(np.asarray(y, dtype=float), np.asarray(x, dtype=float), frac=.3, missing='drop', return_sorted=True)
+    return fitted[:, 0], fitted[:, 1]
+
+def cached(key, compute):
+    # Fits and trends per (dataset key, x, y, kind), the dataset key already changes with the data version
+    if key is None:
+        return compute()
+    with _fits_lock:
+        if key in _fits:
+            _fits.move_to_end(key)
+            return _fits[key]
+    value = compute()
+    with _fits_lock:
+        _fits[key] = value
+        while len(_fits) > fit_cache_size:
+            _fits.popitem(last=False)
+    return value
 
-def build_scatter(df, x_axis, y_axis, seasons):
+def trend_line(df, x_axis, y_axis, trend, key):
+    # (x, y) of the trend line, always in increasing x
+    if trend == 'binned':
+        return cached(key and (key, x_axis, y_axis, 'binned'), lambda: binned_trend(df[x_axis], df[y_axis]))
+    if trend == 'lowess':
+        return cached(key and (key, x_axis, y_axis, 'lowess'), lambda: lowess_trend(df[x_axis], df[y_axis]))
+    fit = cached(key and (key, x_axis, y_axis, 'linear'), lambda: linear_fit(df[x_axis], df[y_axis]))
+    if fit is None:
+        return np.array([]), np.array([])
+    xs = np.array([fit['x_min'], fit['x_max']])
+    return xs, fit['intercept'] + fit['slope'] * xs
+
+def density_trace(x, y):
+    import plotly.graph_objects as go
+    # Point density binned here, so the browser draws one heatmap instead of binning every point
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    mask = np.isfinite(x) & np.isfinite(y)
+    counts, x_edges, y_edges = np.histogram2d(x[mask], y[mask], bins=density_bins)
+    return go.Heatmap(
+        z=np.where(counts.T > 0, counts.T, np.nan),
+        x=(x_edges[:-1] + x_edges[1:]) / 2,
+        y=(y_edges[:-1] + y_edges[1:]) / 2,
+        colorscale='Greys',
+        opacity=.35,
+        showscale=False,
+        hoverinfo='skip',
+    )
+
+@metrics.phase('figure')
+def build_scatter(df, x_axis, y_axis, seasons, key=None, trend='linear'):
+    # key identifies the dataset (result store key plus any filter), so the fit is reused across redraws
+    import plotly.express as px
+    import plotly.graph_objects as go
     # Make year categorical
     df['season'] = df.season.astype(str)
-    
-    fig = px.scatter(df, x=x_axis, y=y_axis, color='season')
+
+    large = len(df.index) > webgl_threshold
+    fig = px.scatter(df, x=x_axis, y=y_axis, color='season', render_mode='webgl' if large else 'svg', opacity=.6 if large else None)
     # Clean up hover info
     season_len = (seasons is not None) and (len(seasons) > 1)
     hovertemplate = 'Player: %{customdata[0]}<br>Season: %{customdata[1]}<extra></extra>' if season_len else 'Player: %{customdata[0]}<extra></extra>'
@@ -26,20 +128,25 @@ def build_scatter(df, x_axis, y_axis, seasons):
         showlegend=season_len
     )
 
-    # Configure trendline
-    regline = sm.OLS(df[y_axis], sm.add_constant(df[x_axis])).fit().fittedvalues
-    # add linear regression line for whole sample
-    fig.add_traces(
-        go.Scatter(
-            x=df[x_axis],
-            y=regline,
-            mode = 'lines',
-            marker_color='black',
-            opacity=.25,
-            hoverinfo='skip',
-            showlegend=False,
+    if large and len(df.index):
+        fig.add_trace(density_trace(df[x_axis], df[y_axis]))
+        # Heatmap goes under the points
+        fig.data = fig.data[-1:] + fig.data[:-1]
+
+    # Trend line for the whole sample (linear regression unless binned means or LOWESS are picked)
+    if trend is not None and trend != 'none':
+        trend_x, trend_y = trend_line(df, x_axis, y_axis, trend, key)
+        fig.add_traces(
+            go.Scatter(
+                x=trend_x,
+                y=trend_y,
+                mode = 'lines',
+                marker_color='black',
+                opacity=.25,
+                hoverinfo='skip',
+                showlegend=False,
+            )
         )
-    )
 
     fig.update_layout(
         font=dict(
@@ -71,11 +178,63 @@ def build_scatter(df, x_axis, y_axis, seasons):
     axis_options = list(df.select_dtypes(include=[np.number]).columns.values)
     axis_options = [{'label': col, 'value': col} for col in axis_options]
 
-    scatter_title = f'{y_axis} vs. {x_axis} (Pearson Correlation: {df[y_axis].corr(df[x_axis]).round(5)})'
+    fit = cached(key and (key, x_axis, y_axis, 'linear'), lambda: linear_fit(df[x_axis], df[y_axis]))
+    r = round(fit['r'], 5) if fit is not None else np.nan
+    r2 = round(fit['r2'], 5) if fit is not None else np.nan
+    scatter_title = f'{y_axis} vs. {x_axis} (Pearson Correlation: {r}, R²: {r2})'
 
     return dcc.Graph(figure=fig, style={'height': '80vh'}), axis_options, axis_options, scatter_title
 
+def correlation_matrix(df, method='pearson'):
+    # Every pair of numeric columns at once: pairwise complete sums from a few matrix products
+    # Spearman is Pearson of the column ranks (ranked once over each column's present values)
+    df = df.select_dtypes(include=[np.number]).drop(columns=['season'], errors='ignore')
+    if method == 'spearman':
+        df = df.rank()
+    values = df.to_numpy(dtype=float)
+    present = np.isfinite(values).astype(float)
+    # Centering doesn't change r but keeps the sums of squares from cancelling
+    values = np.where(present > 0, values - np.nanmean(values, axis=0) if len(values) else values, 0)
+    n = present.T @ present
+    sum_x = values.T @ present
+    sum_xx = (values * values).T @ present
+    sum_xy = values.T @ values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_x = sum_xx - sum_x ** 2 / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[(n < 2) | ~np.isfinite(corr)] = np.nan
+    return pd.DataFrame(np.clip(corr, -1, 1).round(3), index=df.columns, columns=df.columns)
+
+@metrics.phase('figure')
+def build_heatmap(corr, method):
+    import plotly.graph_objects as go
+    fig = go.Figure(
+        go.Heatmap(
+            z=corr.to_numpy(),
+            x=list(corr.columns),
+            y=list(corr.index),
+            zmin=-1,
+            zmax=1,
+            colorscale='RdBu',
+            hovertemplate='%{y} vs. %{x}: %{z}<extra></extra>',
+        )
+    )
+    fig.update_layout(
+        font=dict(
+            size=14,
+            family='Segoe UI'
+        ),
+        xaxis=dict(side='top'),
+        yaxis=dict(autorange='reversed'),
+    )
+    corr_title = f'{method.capitalize()} Correlations (click a cell to plot that pair)'
+    return fig, corr_title
+
+@metrics.phase('figure')
 def build_time_series(df, y_axis, team_ids, hover_template):
+    import plotly.express as px
+    import plotly.graph_objects as go
     df.game_date = pd.to_datetime(df.game_date, format='%Y-%m-%d').dt.to_pydatetime()
     fig = px.line(df, x='game_date', y=y_axis, color='Team')
     fig.update_layout(
@@ -2,14 +2,15 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 import pandas as pd
 
 from app import app
 import db_scripts.graph_data_query as query_engine
-from data_insert import team_id_dict
-from .graphing import build_scatter
+import result_store
+from teams import team_id_dict
+from .graphing import build_scatter,correlation_matrix,build_heatmap
 
 scatter_placeholder = dbc.Spinner(color='secondary')
 
@@ -48,29 +49,69 @@ layout = html.Div(children=[
             id='p-scatter-qualified',
             style={'padding-left': '25px'}
         ),
+        dbc.RadioItems(
+            options=[
+                {'label': 'Linear fit', 'value': 'linear'},
+                {'label': 'Binned means', 'value': 'binned'},
+                {'label': 'LOWESS', 'value': 'lowess'},
+                {'label': 'No trend', 'value': 'none'},
+            ],
+            value='linear',
+            id='p-scatter-trend',
+            style={'padding-left': '25px'}
+        ),
     ], style={'display': 'flex'}),
     html.Br(),
     html.H3(id='p-scatter-label', style={'text-align': 'center'}),
     html.Div(scatter_placeholder, id='p-scatter-result'),
     html.Div(id='p-scatter-save', style={'display': 'none'}),
-    html.Footer('*Note that Pearson Correlation may not useful for some variables')
+    html.Footer('*Note that Pearson Correlation may not useful for some variables'),
+    html.Br(),
+    html.H3(id='p-corr-label', style={'text-align': 'center'}),
+    dbc.RadioItems(
+        options=[
+            {'label': 'Pearson', 'value': 'pearson'},
+            {'label': 'Spearman', 'value': 'spearman'},
+        ],
+        value='pearson',
+        id='p-corr-method',
+        inline=True,
+        style={'text-align': 'center'}
+    ),
+    dcc.Loading(dcc.Graph(id='p-corr-graph', style={'height': '90vh'}), color='grey'),
 ])
 
-@app.callback(
-    Output('p-scatter-save', 'children'),
-    [Input('p-scatter-team-name', 'value'),
-    Input('p-scatter-season-year', 'value'),]
-)
-def update_dataframe(team_ids, years):
+def selection(team_ids, years):
     if team_ids is None or not team_ids:
         team_ids = [20]
     if years is None or not years:
         years = [2020]
-    df = query_engine.get_players(team_ids, years, 'p')
+    return team_ids, years
 
+def load_dataframe(team_ids, years):
+    df = query_engine.get_players(team_ids, years, 'p')
     df.drop(columns=['player_id', 'team_id'], inplace=True)
-    
-    return df.to_json(orient='split')
+    return df
+
+def scatter_frame(data, qualified, team_ids, years):
+    df = result_store.load(data, lambda: load_dataframe(*selection(team_ids, years))).round(3)
+    if qualified:
+        # More efficient way to filter this?
+        df1 = df[(df.IP >= 60) & (df.season == 2020)]
+        df2 = df[df.IP > 162]
+        df = pd.concat([df1,df2])
+    return df
+
+@app.callback(
+    Output('p-scatter-save', 'children'),
+    [Input('p-scatter-team-name', 'value'),
+    Input('p-scatter-season-year', 'value'),]
+)
+def update_dataframe(team_ids, years):
+    team_ids, years = selection(team_ids, years)
+    # Only the key goes to the browser, the DataFrame stays in the result store
+    key = result_store.fingerprint('pps', team_ids, years, query_engine.data_version())
+    return result_store.ensure(key, lambda: load_dataframe(team_ids, years))
 
 @app.callback(
     [Output('p-scatter-result', 'children'),
@@ -81,19 +122,45 @@ def update_dataframe(team_ids, years):
     Input('p-scatter-x', 'value'),
     Input('p-scatter-y', 'value'),
     Input('p-scatter-season-year', 'value'),
-    Input('p-scatter-qualified', 'value')]
+    Input('p-scatter-qualified', 'value'),
+    Input('p-scatter-trend', 'value')],
+    [State('p-scatter-team-name', 'value')]
 )
-def update_scatter_data(data, x_axis, y_axis, seasons, qualified):
+def update_scatter_data(data, x_axis, y_axis, seasons, qualified, trend, team_ids):
     if data is None:
         return scatter_placeholder, None, None
     if x_axis is None:
         x_axis = 'Age'
     if y_axis is None:
         y_axis = 'ERA'
-    df = pd.read_json(data, orient='split').round(3)
-    if qualified:
-        # More efficient way to filter this?
-        df1 = df[(df.IP >= 60) & (df.season == 2020)]
-        df2 = df[df.IP > 162]
-        df = pd.concat([df1,df2])
-    return build_scatter(df, x_axis, y_axis, seasons)
+    df = scatter_frame(data, qualified, team_ids, seasons)
+    # Fits are cached per stored result, and the qualified filter changes the sample
+    return build_scatter(df, x_axis, y_axis, seasons, key=(data, bool(qualified)), trend=trend)
+
+@app.callback(
+    [Output('p-corr-graph', 'figure'),
+    Output('p-corr-label', 'children')],
+    [Input('p-scatter-save', 'children'),
+    Input('p-corr-method', 'value'),
+    Input('p-scatter-season-year', 'value'),
+    Input('p-scatter-qualified', 'value')],
+    [State('p-scatter-team-name', 'value')]
+)
+def update_correlations(data, method, seasons, qualified, team_ids):
+    if data is None:
+        return {}, None
+    # Whole matrix once per selection, then every axis pair is a lookup
+    key = result_store.fingerprint('ppc', *selection(team_ids, seasons), data, method, bool(qualified))
+    corr = result_store.load(key, lambda: correlation_matrix(scatter_frame(data, qualified, team_ids, seasons), method))
+    return build_heatmap(corr, method)
+
+@app.callback(
+    [Output('p-scatter-x', 'value'),
+    Output('p-scatter-y', 'value')],
+    [Input('p-corr-graph', 'clickData')]
+)
+def select_pair(click):
+    if not click:
+        raise dash.exceptions.PreventUpdate
+    point = click['points'][0]
+    return point['x'], point['y']
@@ -2,13 +2,15 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 import pandas as pd
 
 from app import app
 import db_scripts.graph_data_query as query_engine
-from data_insert import team_id_dict
+import result_store
+from . import table_paging
+from teams import team_id_dict
 
 table_placeholder = dbc.Jumbotron([
     dbc.Container([
@@ -28,7 +30,7 @@ layout = html.Div(children=[
             options=[
                 {'label': 'Player Season Pitching', 'value': 'pps'},
                 {'label': 'Team Season Pitching', 'value': 'tps'},
-                {'label': 'Team Pitching Gamelogs', 'value': 'tbg'}
+                {'label': 'Team Pitching Gamelogs', 'value': 'tpg'}
             ],
             placeholder='Table Type',
             searchable=False,
@@ -50,74 +52,75 @@ layout = html.Div(children=[
             style={'width': 300, 'display': 'inline-block'}
         ),
     ]),
-    dbc.Row([
-        dbc.Col([
-            dbc.Label('Sort By:'),
-            dcc.Dropdown(id='p-table-sorter')
-        ]),
-        dbc.Col([
-            dbc.Label(''),
-            dbc.RadioItems(
-                id='p-table-asc-desc',
-                options=[
-                    {'label': 'Ascending', 'value': True},
-                    {'label': 'Descending', 'value': False}
-                ]
-            )
-        ]),
-    ]),
     html.Br(),
-    html.Div(table_placeholder, id='p-table-result'),
+    html.Div(table_placeholder, id='p-table-placeholder'),
+    html.Div(table_paging.data_table('p-table'), id='p-table-result', style={'display': 'none'}),
     html.Div(id='p-table-save', style={'display': 'none'})
 ])
 
-@app.callback(
-    [Output('p-table-save', 'children'),
-    Output('p-table-sorter', 'value'),
-    Output('p-table-asc-desc', 'value')],
-    [Input('p-table-type', 'value'),
-    Input('p-table-team-name', 'value'),
-    Input('p-table-season-year', 'value'),]
-)
-def update_dataframe(table_type, team_ids, years):
+def selection(team_ids, years):
     if team_ids is None or not team_ids:
         team_ids = [20]
     if years is None or not years:
         years = [2020]
-    if table_type == 'pps':
-        df = query_engine.get_players(team_ids, years, 'p')
-        df.drop(columns=['player_id', 'team_id'], inplace=True)
+    return team_ids, years
 
+def table_query(table_type):
+    # (query engine result set, getter, columns the table leaves out)
+    if table_type == 'pps':
+        return 'players', query_engine.get_players, ['player_id', 'team_id']
     elif table_type == 'tps':
-        df = query_engine.get_team_season(team_ids, years, 'p')
-        df.drop(columns=['team_id'], inplace=True)
-
+        return 'team_season', query_engine.get_team_season, ['team_id']
     elif table_type == 'tpg':
-        df = query_engine.get_gamelogs(team_ids, years, 'p')
-        df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'RunsFor', 'R'], inplace=True)
+        return 'gamelogs', query_engine.get_gamelogs, ['team_id', 'game_id', 'opp_id', 'HomeAway', 'RunsFor', 'R']
+
+def load_dataframe(table_type, team_ids, years, **shape):
+    # Only the shown columns are selected, shape (order_by, limit, ...) is passed on to the query engine
+    kind, getter, hidden = table_query(table_type)
+    columns = [col for col in query_engine.result_columns(kind, 'p') if col not in hidden]
+    return getter(team_ids, years, 'p', columns=columns, **shape)
 
-    else:
-        return None, None, None
-    
-    return df.to_json(orient='split'), None, None
+@app.callback(
+    [Output('p-table-save', 'children'),
+    Output('p-table-placeholder', 'children'),
+    Output('p-table-result', 'style'),
+    Output('p-table', 'columns'),
+    Output('p-table', 'page_current'),
+    Output('p-table', 'sort_by'),
+    Output('p-table', 'filter_query')],
+    [Input('p-table-type', 'value'),
+    Input('p-table-team-name', 'value'),
+    Input('p-table-season-year', 'value'),]
+)
+def update_dataframe(table_type, team_ids, years):
+    if table_type not in ['pps', 'tps', 'tpg']:
+        return None, table_placeholder, {'display': 'none'}, [], 0, [], ''
+    team_ids, years = selection(team_ids, years)
+    # Only the key goes to the browser, the whole DataFrame is only loaded into the result store if the table gets filtered
+    key = result_store.fingerprint(table_type, team_ids, years, query_engine.data_version())
+    first_page = load_dataframe(table_type, team_ids, years, limit=table_paging.page_size)
+    return key, None, {'display': 'block'}, table_paging.table_columns(first_page), 0, [], ''
 
 @app.callback(
-    [Output('p-table-result', 'children'),
-    Output('p-table-sorter', 'options')],
+    [Output('p-table', 'data'),
+    Output('p-table', 'page_count')],
     [Input('p-table-save', 'children'),
-    Input('p-table-sorter', 'value'),
-    Input('p-table-asc-desc', 'value')]
+    Input('p-table', 'page_current'),
+    Input('p-table', 'page_size'),
+    Input('p-table', 'sort_by'),
+    Input('p-table', 'filter_query')],
+    [State('p-table-type', 'value'),
+    State('p-table-team-name', 'value'),
+    State('p-table-season-year', 'value')]
 )
-def update_table_type(data, sort_by, asc_desc):
+def update_table_page(data, page_current, page_size, sort_by, filter_query, table_type, team_ids, years):
     if data is None:
-        table, sorter = table_placeholder, []
-    else:
-        df = pd.read_json(data, orient='split').round(3)
-        if sort_by is not None:
-            # Table is getting sorted
-            df = df.sort_values(by=[sort_by], ascending=asc_desc)
-        table = dbc.Table.from_dataframe(df, striped=True, bordered=True, hover=True, style={'font-size': 11})
-        sorter = [{'label': col, 'value': col} for col in df.columns]
-
-    return table, sorter
-    
+        return [], 1
+    team_ids, years = selection(team_ids, years)
+    if not filter_query:
+        # Sorting and paging run in SQLite, only the visible rows are read
+        row_count = query_engine.get_count(table_query(table_type)[0], team_ids, years, 'p')
+        return table_paging.query_page(lambda **shape: load_dataframe(table_type, team_ids, years, **shape), row_count, page_current, page_size, sort_by)
+    # Filters run on the stored DataFrame, only the visible page is sent back
+    df = result_store.load(data, lambda: load_dataframe(table_type, team_ids, years)).round(3)
+    return table_paging.table_page(data, df, page_current, page_size, sort_by, filter_query)
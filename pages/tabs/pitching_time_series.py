@@ -2,13 +2,15 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 
 import pandas as pd
 
 from app import app
 import db_scripts.graph_data_query as query_engine
-from data_insert import team_id_dict
+import result_store
+from db_scripts import time_series
+from teams import team_id_dict
 from .graphing import build_time_series
 
 ts_placeholder = dbc.Spinner(color='secondary')
@@ -42,12 +44,43 @@ layout = html.Div([
             )
         ])
     ]),
+    dbc.Row([
+        dbc.Col([
+            dbc.RadioItems(
+                id='p-ts-mode',
+                options=[
+                    {'label': 'Per Game', 'value': 'game'},
+                    {'label': 'Season to Date', 'value': 'cumulative'},
+                    {'label': 'Rolling', 'value': 'rolling'}
+                ],
+                value='game',
+                inline=True
+            )
+        ]),
+        dbc.Col([
+            dbc.Label('Rolling Window (games)', html_for='p-ts-window'),
+            dcc.Slider(
+                id='p-ts-window',
+                min=3,
+                max=30,
+                step=1,
+                marks={n: str(n) for n in [3, 5, 10, 15, 20, 30]},
+                value=10
+            )
+        ]),
+    ]),
     html.Br(),
     html.H3(id='p-ts-label', style={'text-align': 'center'}),
     html.Div(ts_placeholder, id='p-ts-result'),
     html.Div(id='p-ts-save', style={'display': 'none'})
 ])
 
+def load_dataframe(team_ids, year):
+    df = query_engine.get_gamelogs(team_ids, [year], 'p')
+    df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'season', 'Game', 'Score'], inplace=True)
+    df['Run Differential'] = df.RunsFor - df.R
+    return df
+
 @app.callback(
     Output('p-ts-save', 'children'),
     [Input('p-ts-team-name', 'value'),
@@ -56,12 +89,9 @@ layout = html.Div([
 def update_dataframe(team_ids, year):
     if team_ids is None or not team_ids:
         team_ids = [20]
-    df = query_engine.get_gamelogs(team_ids, [year], 'p')
-
-    df.drop(columns=['team_id', 'game_id', 'opp_id', 'HomeAway', 'season', 'Game', 'Score'], inplace=True)
-    df['Run Differential'] = df.RunsFor - df.R
-    
-    return df.to_json(orient='split')
+    # Only the key goes to the browser, the DataFrame stays in the result store
+    key = result_store.fingerprint('p-ts', team_ids, [year], query_engine.data_version())
+    return result_store.ensure(key, lambda: load_dataframe(team_ids, year))
 
 @app.callback(
     [Output('p-ts-result', 'children'),
@@ -69,13 +99,25 @@ def update_dataframe(team_ids, year):
     Output('p-ts-label', 'children')],
     [Input('p-ts-save', 'children'),
     Input('p-ts-y', 'value'),
-    Input('p-ts-team-name', 'value')]
+    Input('p-ts-team-name', 'value'),
+    Input('p-ts-mode', 'value'),
+    Input('p-ts-window', 'value')],
+    [State('p-ts-season', 'value')]
 )
-def update_ts_data(data, y_axis, team_ids):
+def update_ts_data(data, y_axis, team_ids, mode, window, year):
     if data is None:
         return ts_placeholder, None, None
     if y_axis is None:
         y_axis = 'ERA'
-    df = pd.read_json(data, orient='split').round(3)
-    return build_time_series(df, y_axis, team_ids, '%{y:.2f}' if y_axis == 'ERA' else ('%{y:.1f}' if y_axis == 'IP' else '%{y:d}'))
-    
+    if mode in time_series.modes:
+        # Season to date and rolling lines come from the time series engine's running sums
+        df = time_series.get_team_series(team_ids or [20], year, 'p', mode, window or 10)
+    else:
+        df = result_store.load(data, lambda: load_dataframe(team_ids or [20], year)).round(3)
+    if y_axis not in df.columns:
+        y_axis = 'ERA'
+    if y_axis in time_series.rate_stats['p']:
+        hover_template = '%{y:.1f}' if y_axis == 'IP' else '%{y:.2f}'
+    else:
+        hover_template = '%{y:.2f}' if mode == 'rolling' else '%{y:d}'
+    return build_time_series(df, y_axis, team_ids, hover_template)
@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+
+import dash_table
+import pandas as pd
+import numpy as np
+
+# Server side paging, sorting and filtering for the Tables tab DataTables (page_action/sort_action/filter_action='custom')
+# Only the visible page is sent to the browser. Unfiltered tables are sorted and paged by SQLite (query_page), filtered ones
+# in pandas (table_page) through a cached permutation per (result store key, column): ascending and descending share it,
+# so flipping the direction or paging through a sorted table never re-sorts.
+
+page_size = 50
+sort_cache_size = 64
+
+filter_operators = [
+    ['ge ', '>='],
+    ['le ', '<='],
+    ['lt ', '<'],
+    ['gt ', '>'],
+    ['ne ', '!='],
+    ['eq ', '='],
+    ['contains '],
+    ['datestartswith '],
+]
+
+_sort_cache = OrderedDict()
+_sort_lock = threading.Lock()
+
+def data_table(table_id):
+    return dash_table.DataTable(
+        id=table_id,
+        page_current=0,
+        page_size=page_size,
+        page_action='custom',
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        filter_action='custom',
+        filter_query='',
+        style_table={'overflowX': 'auto'},
+        style_cell={'font-size': 11, 'padding': '4px'},
+        style_header={'fontWeight': 'bold'},
+        style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': 'rgb(248, 248, 248)'}]
+    )
+
+def native_table(table_id, page_size=15):
+    # Same look for the small tables that are sent whole and sorted in the browser (Leaders page)
+    return dash_table.DataTable(
+        id=table_id,
+        page_size=page_size,
+        sort_action='native',
+        style_table={'overflowX': 'auto'},
+        style_cell={'font-size': 11, 'padding': '4px'},
+        style_header={'fontWeight': 'bold'},
+        style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': 'rgb(248, 248, 248)'}]
+    )
+
+def table_columns(df):
+    return [{'name': col, 'id': col, 'type': 'numeric' if pd.api.types.is_numeric_dtype(df[col]) else 'text'} for col in df.columns]
+
+def sort_permutation(key, df, column):
+    # (ascending row order with missing values last, number of non-missing values) for df[column]
+    cache_key = (key, column)
+    with _sort_lock:
+        entry = _sort_cache.get(cache_key)
+        if entry is not None:
+            _sort_cache.move_to_end(cache_key)
+            return entry
+    values = df[column]
+    missing = values.isna().to_numpy()
+    present = np.flatnonzero(~missing)
+    order = present[np.argsort(values.to_numpy()[present], kind='mergesort')]
+    entry = (np.concatenate([order, np.flatnonzero(missing)]), len(present))
+    with _sort_lock:
+        _sort_cache[cache_key] = entry
+        while len(_sort_cache) > sort_cache_size:
+            _sort_cache.popitem(last=False)
+    return entry
+
+def sorted_rows(key, df, sort_by):
+    if not sort_by or sort_by[0]['column_id'] not in df.columns:
+        return np.arange(len(df.index))
+    order, present = sort_permutation(key, df, sort_by[0]['column_id'])
+    if sort_by[0]['direction'] == 'desc':
+        # Missing values stay at the bottom either way
+        return np.concatenate([order[:present][::-1], order[present:]])
+    return order
+
+def split_filter_part(filter_part):
+    # '{BA} >= 0.3' -> ('BA', '>=', 0.3), the DataTable filter syntax
+    for operator_type in filter_operators:
+        for operator in operator_type:
+            if operator in filter_part:
+                name_part, value_part = filter_part.split(operator, 1)
+                name = name_part[name_part.find('{') + 1: name_part.rfind('}')]
+                value_part = value_part.strip()
+                if value_part and value_part[0] == value_part[-1] and value_part[0] in ('"', "'", '`'):
+                    value = value_part[1:-1].replace('\\' + value_part[0], value_part[0])
+                else:
+                    try:
+                        value = float(value_part)
+                    except ValueError:
+                        value = value_part
+                return name, operator_type[0].strip(), value
+    return None, None, None
+
+def filter_mask(df, filter_query):
+    mask = np.ones(len(df.index), dtype=bool)
+    if not filter_query:
+        return mask
+    for filter_part in filter_query.split(' && '):
+        col_name, operator, value = split_filter_part(filter_part)
+        if col_name not in df.columns:
+            continue
+        column = df[col_name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            if isinstance(value, str) and pd.api.types.is_numeric_dtype(column):
+                continue
+            if isinstance(value, float) and not pd.api.types.is_numeric_dtype(column):
+                value = str(int(value)) if value.is_integer() else str(value)
+            part = getattr(column, operator)(value)
+        elif operator == 'contains':
+            part = column.astype(str).str.contains(str(value), regex=False)
+        elif operator == 'datestartswith':
+            part = column.astype(str).str.startswith(str(value))
+        else:
+            continue
+        mask &= part.fillna(False).to_numpy(dtype=bool)
+    return mask
+
+def query_page(load_page, row_count, page_current, page_size, sort_by):
+    # table_page for unfiltered tables, load_page(**shape) runs the ORDER BY ... LIMIT query for the visible page
+    page_count = max(1, -(-row_count // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    shape = {'limit': page_size, 'offset': page_current * page_size}
+    if sort_by:
+        shape.update(order_by=sort_by[0]['column_id'], descending=sort_by[0]['direction'] == 'desc')
+    return load_page(**shape).round(3).to_dict('records'), page_count
+
+def table_page(key, df, page_current, page_size, sort_by, filter_query):
+    # (records for the visible page, page count)
+    rows = sorted_rows(key, df, sort_by)
+    if filter_query:
+        rows = rows[filter_mask(df, filter_query)[rows]]
+    page_count = max(1, -(-len(rows) // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    visible = rows[page_current * page_size: (page_current + 1) * page_size]
+    return df.iloc[visible].to_dict('records'), page_count
@@ -0,0 +1,74 @@
+import dash
+import dash_core_components as dcc
+import dash_html_components as html
+import dash_bootstrap_components as dbc
+from dash.dependencies import Input, Output
+
+from app import app
+import db_scripts.graph_data_query as query_engine
+from db_scripts.aggregates import rolling_games
+from teams import team_id_dict
+from .graphing import build_time_series
+
+# Every team's run differential (or another batting line stat) through the season from the TeamGameTrend table, which
+# the aggregate build fills for all teams at once, so the league wide view doesn't compute 30 teams' lines per request
+
+trend_placeholder = dbc.Spinner(color='secondary')
+
+layout = html.Div(children=[
+    html.Div([
+        dcc.Dropdown(
+            id='trend-team-name',
+            options=[{'label': team_code, 'value': team_id} for team_code,team_id in team_id_dict.items()],
+            placeholder='Team (default: all)',
+            multi=True,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+        dcc.Dropdown(
+            id='trend-season-year',
+            options=[{'label': year, 'value': year} for year in range(2020, 2011, -1)],
+            placeholder='Year (default: 2020)',
+            searchable=False,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+        dcc.Dropdown(
+            id='trend-y',
+            placeholder='Stat (default: Run Differential)',
+            searchable=False,
+            style={'width': 300, 'display': 'inline-block'}
+        ),
+    ]),
+    html.Br(),
+    dbc.RadioItems(
+        id='trend-mode',
+        options=[
+            {'label': 'Season to Date', 'value': 'cumulative'},
+            {'label': f'Rolling ({rolling_games} games)', 'value': 'rolling'}
+        ],
+        value='rolling',
+        inline=True
+    ),
+    html.H3(id='trend-label', style={'text-align': 'center'}),
+    html.Div(trend_placeholder, id='trend-result'),
+])
+
+@app.callback(
+    [Output('trend-result', 'children'),
+    Output('trend-y', 'options'),
+    Output('trend-label', 'children')],
+    [Input('trend-team-name', 'value'),
+    Input('trend-season-year', 'value'),
+    Input('trend-y', 'value'),
+    Input('trend-mode', 'value')]
+)
+def update_trends(team_ids, year, y_axis, mode):
+    df = query_engine.get_team_trends(team_ids or None, [year or 2020], mode)
+    df = df.drop(columns=['team_id', 'season', 'game_id', 'mode', 'Games'])
+    if y_axis not in df.columns:
+        y_axis = 'Run Differential'
+    if y_axis in ['BA', 'OBP', 'SLG', 'OPS']:
+        hover_template = '%{y:.3f}'
+    else:
+        hover_template = '%{y:.2f}' if mode == 'rolling' else '%{y:d}'
+    # Legend for every team that has games, even when none was picked
+    return build_time_series(df, y_axis, list(df.Team.unique()), hover_template)
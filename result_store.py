@@ -0,0 +1,138 @@
+import os,json,pickle,hashlib,threading,tempfile
+from collections import OrderedDict
+
+import metrics
+from db_scripts.db_connect import db_identity
+
+# Server side store for the DataFrames the tabs pass between callbacks
+# The hidden *-save divs only hold a key from fingerprint(), the frame itself stays on the server (pickled, so callbacks
+# that modify their copy can't corrupt the stored one). Memory is an LRU bounded by entries and bytes; set
+# BB_RESULT_STORE_DIR to add a disk tier shared by every worker process, otherwise a worker that misses recomputes the frame.
+# Keys include the database file's identity, so the disk tier never hands out frames of another or an older database.
+
+class ResultStore:
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + '.pkl')
+
+    def _remember(self, key, blob):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = blob
+            self._bytes += len(blob)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def _blob(self, key):
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return blob
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'rb') as f:
+                    blob = f.read()
+            except OSError:
+                blob = None
+            if blob is not None:
+                self.disk_hits += 1
+                self._remember(key, blob)
+                return blob
+        self.misses += 1
+        return None
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    @metrics.phase('store_save')
+    def put(self, key, df):
+        blob = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, blob)
+        if self.disk_dir:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp, self._disk_path(key))
+            self._prune_disk()
+        return key
+
+    @metrics.phase('store_load')
+    def get(self, key):
+        blob = self._blob(key)
+        metrics.count('result_store_hits' if blob is not None else 'result_store_misses')
+        return None if blob is None else pickle.loads(blob)
+
+    def _prune_disk(self):
+        # Oldest files go first once the shared directory is over its cap
+        files = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+            }
+
+store = ResultStore(
+    max_entries=int(os.environ.get('BB_RESULT_STORE_SIZE', 128)),
+    disk_dir=os.environ.get('BB_RESULT_STORE_DIR'))
+
+def fingerprint(dataset, team_ids, years, *extra):
+    # Selections are order independent, [20, 1] and [1, 20] share a key
+    parts = [dataset, sorted(team_ids), sorted(years), *extra, db_identity()]
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+def ensure(key, loader):
+    # Makes sure key is stored, only running loader() if it isn't
+    if key not in store:
+        metrics.count('result_store_misses')
+        store.put(key, loader())
+    else:
+        metrics.count('result_store_hits')
+    return key
+
+def load(key, loader):
+    # Stored frame for key, recomputed with loader() if it was evicted or another worker stored it
+    df = store.get(key)
+    if df is None:
+        df = loader()
+        store.put(key, df)
+    return df
@@ -6,7 +6,7 @@ from dash.dependencies import Input, Output
 
 from app import app
 
-page_ids = ['home', 'scatters', 'tables', 'ts']
+page_ids = ['home', 'scatters', 'tables', 'ts', 'leaders']
 
 layout = html.Div(
     [
@@ -21,6 +21,7 @@ layout = html.Div(
                 dbc.NavLink('Scatter Plot Tool', href='/scatters', id=f'{page_ids[1]}-link'),
                 dbc.NavLink('Tables', href='/tables', id=f'{page_ids[2]}-link'),
                 dbc.NavLink('Time Series', href='/ts', id=f'{page_ids[3]}-link'),
+                dbc.NavLink('Leaders', href='/leaders', id=f'{page_ids[4]}-link'),
             ],
             vertical=True,
             pills=True,
@@ -43,5 +44,5 @@ layout = html.Div(
 )
 def toggle_active_links(pathname):
     if pathname == '/':
-        return True, False, False, False
+        return True, False, False, False, False
     return [pathname == f'/{i}' for i in page_ids]
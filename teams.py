@@ -0,0 +1,17 @@
+import os,csv
+
+# Team metadata for the app, read from the same csv that populates the Teams table (data_insert.new_db)
+# Kept free of pandas and the scraping code so the pages can import it at no cost
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+def read_teams():
+    with open(os.path.join(directory, 'db_scripts', 'team_table.csv'), newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row['id'] = int(row['id'])
+    return sorted(rows, key=lambda row: row['id'])
+
+teams = read_teams()
+team_codes = [team['team_code'] for team in teams]
+team_id_dict = {team['team_code']: team['id'] for team in teams}
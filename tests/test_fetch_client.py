@@ -0,0 +1,135 @@
+import time
+from email.utils import format_datetime
+from datetime import datetime,timedelta,timezone
+import pytest
+
+from fetch_client import FetchClient,FetchError,TokenBucket,retry_after
+from benchmarks.stub_site import StubSite,serve
+
+# FetchClient against benchmarks/stub_site.py, with the faults scripted request by request instead of drawn at random
+
+gamelog_path = '/teams/tgl.cgi?team=NYY&t=b&year=2020'
+
+class ScriptedSite(StubSite):
+    # Answers the next requests with the listed faults (None for a normal response), then normally
+    def __init__(self, db_path, script, **kwargs):
+        super().__init__(db_path, **kwargs)
+        self.script = list(script)
+
+    def draw_fault(self):
+        with self._lock:
+            return self.script.pop(0) if self.script else None
+
+@pytest.fixture
+def stub(synthetic_db):
+    servers = []
+    def start(*script, **kwargs):
+        site = ScriptedSite(synthetic_db, script, **kwargs)
+        server = serve(site)
+        servers.append(server)
+        return site, f'http://127.0.0.1:{server.server_port}'
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def client():
+    # No rate limit to speak of and millisecond backoffs, the tests are about what gets retried
+    client = FetchClient(requests_per_minute=60000, burst=10, timeout=5.0, max_attempts=3, backoff=0.01, max_backoff=0.05, seed=0)
+    yield client
+    client.close()
+
+def outcomes(site):
+    return [outcome for _, _, outcome in site.requests]
+
+def test_page_arrives_intact(stub, client):
+    site, base_url = stub()
+    page = client.request(base_url + gamelog_path)
+    assert page.status == 200
+    assert page.content == site.content(gamelog_path)
+    assert (client.requests, client.retries, client.failures, client.bytes) == (1, 0, 0, len(page.content))
+
+@pytest.mark.parametrize('fault', ['503', 'reset', 'truncate'])
+def test_fault_is_retried(stub, client, fault):
+    site, base_url = stub(fault)
+    page = client.request(base_url + gamelog_path)
+    # A truncated body is never handed back as a page
+    assert page.content == site.content(gamelog_path)
+    assert outcomes(site) == [fault, 'ok']
+    assert (client.requests, client.retries, client.throttled, client.failures) == (2, 1, 0, 0)
+
+def test_stall_times_out_and_is_retried(stub, client):
+    client.timeout = 0.5
+    site, base_url = stub('stall', stall=2.0)
+    start = time.monotonic()
+    page = client.request(base_url + gamelog_path)
+    assert page.content == site.content(gamelog_path)
+    assert outcomes(site) == ['stall', 'ok']
+    assert client.retries == 1
+    assert time.monotonic() - start < 2.0
+
+def test_429_pauses_the_bucket_for_retry_after(stub, client):
+    site, base_url = stub('429', retry_after=1)
+    start = time.monotonic()
+    page = client.request(base_url + gamelog_path)
+    assert page.content == site.content(gamelog_path)
+    assert outcomes(site) == ['429', 'ok']
+    assert (client.requests, client.retries, client.throttled) == (2, 1, 1)
+    # The retry waited for Retry-After, and so does every other request until the pause ends
+    assert site.requests[1][0] - site.requests[0][0] >= 1.0
+    assert client.bucket.paused_until >= start + 1.0
+
+def test_retries_run_out(stub, client):
+    site, base_url = stub('503', '503', '503', '503')
+    with pytest.raises(FetchError) as e:
+        client.request(base_url + gamelog_path)
+    assert (e.value.status, e.value.attempts) == (503, 3)
+    assert outcomes(site) == ['503'] * 3
+    assert (client.requests, client.retries, client.failures) == (3, 2, 1)
+
+def test_connection_errors_run_out(stub, client):
+    site, base_url = stub('reset', 'reset', 'reset')
+    with pytest.raises(FetchError) as e:
+        client.request(base_url + gamelog_path)
+    assert e.value.status is None and e.value.attempts == 3
+    assert client.failures == 1
+
+def test_client_errors_are_not_retried(stub, client):
+    site, base_url = stub()
+    with pytest.raises(FetchError) as e:
+        client.request(base_url + '/teams/tgl.cgi?team=XXX&t=b&year=2020')
+    assert (e.value.status, e.value.attempts) == (404, 1)
+    assert (client.requests, client.retries, client.failures) == (1, 0, 1)
+
+def test_not_modified(stub, client):
+    site, base_url = stub()
+    page = client.request(base_url + gamelog_path)
+    again = client.request(base_url + gamelog_path, headers={'If-None-Match': page.headers['ETag']})
+    assert again.status == 304 and again.content == b''
+
+def test_retry_after_header():
+    assert retry_after(None) is None
+    assert retry_after('7') == 7.0
+    assert retry_after('-3') == 0.0
+    assert retry_after('soon') is None
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < retry_after(later) <= 30
+
+def test_bucket_spaces_requests(stub):
+    # 600 a minute with no burst: a token every 0.1s
+    client = FetchClient(requests_per_minute=600, burst=1, seed=0)
+    try:
+        site, base_url = stub()
+        for _ in range(4):
+            client.request(base_url + gamelog_path)
+        times = [t for t, _, _ in site.requests]
+        assert times[-1] - times[0] >= 0.29
+    finally:
+        client.close()
+
+def test_bucket_pause_empties_it():
+    bucket = TokenBucket(60, burst=5)
+    bucket.pause(2)
+    assert bucket.tokens == 0
+    assert bucket.paused_until - time.monotonic() > 1.9
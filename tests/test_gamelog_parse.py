@@ -0,0 +1,17 @@
+import os
+import warnings
+import pytest
+
+from benchmarks.bench_gamelog_parse import bench_page,fixtures,fixture_dir
+
+# The vectorized gamelog transforms against the legacy row-wise ones on the saved pages: same game ids, same rows
+
+@pytest.mark.parametrize('name,team,year,table_type', fixtures)
+def test_same_ids_and_rows_as_legacy(name, team, year, table_type):
+    with open(os.path.join(fixture_dir, name), 'rb') as f:
+        content = f.read()
+    with warnings.catch_warnings():
+        # pandas warns about the legacy chained fillna/replace calls
+        warnings.simplefilter('ignore')
+        _, _, rows = bench_page(content, team, year, table_type, 1)
+    assert rows == 40
@@ -0,0 +1,34 @@
+import sqlite3
+import pytest
+
+from db_scripts.check_query_plans import plan_cases,plan_failures,query_plan,schema_conn
+
+# Every graph_data_query and aggregate query must filter through its index, on an empty schema and on a loaded database
+# (the planner can pick differently once the tables have rows)
+
+cases = plan_cases()
+
+@pytest.fixture(scope='module')
+def conns(synthetic_db):
+    conns = {'schema': schema_conn(), 'synthetic': sqlite3.connect(synthetic_db)}
+    yield conns
+    for conn in conns.values():
+        conn.close()
+
+@pytest.mark.parametrize('db', ['schema', 'synthetic'])
+@pytest.mark.parametrize('label,query,params,index', cases, ids=[case[0] for case in cases])
+def test_plan_uses_index(conns, db, label, query, params, index):
+    assert plan_failures(conns[db], label, query, params, index) == []
+
+def test_dropped_index_is_reported(synthetic_db):
+    # The check itself: without the index the plan scans and the failure names it
+    conn = sqlite3.connect(':memory:')
+    conn.execute('ATTACH DATABASE ? AS source', (synthetic_db,))
+    conn.execute('CREATE TABLE PlayerBattingSeason AS SELECT * FROM source.PlayerBattingSeason')
+    for table in ['Teams', 'Batters']:
+        conn.execute(f'CREATE TABLE {table} AS SELECT * FROM source.{table}')
+    label, query, params, index = next(case for case in cases if case[3] == 'idx_PlayerBattingSeason_season_team')
+    assert any(step.startswith('SCAN') for step in query_plan(conn, query, params))
+    failures = plan_failures(conn, label, query, params, index)
+    assert len(failures) == 2 and index in failures[1]
+    conn.close()
@@ -0,0 +1,37 @@
+import pytest
+
+from db_scripts import db_connect
+from db_scripts import graph_data_query as query_engine
+
+# result_columns names the columns get_* returns, without running the selection (the Tables tabs project on them)
+
+getters = {
+    'players': query_engine.get_players,
+    'team_season': query_engine.get_team_season,
+    'gamelogs': query_engine.get_gamelogs,
+}
+
+@pytest.fixture
+def app_db(synthetic_db, monkeypatch):
+    # A read pool on the synthetic database, and nothing cached from another one
+    monkeypatch.setattr(db_connect, 'db_path', synthetic_db)
+    monkeypatch.setattr(db_connect, '_read_pool', None)
+    monkeypatch.setattr(query_engine, '_columns', {})
+    monkeypatch.setattr(query_engine, '_version', {'value': None, 'checked': 0.0})
+    query_engine.query_cache.clear()
+    yield synthetic_db
+    query_engine.query_cache.clear()
+
+@pytest.mark.parametrize('table_type', ['b', 'p'])
+@pytest.mark.parametrize('kind', list(getters))
+def test_result_columns_match_the_frame(app_db, kind, table_type):
+    expected = list(getters[kind]([20, 21], [2019, 2020], table_type).columns)
+    assert query_engine.result_columns(kind, table_type) == expected
+    # Empty selections have the same columns
+    assert list(getters[kind]([20], [1900], table_type).columns) == expected
+
+def test_result_columns_are_read_once(app_db):
+    query_engine.result_columns('players', 'b')
+    checkouts = db_connect.read_pool().checkouts
+    query_engine.result_columns('players', 'b')
+    assert db_connect.read_pool().checkouts == checkouts